@@ -3,11 +3,14 @@
 """
 import os
 import glob
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
-from .pdf_processor import PDFProcessor
+from .pdf_processor import PDFProcessor, ocr_page_task
+from .journal import file_signature, ChunkCheckpoint
 from .region_selector import RegionSelector
 from .ocr_engine import OCREngine
+from .instrumentation import Instrumentation
+from .pdf_optimizer import format_size
 
 class BatchProcessor:
     """
@@ -17,7 +20,13 @@ class BatchProcessor:
                  exclude_config=None, exclude_top=False, top_percentage=10,
                  exclude_bottom=False, bottom_percentage=5,
                  custom_regions=None, overwrite=False, max_workers=4,
-                 orientation=OCREngine.AUTO):
+                 orientation=OCREngine.AUTO, page_window=None, ocr_backend='auto',
+                 orientation_probe=True, existing_text=PDFProcessor.EXISTING_TEXT_ALL,
+                 cache=None, journal=None, preprocessor=None, dpi=300, adaptive_dpi=None,
+                 blank_threshold=OCREngine.BLANK_THRESHOLD, instrumentation=None, recursive=False,
+                 exporters=None, include_regions=None, layout_blocks=False, tile_workers=1,
+                 optimizer=None, chunk_size=None, native_images=True, refiner=None,
+                 resources=None):
         self.input_dir = input_dir
         self.output_dir = output_dir if output_dir else input_dir
         self.language = language
@@ -27,9 +36,47 @@ class BatchProcessor:
         self.exclude_bottom = exclude_bottom
         self.bottom_percentage = bottom_percentage
         self.custom_regions = custom_regions
+        self.include_regions = include_regions
+        self.layout_blocks = layout_blocks
         self.overwrite = overwrite
         self.max_workers = max_workers
         self.orientation = orientation
+        self.page_window = page_window
+        self.existing_text = existing_text
+        self.journal = journal
+        # 処理の段階ごとの計測（ワーカープロセスで記録したイベントもここから出力）
+        self.instrumentation = instrumentation or Instrumentation()
+        # 保存したPDFのテキストを書き出す出力処理（保存は親プロセスで行うためここで実行）
+        self.exporters = exporters
+        # 保存時にPDFのサイズを小さくする PDFOptimizer オブジェクト
+        self.optimizer = optimizer
+        # 大きなPDFを保存する際に、このページ数ごとに作業ファイルへ追記保存する（None の場合は一度に保存）
+        self.chunk_size = chunk_size
+        # ワーカー数・Tesseract のスレッド数・同時に処理するページのメモリを調整する
+        # ResourceBudget オブジェクト（None の場合は max_workers のプロセスで処理）
+        self.resources = resources
+        self.dpi = dpi
+        # サブディレクトリのPDFも処理し、出力先には同じディレクトリ構成で保存するか
+        self.recursive = recursive
+        # 直前の process_all で空白のためOCRを省略したページ数
+        self.blank_pages = 0
+        # 直前の process_all で保存したファイルの入力・出力の合計バイト数
+        self.input_bytes = 0
+        self.output_bytes = 0
+
+        # PDFProcessor に渡す処理オプション
+        self.processor_options = {
+            'language': language,
+            'ocr_backend': ocr_backend,
+            'orientation_probe': orientation_probe,
+            'cache': cache,
+            'preprocessor': preprocessor,
+            'adaptive_dpi': adaptive_dpi,
+            'blank_threshold': blank_threshold,
+            'tile_workers': tile_workers,
+            'native_images': native_images,
+            'refiner': refiner,
+        }
 
         # 出力ディレクトリが存在しない場合は作成（上書きでない場合）
         if not overwrite and output_dir and not os.path.exists(output_dir):
@@ -37,75 +84,302 @@ class BatchProcessor:
 
     def get_pdf_files(self):
         """入力ディレクトリからPDFファイルのリストを取得"""
-        return glob.glob(os.path.join(self.input_dir, "*.pdf"))
+        if not self.recursive:
+            return glob.glob(os.path.join(self.input_dir, "*.pdf"))
 
-    def process_single_file(self, pdf_path):
-        """単一のPDFファイルを処理"""
-        try:
-            if self.overwrite:
-                output_path = pdf_path
-            else:
-                filename = os.path.basename(pdf_path)
-                output_path = os.path.join(self.output_dir, filename)
-
-            # 除外領域の設定
-            region_selector = RegionSelector()
-
-            # 上部/下部の除外設定
-            if self.exclude_top:
-                region_selector.add_top_region(self.top_percentage)
-            if self.exclude_bottom:
-                region_selector.add_bottom_region(self.bottom_percentage)
-
-            # カスタム領域の追加
-            if self.custom_regions:
-                for region in self.custom_regions:
-                    region_selector.add_pixel_region(*region)
-
-            # 設定ファイルからの設定
-            if self.exclude_config:
-                regions_config = self.exclude_config.get_regions_for_file(pdf_path)
-                region_selector.add_regions_from_config(regions_config)
-
-            # PDFを処理
-            processor = PDFProcessor(pdf_path, output_path, self.language)
-            processor.process(exclude_regions=region_selector, orientation=self.orientation)
+        pdf_files = glob.glob(os.path.join(self.input_dir, "**", "*.pdf"), recursive=True)
 
-            return True, pdf_path
-        except Exception as e:
-            return False, f"{pdf_path}: {str(e)}"
+        # 入力ディレクトリの中に出力ディレクトリがある場合は、出力したファイルを除外
+        if not self.overwrite and os.path.abspath(self.output_dir) != os.path.abspath(self.input_dir):
+            output_prefix = os.path.join(os.path.abspath(self.output_dir), '')
+            pdf_files = [path for path in pdf_files if not os.path.abspath(path).startswith(output_prefix)]
+        return pdf_files
+
+    def get_output_path(self, pdf_path):
+        """入力PDFに対応する出力先のパスを取得（再帰処理では入力と同じディレクトリ構成）"""
+        if self.overwrite:
+            return pdf_path
+        if self.recursive:
+            return os.path.join(self.output_dir, os.path.relpath(pdf_path, self.input_dir))
+        filename = os.path.basename(pdf_path)
+        return os.path.join(self.output_dir, filename)
+
+    def _prepare_output_dir(self, output_path):
+        """出力先のディレクトリがなければ作成する"""
+        directory = os.path.dirname(os.path.abspath(output_path))
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def build_region_selector(self, pdf_path):
+        """入力PDFに適用する除外領域・対象領域の設定を作成"""
+        region_selector = RegionSelector()
+
+        # 上部/下部の除外設定
+        if self.exclude_top:
+            region_selector.add_top_region(self.top_percentage)
+        if self.exclude_bottom:
+            region_selector.add_bottom_region(self.bottom_percentage)
+
+        # カスタム領域の追加
+        if self.custom_regions:
+            for region in self.custom_regions:
+                region_selector.add_pixel_region(*region)
+
+        # 対象領域の追加
+        if self.include_regions:
+            for region in self.include_regions:
+                region_selector.add_include_region(*region)
+        if self.layout_blocks:
+            region_selector.enable_layout_blocks()
+
+        # 設定ファイルからの設定
+        if self.exclude_config:
+            regions_config = self.exclude_config.get_regions_for_file(pdf_path)
+            region_selector.add_regions_from_config(regions_config)
+
+        return region_selector
 
-    def process_all(self):
-        """すべてのPDFファイルを処理"""
-        pdf_files = self.get_pdf_files()
+    def iter_text(self, pdf_files=None, errors=None):
+        """
+        PDFファイルを1つずつ処理し、ページごとのテキストだけを抽出して返す
+
+        PDFは保存せず、ファイルの中はページ単位で max_workers のプロセスに振り分ける。
+        ファイル単位の順序で結果を返すため、下流の処理はファイルごとにまとめて受け取れる。
+
+        Args:
+            pdf_files: 処理するPDFファイルのリスト（None の場合は入力ディレクトリのすべてのPDF）
+            errors: 処理に失敗したファイルの (パス, エラーの内容) を追加するリスト
+
+        Yields:
+            tuple: (入力PDFのパス, ページ番号（0始まり）, テキスト, テキストの向き)
+        """
+        if pdf_files is None:
+            pdf_files = sorted(self.get_pdf_files())
+
+        for pdf_path in pdf_files:
+            try:
+                processor = PDFProcessor(pdf_path, instrumentation=self.instrumentation,
+                                         resources=self.resources, **self.processor_options)
+                for page_num, text, orientation in processor.iter_text(
+                        exclude_regions=self.build_region_selector(pdf_path), dpi=self.dpi,
+                        orientation=self.orientation, page_window=self.page_window or 1,
+                        workers=self.max_workers, existing_text=self.existing_text):
+                    yield pdf_path, page_num, text, orientation
+            except Exception as e:
+                if errors is not None:
+                    errors.append((pdf_path, str(e)))
+
+    def _iter_page_tasks(self, file_pages):
+        """
+        ページ単位のタスクをOCRするページ数の多いファイルから順に生成
+
+        大きなファイルを先に投入することで、終盤に大きなファイルだけが
+        残ってワーカーが遊ぶことを防ぐ。
+        """
+        for pdf_path in sorted(file_pages, key=lambda path: len(file_pages[path]), reverse=True):
+            region_selector = self.build_region_selector(pdf_path)
+            for page_num in file_pages[pdf_path]:
+                yield {
+                    'input_pdf': pdf_path,
+                    'options': self.processor_options,
+                    'page_num': page_num,
+                    'exclude_regions': region_selector,
+                    'dpi': self.dpi,
+                    'orientation': self.orientation,
+                    'instrument': self.instrumentation.enabled,
+                }
+
+    def process_all(self, pdf_files=None):
+        """
+        すべてのPDFファイルを処理
+
+        処理の単位はディレクトリ内の全ファイルのページで、ワーカープロセスに
+        ページ数の多いファイルから順に割り当て、完了した順に結果を受け取る。
+        ファイルの全ページが揃った時点でテキストレイヤーを追加して保存する。
+
+        ジャーナルが指定されている場合は、処理済みで変更のないファイルをスキップし、
+        記録済みのページのOCR結果を再利用する。
+
+        resources が指定されている場合は、ワーカー数とタイルのスレッド数の積が
+        CPU数を超えないようにし（Tesseract のスレッド数は main で設定する）、ページの大きさと解像度から見積もったメモリの合計が
+        上限に収まる分だけページを投入する（処理中のページがなければ必ず1ページは投入）。
+
+        Args:
+            pdf_files: 処理するPDFファイルのリスト（None の場合は入力ディレクトリのすべてのPDF）
+
+        Returns:
+            list: ファイルごとの結果 (成功したか, 入力PDFのパスまたはエラーの内容) のリスト
+        """
+        if pdf_files is None:
+            pdf_files = self.get_pdf_files()
         total_files = len(pdf_files)
 
         if total_files == 0:
             print(f"指定されたディレクトリ '{self.input_dir}' にPDFファイルが見つかりませんでした。")
-            return
+            return []
 
         print(f"{total_files}個のPDFファイルを処理します...")
         print(f"テキスト向き設定: {'自動検出' if self.orientation == OCREngine.AUTO else '横書き' if self.orientation == OCREngine.HORIZONTAL else '縦書き'}")
 
-        # 進行状況表示用のtqdmを使用
-        with tqdm(total=total_files, desc="処理中") as pbar:
-            results = []
+        results = []
+
+        # 各ファイルのOCRするページを選択
+        file_pages = {}
+        page_results = {}
+        page_memory = {}
+        signatures = {}
+        skipped_pages = 0
+        self.blank_pages = 0
+        self.input_bytes = self.output_bytes = 0
+        up_to_date = 0
+        for pdf_path in pdf_files:
+            # 処理済みで変更のないファイルはスキップ
+            if self.journal and self.journal.is_up_to_date(pdf_path, self.get_output_path(pdf_path)):
+                results.append((True, pdf_path))
+                up_to_date += 1
+                continue
 
-            # ThreadPoolExecutorを使用して並列処理
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = {executor.submit(self.process_single_file, pdf): pdf for pdf in pdf_files}
+            try:
+                signatures[pdf_path] = file_signature(pdf_path)
+                processor = PDFProcessor(pdf_path, **self.processor_options)
+                page_nums, page_count = processor.select_pages(self.existing_text)
+            except Exception as e:
+                results.append((False, f"{pdf_path}: {str(e)}"))
+                continue
 
-                for future in futures:
-                    success, result = future.result()
-                    if success:
-                        results.append((True, result))
-                    else:
-                        results.append((False, result))
-                    pbar.update(1)
+            skipped_pages += page_count - len(page_nums)
+            if not page_nums:
+                # OCRするページのないファイルはそのまま保存
+                results.append(self._save_file(pdf_path, [], signatures[pdf_path]))
+                continue
+
+            # ジャーナルに記録済みのページはOCRを省略
+            file_results = {}
+            if self.journal:
+                recorded = self.journal.get_page_results(pdf_path, signatures[pdf_path])
+                file_results = {page_num: recorded[page_num] for page_num in page_nums if page_num in recorded}
+
+            if len(file_results) == len(page_nums):
+                results.append(self._save_file(
+                    pdf_path, [file_results[i] for i in sorted(file_results)], signatures[pdf_path]
+                ))
+                continue
+
+            if self.resources:
+                try:
+                    page_memory[pdf_path] = self.resources.page_memories(
+                        pdf_path, page_nums, self.dpi, self.processor_options['adaptive_dpi']
+                    )
+                except Exception as e:
+                    results.append((False, f"{pdf_path}: {str(e)}"))
+                    continue
+
+            file_pages[pdf_path] = page_nums
+            page_results[pdf_path] = file_results
+
+        if up_to_date:
+            print(f"処理済みのためスキップするファイル: {up_to_date}")
+
+        failed = {}
+
+        # ジャーナルに記録済みのページを除いてタスクを作成
+        tasks = self._iter_page_tasks({
+            pdf_path: [page_num for page_num in page_nums if page_num not in page_results[pdf_path]]
+            for pdf_path, page_nums in file_pages.items()
+        })
+        workers = self.max_workers
+        max_in_flight = workers * 2
+        if self.resources:
+            # 最も小さいページを同時に処理できる数までワーカーを起動し、実際の同時実行数は
+            # ページごとのメモリの見積もりで制限する
+            # （メモリの上限を指定した場合は、見積もりどおりにするため先読みの投入はしない）
+            smallest = min((memory for memories in page_memory.values() for memory in memories.values()),
+                           default=None)
+            workers, _ = self.resources.plan(self.max_workers, self.processor_options['tile_workers'], smallest)
+            if self.resources.memory_mb:
+                max_in_flight = workers
+            if workers < self.max_workers:
+                print(f"CPU数・メモリの上限に合わせてワーカー数を {self.max_workers} から {workers} に減らします")
+
+        # 進行状況表示用のtqdmを使用（ページ単位）
+        total_pages = sum(len(page_nums) - len(page_results[pdf_path]) for pdf_path, page_nums in file_pages.items())
+        with tqdm(total=total_pages, desc="処理中", unit="ページ") as pbar:
+            # ProcessPoolExecutorを使用してページ単位で並列処理
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = {}
+                in_flight_memory = {}
+                # メモリの上限のため投入を保留しているタスク
+                held = None
+
+                while True:
+                    # 実行中のタスクが上限に達するまで投入
+                    while len(in_flight) < max_in_flight:
+                        task, held = held or next(tasks, None), None
+                        if task is None:
+                            break
+                        if task['input_pdf'] in failed:
+                            pbar.update(1)
+                            continue
+
+                        memory = page_memory[task['input_pdf']][task['page_num']] if self.resources else 0
+                        if self.resources and not self.resources.admit(
+                                memory, sum(in_flight_memory.values()), workers):
+                            held = task
+                            break
+                        future = executor.submit(ocr_page_task, task)
+                        in_flight[future] = task
+                        in_flight_memory[future] = memory
+
+                    if not in_flight:
+                        break
+
+                    # 完了したタスクから順に結果を受け取る
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = in_flight.pop(future)
+                        in_flight_memory.pop(future)
+                        pdf_path = task['input_pdf']
+                        pbar.update(1)
+
+                        if pdf_path in failed:
+                            continue
+
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            failed[pdf_path] = f"{pdf_path}: {str(e)}"
+                            del page_results[pdf_path]
+                            results.append((False, failed[pdf_path]))
+                            continue
+
+                        # ワーカープロセスで記録したイベントを出力
+                        self.instrumentation.replay(result.pop('events', ()))
+
+                        file_results = page_results[pdf_path]
+                        file_results[result['page_num']] = result
+
+                        # ページ数の多いファイルはページごとの進捗を記録
+                        if self.journal and len(file_pages[pdf_path]) >= self.journal.PAGE_CHECKPOINT_MIN_PAGES:
+                            self.journal.record_page(pdf_path, signatures[pdf_path], result)
+
+                        # 全ページが揃ったファイルを保存
+                        if len(file_results) == len(file_pages[pdf_path]):
+                            del page_results[pdf_path]
+                            results.append(self._save_file(
+                                pdf_path, [file_results[i] for i in sorted(file_results)],
+                                signatures[pdf_path]
+                            ))
 
         # 結果の表示
         success_count = sum(1 for r in results if r[0])
         print(f"\n処理完了: {success_count}/{total_files} 成功")
+        if skipped_pages:
+            print(f"既存のテキストがあるためスキップしたページ: {skipped_pages}")
+        if self.blank_pages:
+            print(f"空白のためOCRを省略したページ: {self.blank_pages}")
+        if self.optimizer and self.input_bytes:
+            print(f"ファイルサイズの合計: {format_size(self.input_bytes)} -> {format_size(self.output_bytes)}"
+                  f"（{(self.output_bytes - self.input_bytes) / self.input_bytes:+.1%}）")
 
         # エラーがあれば表示
         errors = [r[1] for r in results if not r[0]]
@@ -113,3 +387,34 @@ class BatchProcessor:
             print("\nエラーが発生したファイル:")
             for error in errors:
                 print(f"- {error}")
+
+        return results
+
+    def _save_file(self, pdf_path, file_results, input_signature):
+        """ファイルのOCR結果からテキストレイヤーを追加して保存し、ジャーナルに記録"""
+        try:
+            output_path = self.get_output_path(pdf_path)
+            self._prepare_output_dir(output_path)
+            processor = PDFProcessor(pdf_path, output_path, instrumentation=self.instrumentation,
+                                     exporters=self.exporters, optimizer=self.optimizer,
+                                     **self.processor_options)
+            # OCR結果はジャーナルで再開できるため、作業ファイルは常に新しく作成
+            checkpoint = None
+            if self.chunk_size:
+                checkpoint = ChunkCheckpoint(pdf_path, output_path, self.chunk_size)
+                checkpoint.start()
+            try:
+                self.blank_pages += processor.apply_results(file_results, checkpoint)
+            except BaseException:
+                if checkpoint:
+                    checkpoint.discard()
+                raise
+            if processor.sizes:
+                self.input_bytes += processor.sizes[0]
+                self.output_bytes += processor.sizes[1]
+
+            if self.journal:
+                self.journal.record_file(pdf_path, input_signature, output_path)
+            return True, pdf_path
+        except Exception as e:
+            return False, f"{pdf_path}: {str(e)}"
@@ -0,0 +1,409 @@
+"""
+合成したスキャンPDFで処理性能を測定するベンチマーク
+
+既知の日本語テキストを描画して画像化した画像のみのPDFを生成し、PDFProcessor.process と
+BatchProcessor.process_all の処理速度・段階ごとの処理時間・最大メモリ使用量・出力サイズ・
+テキストの再現率を測定してJSONで出力する。保存したベースラインと比較して性能の低下を検出できる。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+import fitz  # PyMuPDF
+import numpy as np
+from . import __version__
+from .pdf_processor import PDFProcessor
+from .batch_handler import BatchProcessor
+from .region_selector import RegionSelector
+from .ocr_engine import OCREngine
+from .instrumentation import Instrumentation, CallbackSink
+
+# 本文に使う文章（ページごとに位置をずらして繰り返す）
+SAMPLE_TEXT = (
+    "画像として保存された文書から文字を読み取り、検索できる形に変換する処理の性能を測定します。"
+    "この文章は測定のために生成されたもので、横書きと縦書きの両方で同じ内容を使用します。"
+    "解像度やページ数、除外領域の有無によって処理時間とメモリ使用量がどのように変わるかを記録し、"
+    "以前の測定結果と比較して速度の低下を検出します。"
+)
+
+# 測定する場面の一覧（scan_dpi は入力PDFを生成する際の画像化の解像度、dpi は処理時の解像度）
+SCENARIOS = [
+    {'name': 'horizontal-300dpi', 'kind': 'file', 'orientation': 'horizontal', 'pages': 5, 'scan_dpi': 300,
+     'dpi': 300, 'exclude': False},
+    {'name': 'vertical-300dpi', 'kind': 'file', 'orientation': 'vertical', 'pages': 5, 'scan_dpi': 300,
+     'dpi': 300, 'exclude': False},
+    {'name': 'horizontal-200dpi-exclude', 'kind': 'file', 'orientation': 'horizontal', 'pages': 20,
+     'scan_dpi': 200, 'dpi': 200, 'exclude': True},
+    {'name': 'auto-300dpi-mixed', 'kind': 'file', 'orientation': 'auto', 'pages': 6, 'scan_dpi': 300,
+     'dpi': 300, 'exclude': True},
+    {'name': 'batch-4files', 'kind': 'batch', 'orientation': 'auto', 'pages': 3, 'files': 4, 'scan_dpi': 300,
+     'dpi': 300, 'exclude': True},
+]
+
+# 比較時に値が大きいほど良い指標と小さいほど良い指標
+HIGHER_IS_BETTER = ('pages_per_sec', 'text_recall')
+LOWER_IS_BETTER = ('peak_rss_mb', 'peak_rss_children_mb', 'output_bytes')
+# 再現率は割合ではなく差で判定する
+RECALL_TOLERANCE = 0.02
+
+def make_synthetic_pdf(path, pages, orientation='horizontal', scan_dpi=200, font_size=12):
+    """
+    既知のテキストを描画して画像化した、画像のみのPDFを生成する
+
+    各ページには本文のほかにヘッダーとページ番号を描画する（除外領域の測定用）。
+    orientation に 'auto' を指定した場合は横書きと縦書きのページを交互に生成する。
+
+    Args:
+        path: 出力するPDFのパス
+        pages: ページ数
+        orientation: 本文の向き ('horizontal', 'vertical', 'auto')
+        scan_dpi: 画像化する解像度
+        font_size: 本文の文字の大きさ（ポイント）
+
+    Returns:
+        list: ページごとの本文のテキスト
+    """
+    texts = []
+    output = fitz.open()
+
+    for page_index in range(pages):
+        source = fitz.open()
+        page = source.new_page(width=595, height=842)  # A4
+        page_orientation = orientation
+        if orientation == OCREngine.AUTO:
+            page_orientation = OCREngine.VERTICAL if page_index % 2 else OCREngine.HORIZONTAL
+
+        # ページごとに文章の開始位置をずらす
+        offset = (page_index * 17) % len(SAMPLE_TEXT)
+        body = SAMPLE_TEXT[offset:] + SAMPLE_TEXT[:offset]
+
+        page.insert_text((72, 50), f"性能測定用文書 第{page_index + 1}版", fontname='japan', fontsize=10)
+        page.insert_text((290, 820), str(page_index + 1), fontname='japan', fontsize=10)
+
+        if page_orientation == OCREngine.VERTICAL:
+            texts.append(_draw_vertical(page, body, font_size))
+        else:
+            texts.append(_draw_horizontal(page, body, font_size))
+
+        # グレースケールで画像化して画像のみのページにする
+        pixmap = page.get_pixmap(dpi=scan_dpi, colorspace=fitz.csGRAY)
+        new_page = output.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, pixmap=pixmap)
+        source.close()
+
+    output.save(path, garbage=3, deflate=True)
+    output.close()
+    return texts
+
+def _draw_horizontal(page, body, font_size):
+    """本文を横書きで描画し、描画したテキストを返す"""
+    per_line = int((page.rect.width - 144) // font_size)
+    line_height = font_size * 1.7
+    lines = []
+    y = 120
+    while y < page.rect.height - 90 and body:
+        line, body = body[:per_line], body[per_line:] or SAMPLE_TEXT
+        page.insert_text((72, y), line, fontname='japan', fontsize=font_size)
+        lines.append(line)
+        y += line_height
+    return ''.join(lines)
+
+def _draw_vertical(page, body, font_size):
+    """本文を縦書き（右から左へ1文字ずつ）で描画し、描画したテキストを返す"""
+    per_column = int((page.rect.height - 200) // font_size)
+    column_width = font_size * 1.7
+    columns = []
+    x = page.rect.width - 72 - font_size
+    while x > 72:
+        column, body = body[:per_column], body[per_column:] or SAMPLE_TEXT
+        for index, char in enumerate(column):
+            page.insert_text((x, 110 + (index + 1) * font_size), char, fontname='japan', fontsize=font_size)
+        columns.append(column)
+        x -= column_width
+    return ''.join(columns)
+
+def text_recall(expected_texts, actual_texts):
+    """
+    期待するテキストの文字のうち、出力のテキストレイヤーに含まれる割合を計算する
+
+    空白を除いた文字の出現回数の重なりで計算するため、文字の順序は考慮しない。
+    """
+    expected = Counter(''.join(''.join(text.split()) for text in expected_texts))
+    actual = Counter(''.join(''.join(text.split()) for text in actual_texts))
+    total = sum(expected.values())
+    if not total:
+        return 1.0
+    return sum((expected & actual).values()) / total
+
+def summarize_stages(events):
+    """
+    計測したイベントを段階ごとに集計する
+
+    Returns:
+        dict: 段階の名前 → {count, total, mean, p95, bytes}
+    """
+    durations = defaultdict(list)
+    data_bytes = defaultdict(int)
+    for event in events:
+        durations[event['stage']].append(event['duration'])
+        data_bytes[event['stage']] += event.get('bytes') or 0
+
+    return {
+        stage: {
+            'count': len(values),
+            'total': sum(values),
+            'mean': float(np.mean(values)),
+            'p95': float(np.percentile(values, 95)),
+            'bytes': data_bytes[stage],
+        }
+        for stage, values in durations.items()
+    }
+
+def _peak_rss_mb(children=False):
+    """最大常駐メモリ（MB）を取得する（children が True の場合は終了した子プロセスの最大値）"""
+    # resource モジュールは Unix でのみ使用可能
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux はキロバイト単位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def _build_region_selector(scenario):
+    """場面の設定から除外領域を作成する"""
+    if not scenario['exclude']:
+        return None
+    region_selector = RegionSelector()
+    region_selector.add_top_region(10)
+    region_selector.add_bottom_region(5)
+    return region_selector
+
+def run_scenario(scenario, work_dir, language='jpn', workers=1):
+    """
+    1つの場面を実行して測定結果を返す（測定用の子プロセスで実行される）
+
+    Args:
+        scenario: 場面の設定
+        work_dir: 入出力のPDFを置くディレクトリ
+        language: OCRの言語
+        workers: 並列処理のワーカー数
+
+    Returns:
+        dict: 測定結果
+    """
+    input_dir = os.path.join(work_dir, 'input')
+    output_dir = os.path.join(work_dir, 'output')
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 入力PDFを生成（測定時間には含めない）
+    expected = {}
+    for index in range(scenario.get('files', 1)):
+        path = os.path.join(input_dir, f"{scenario['name']}-{index + 1}.pdf")
+        expected[path] = make_synthetic_pdf(path, scenario['pages'], scenario['orientation'],
+                                            scenario['scan_dpi'])
+
+    events = []
+    instrumentation = Instrumentation([CallbackSink(events.append)])
+    start = time.perf_counter()
+    if scenario['kind'] == 'batch':
+        BatchProcessor(
+            input_dir, output_dir, language,
+            exclude_top=scenario['exclude'], exclude_bottom=scenario['exclude'],
+            max_workers=workers, orientation=scenario['orientation'], dpi=scenario['dpi'],
+            instrumentation=instrumentation
+        ).process_all()
+    else:
+        input_pdf = next(iter(expected))
+        processor = PDFProcessor(input_pdf, os.path.join(output_dir, os.path.basename(input_pdf)),
+                                 language, instrumentation=instrumentation)
+        processor.process(exclude_regions=_build_region_selector(scenario), dpi=scenario['dpi'],
+                          orientation=scenario['orientation'])
+    seconds = time.perf_counter() - start
+
+    # 出力を確認
+    output_bytes = 0
+    expected_texts, actual_texts = [], []
+    for input_pdf, texts in expected.items():
+        output_pdf = os.path.join(output_dir, os.path.basename(input_pdf))
+        output_bytes += os.path.getsize(output_pdf)
+        with fitz.open(output_pdf) as doc:
+            actual_texts.extend(page.get_text() for page in doc)
+        expected_texts.extend(texts)
+
+    pages = scenario['pages'] * len(expected)
+    return {
+        'name': scenario['name'],
+        'kind': scenario['kind'],
+        'orientation': scenario['orientation'],
+        'pages': pages,
+        'dpi': scenario['dpi'],
+        'exclude': scenario['exclude'],
+        'workers': workers,
+        'seconds': seconds,
+        'pages_per_sec': pages / seconds if seconds else 0.0,
+        'stages': summarize_stages(events),
+        'peak_rss_mb': _peak_rss_mb(),
+        'peak_rss_children_mb': _peak_rss_mb(children=True),
+        'output_bytes': output_bytes,
+        'text_recall': text_recall(expected_texts, actual_texts),
+    }
+
+def _run_in_subprocess(scenario, language, workers):
+    """最大メモリ使用量を場面ごとに測定するため、子プロセスで場面を実行する"""
+    with tempfile.TemporaryDirectory(prefix='pdf_ocr_benchmark_') as work_dir:
+        result_path = os.path.join(work_dir, 'result.json')
+        subprocess.run(
+            [sys.executable, '-m', 'pdf_ocr_converter.benchmark', '--run-scenario', json.dumps(scenario),
+             '--work-dir', work_dir, '--result', result_path, '-l', language, '-w', str(workers)],
+            # 処理中の表示で測定結果の出力が乱れないようにする
+            stdout=subprocess.DEVNULL,
+            check=True
+        )
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+def _median_result(results):
+    """繰り返し測定した結果のうち、処理時間が中央値のものを返す"""
+    results = sorted(results, key=lambda result: result['seconds'])
+    return results[len(results) // 2]
+
+def environment_info():
+    """測定環境の情報を取得する"""
+    try:
+        import pytesseract
+        tesseract = str(pytesseract.get_tesseract_version())
+    except Exception:
+        tesseract = None
+    return {
+        'pdf_ocr_converter': __version__,
+        'python': platform.python_version(),
+        'pymupdf': fitz.VersionBind,
+        'tesseract': tesseract,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def run_benchmarks(scenarios, language='jpn', workers=1, repeat=1):
+    """
+    場面ごとに測定を行う
+
+    Args:
+        scenarios: 場面の設定のリスト
+        language: OCRの言語
+        workers: バッチ処理のワーカー数
+        repeat: 繰り返し回数（処理時間が中央値の結果を採用）
+
+    Returns:
+        dict: 測定環境と場面ごとの測定結果
+    """
+    results = []
+    for scenario in scenarios:
+        print(f"測定中: {scenario['name']}")
+        runs = [_run_in_subprocess(scenario, language, workers if scenario['kind'] == 'batch' else 1)
+                for _ in range(repeat)]
+        result = _median_result(runs)
+        print(f"  {result['pages_per_sec']:.2f} ページ/秒, 最大メモリ {result['peak_rss_mb']:.0f} MB, "
+              f"出力 {result['output_bytes'] / 1024:.0f} KB, 再現率 {result['text_recall']:.3f}")
+        results.append(result)
+
+    return {'environment': environment_info(), 'scenarios': results}
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    ベースラインと比較して性能の低下を検出する
+
+    Args:
+        baseline: ベースラインの測定結果
+        current: 今回の測定結果
+        tolerance: 許容する悪化の割合（再現率は RECALL_TOLERANCE の差で判定）
+
+    Returns:
+        list: 性能が低下した指標の説明
+    """
+    regressions = []
+    baseline_scenarios = {result['name']: result for result in baseline['scenarios']}
+
+    for result in current['scenarios']:
+        base = baseline_scenarios.get(result['name'])
+        if base is None:
+            continue
+
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            old, new = base.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+
+            if metric == 'text_recall':
+                regressed = new < old - RECALL_TOLERANCE
+            elif metric in HIGHER_IS_BETTER:
+                regressed = new < old * (1 - tolerance)
+            else:
+                regressed = new > old * (1 + tolerance)
+
+            status = '低下' if regressed else 'OK'
+            print(f"{result['name']:<28} {metric:<14} {old:>12.3f} -> {new:>12.3f}  {status}")
+            if regressed:
+                regressions.append(f"{result['name']}: {metric} {old:.3f} -> {new:.3f}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='合成したスキャンPDFで処理性能を測定')
+    parser.add_argument('-o', '--output', help='測定結果を保存するJSONファイル')
+    parser.add_argument('--compare', help='比較するベースラインの測定結果（JSONファイル）')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='性能の低下とみなす悪化の割合（デフォルト: 0.1）')
+    parser.add_argument('--scenarios', help='測定する場面の名前（カンマ区切り、デフォルト: すべて）')
+    parser.add_argument('--repeat', type=int, default=1, help='場面ごとの繰り返し回数（デフォルト: 1）')
+    parser.add_argument('-l', '--language', default='jpn', help='OCRの言語（デフォルト: jpn）')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='バッチ処理のワーカー数（デフォルト: 4）')
+    parser.add_argument('--list', action='store_true', help='場面の一覧を表示')
+    # 子プロセスで1つの場面を実行するための内部オプション
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(json.loads(args.run_scenario), args.work_dir, args.language, args.workers)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario['name']}: {json.dumps(scenario, ensure_ascii=False)}")
+        return
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        names = args.scenarios.split(',')
+        scenarios = [scenario for scenario in SCENARIOS if scenario['name'] in names]
+        unknown = set(names) - {scenario['name'] for scenario in scenarios}
+        if unknown:
+            parser.error(f"不明な場面です: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(scenarios, args.language, args.workers, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"測定結果を {args.output} に保存しました。")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print(f"\n性能の低下を検出しました: {len(regressions)} 件")
+            sys.exit(1)
+        print("\n性能の低下はありません。")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,34 @@
 除外領域設定ファイルのテンプレートを作成するヘルパースクリプト
 """
 import json
+import math
 import os
 import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import fitz  # PyMuPDF
+from PIL import Image
+if __package__:
+    from .layout import find_text_blocks
+else:
+    # python pdf_ocr_converter/config_helper.py のようにスクリプトとして直接実行した場合
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pdf_ocr_converter.layout import find_text_blocks
+
+# 繰り返し現れる領域の解析でページを画像化する解像度
+ANALYSIS_DPI = 100
+# 1ファイルから解析に使うページ数の上限（全体から均等に選択）
+SAMPLE_PAGES = 12
+# 解析したページのうちこの割合以上の同じ位置に現れるブロックを、繰り返し現れる領域とみなす
+MIN_REPEAT = 0.6
+# 繰り返し現れる領域とみなすブロックの大きさの上限（ページの高さまたは幅に対する割合）
+# これより大きい本文のブロックは対象外
+MAX_BAND_RATIO = 0.15
+# 同じ位置のブロックとみなす重なりの割合（小さい方のブロックの面積に対する割合）
+MIN_OVERLAP = 0.5
+# 除外領域の周囲に付ける余白（インチ）
+MARGIN_INCHES = 0.05
 
 def create_config_template(pdf_files, output_file):
     """
@@ -54,13 +79,216 @@ def create_config_template(pdf_files, output_file):
     print(f"設定テンプレートを {output_file} に保存しました。")
     print("必要に応じて除外領域の座標を編集してください。")
 
+def sample_page_nums(page_count, sample_pages=SAMPLE_PAGES):
+    """
+    解析に使うページ番号を全体から均等に選択する
+
+    Returns:
+        list: ページ番号（0始まり）のリスト
+    """
+    if page_count <= sample_pages:
+        return list(range(page_count))
+    return sorted({int(round(value)) for value in np.linspace(0, page_count - 1, sample_pages)})
+
+def _analyze_page(task):
+    """
+    ワーカープロセスで1ページを低解像度で画像化し、テキストのブロックを検出する
+
+    Args:
+        task: (PDFファイルのパス, ページ番号, 解像度)
+
+    Returns:
+        dict: ページの解析結果（pdf_file, page_num, size: 画像のサイズ, blocks: ブロックの矩形のリスト）
+    """
+    pdf_file, page_num, dpi = task
+    with fitz.open(pdf_file) as doc:
+        pixmap = doc[page_num].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+
+    # ブロック数の上限で打ち切らず、すべてのブロックを検出
+    blocks = find_text_blocks(image, dpi, max_blocks=math.inf)
+    return {'pdf_file': pdf_file, 'page_num': page_num, 'size': image.size, 'blocks': blocks}
+
+def _overlap(rects, rect):
+    """矩形の配列のそれぞれと rect との重なりの面積を、小さい方の面積に対する割合で返す"""
+    width = np.clip(np.minimum(rects[:, 2], rect[2]) - np.maximum(rects[:, 0], rect[0]), 0, None)
+    height = np.clip(np.minimum(rects[:, 3], rect[3]) - np.maximum(rects[:, 1], rect[1]), 0, None)
+    areas = np.minimum((rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1]),
+                       (rect[2] - rect[0]) * (rect[3] - rect[1]))
+    return width * height / np.maximum(areas, 1)
+
+def find_repeated_regions(pages, size, min_repeat=MIN_REPEAT):
+    """
+    複数のページの同じ位置に繰り返し現れるブロック（レターヘッド・印影・ページ番号など）を探す
+
+    ページの高さまたは幅に対して小さいブロックを、位置の重なりでページ間の同じブロックに
+    まとめ、min_repeat 以上の割合のページに現れるものを繰り返し現れる領域とする。
+    ページ番号のように内容が変わるものも、位置が同じであれば1つの領域にまとめる。
+    ほかのページで本文など別のブロックと重なる領域は、OCRの対象を削りすぎないよう除く。
+
+    Args:
+        pages: ページごとのブロックの矩形のリスト（同じサイズのページ）
+        size: ページ画像のサイズ (幅, 高さ)
+        min_repeat: 繰り返し現れるとみなすページの割合
+
+    Returns:
+        list: 領域の矩形のリスト [(x1, y1, x2, y2), ...]（ページ画像の座標、ページごとの矩形の和）
+    """
+    if len(pages) < 3:
+        return []
+
+    width, height = size
+    clusters = []
+    for page_index, blocks in enumerate(pages):
+        for block in blocks:
+            x1, y1, x2, y2 = block
+            if y2 - y1 > height * MAX_BAND_RATIO and x2 - x1 > width * MAX_BAND_RATIO:
+                continue
+
+            # 位置の重なる領域にまとめる
+            for cluster in clusters:
+                if _overlap(np.array([cluster['rect']]), block)[0] >= MIN_OVERLAP:
+                    cluster['rect'] = (min(cluster['rect'][0], x1), min(cluster['rect'][1], y1),
+                                       max(cluster['rect'][2], x2), max(cluster['rect'][3], y2))
+                    cluster['members'].add((page_index, block))
+                    break
+            else:
+                clusters.append({'rect': tuple(block), 'members': {(page_index, block)}})
+
+    min_pages = max(2, math.ceil(len(pages) * min_repeat))
+    regions = []
+    for cluster in clusters:
+        if len({page_index for page_index, _ in cluster['members']}) < min_pages:
+            continue
+
+        # 領域に含まれないブロックと大きく重なる場合は除外領域にしない
+        conflict = False
+        for page_index, blocks in enumerate(pages):
+            others = [block for block in blocks if (page_index, block) not in cluster['members']]
+            if others and (_overlap(np.array(others, dtype=float), cluster['rect']) >= MIN_OVERLAP).any():
+                conflict = True
+                break
+        if not conflict:
+            regions.append(cluster['rect'])
+
+    return regions
+
+def analyze_pdfs(pdf_files, dpi=300, workers=None, sample_pages=SAMPLE_PAGES, min_repeat=MIN_REPEAT):
+    """
+    PDFファイルごとに繰り返し現れる領域を解析する
+
+    各ファイルから均等に選んだページを ANALYSIS_DPI の低解像度で画像化し、
+    ページ単位でワーカープロセスに振り分けてブロックを検出する。
+    ページのサイズが異なる場合は、最も多いサイズのページだけで解析する。
+
+    Args:
+        pdf_files: PDFファイルのリスト
+        dpi: 除外領域のピクセル座標の基準とする解像度（main.py の --dpi と同じ値を指定）
+        workers: ワーカープロセス数（None の場合はCPU数）
+        sample_pages: 1ファイルから解析に使うページ数の上限
+        min_repeat: 繰り返し現れるとみなすページの割合
+
+    Returns:
+        dict: ファイルのパス → 解析結果（pages: 解析したページ数, width, height: 最初のページのサイズ（ポイント）,
+              regions: 除外領域の矩形のリスト（dpi の解像度のピクセル座標））
+              開けなかったファイルは error にエラーの内容を格納
+    """
+    results = {}
+    tasks = []
+    for pdf_file in pdf_files:
+        try:
+            with fitz.open(pdf_file) as doc:
+                page_nums = sample_page_nums(doc.page_count, sample_pages)
+                rect = doc[0].rect if doc.page_count else fitz.Rect()
+        except Exception as e:
+            results[pdf_file] = {'error': str(e)}
+            continue
+        results[pdf_file] = {'pages': 0, 'width': rect.width, 'height': rect.height, 'regions': []}
+        tasks += [(pdf_file, page_num, ANALYSIS_DPI) for page_num in page_nums]
+
+    # ファイルごと・ページのサイズごとにブロックをまとめる
+    file_pages = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for page in executor.map(_analyze_page, tasks, chunksize=4):
+            if page['blocks'] is not None:
+                file_pages.setdefault(page['pdf_file'], {}).setdefault(page['size'], []).append(page['blocks'])
+
+    scale = dpi / ANALYSIS_DPI
+    margin = MARGIN_INCHES * dpi
+    for pdf_file, sizes in file_pages.items():
+        size, pages = max(sizes.items(), key=lambda item: len(item[1]))
+        regions = find_repeated_regions(pages, size, min_repeat)
+        results[pdf_file]['pages'] = len(pages)
+        results[pdf_file]['regions'] = [
+            [max(int(x1 * scale - margin), 0), max(int(y1 * scale - margin), 0),
+             min(int(math.ceil(x2 * scale + margin)), int(size[0] * scale)),
+             min(int(math.ceil(y2 * scale + margin)), int(size[1] * scale))]
+            for x1, y1, x2, y2 in sorted(regions, key=lambda rect: (rect[1], rect[0]))
+        ]
+
+    return results
+
+def create_analyzed_config(pdf_files, output_file, dpi=300, workers=None, sample_pages=SAMPLE_PAGES,
+                           min_repeat=MIN_REPEAT):
+    """
+    PDFファイルを解析し、繰り返し現れる領域を除外領域とした設定ファイルを作成
+
+    Args:
+        pdf_files: PDFファイルのリスト
+        output_file: 出力する設定ファイルのパス
+        dpi: 除外領域のピクセル座標の基準とする解像度
+        workers: ワーカープロセス数（None の場合はCPU数）
+        sample_pages: 1ファイルから解析に使うページ数の上限
+        min_repeat: 繰り返し現れるとみなすページの割合
+    """
+    config = {
+        "global": {"regions": []},
+        "specific_files": {}
+    }
+
+    analysis = analyze_pdfs(pdf_files, dpi, workers, sample_pages, min_repeat)
+    for pdf_file in pdf_files:
+        basename = os.path.basename(pdf_file)
+        result = analysis[pdf_file]
+        if 'error' in result:
+            print(f"警告: {pdf_file} を開けませんでした: {result['error']}")
+            config["specific_files"][basename] = {"regions": []}
+            continue
+
+        config["specific_files"][basename] = {
+            "info": (f"Page size: {result['width']}x{result['height']} points, "
+                     f"{result['pages']} pages analyzed, pixel coordinates at {dpi} dpi"),
+            "regions": [{"type": "pixel", "coordinates": region} for region in result['regions']]
+        }
+        print(f"{basename}: {result['pages']} ページを解析し、繰り返し現れる領域を {len(result['regions'])} 個検出しました")
+
+    # 設定ファイルを保存
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+
+    print(f"設定ファイルを {output_file} に保存しました。")
+    print(f"処理時は --dpi {dpi} を指定してください（除外領域は {dpi}dpi のピクセル座標です）。")
+
 def main():
     parser = argparse.ArgumentParser(description='PDF除外領域設定ファイルのテンプレートを作成')
     parser.add_argument('pdf_files', nargs='+', help='設定を作成するPDFファイル')
     parser.add_argument('-o', '--output', default='exclude_regions.json', help='出力する設定ファイル名')
+    parser.add_argument('--analyze', action='store_true',
+                        help='ページを解析し、レターヘッド・印影・ページ番号など繰り返し現れる領域を除外領域として書き出す')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='--analyze で書き出すピクセル座標の基準の解像度（処理時の --dpi と同じ値、デフォルト: 300）')
+    parser.add_argument('--sample-pages', type=int, default=SAMPLE_PAGES,
+                        help=f'--analyze で1ファイルから解析するページ数の上限（デフォルト: {SAMPLE_PAGES}）')
+    parser.add_argument('--min-repeat', type=float, default=MIN_REPEAT,
+                        help=f'--analyze で繰り返し現れるとみなすページの割合（デフォルト: {MIN_REPEAT}）')
+    parser.add_argument('-w', '--workers', type=int, help='--analyze のワーカープロセス数（デフォルト: CPU数）')
 
     args = parser.parse_args()
-    create_config_template(args.pdf_files, args.output)
+    if args.analyze:
+        create_analyzed_config(args.pdf_files, args.output, args.dpi, args.workers,
+                               args.sample_pages, args.min_repeat)
+    else:
+        create_config_template(args.pdf_files, args.output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,117 @@
+"""
+ページごとの画像変換の解像度を選択するモジュール
+"""
+import numpy as np
+import fitz  # PyMuPDF
+
+class AdaptiveDPI:
+    """
+    ページごとに必要な解像度を選択するクラス
+
+    低解像度で画像化したページから主な文字の高さを推定し、文字の高さが
+    目標のピクセル数になる最小の解像度を選択する。OCR結果の信頼度が低い場合は
+    最大の解像度で画像化し直すかどうかの判定も行う。
+    """
+    def __init__(self, target_text_height=30, min_dpi=150, max_dpi=400,
+                 probe_dpi=72, retry_confidence=60):
+        self.target_text_height = target_text_height
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.probe_dpi = probe_dpi
+        self.retry_confidence = retry_confidence
+
+    def __repr__(self):
+        return (f"AdaptiveDPI(target_text_height={self.target_text_height}, "
+                f"min_dpi={self.min_dpi}, max_dpi={self.max_dpi}, probe_dpi={self.probe_dpi}, "
+                f"retry_confidence={self.retry_confidence})")
+
+    def select_dpi(self, page):
+        """
+        ページの画像変換に使う解像度を選択する
+
+        Args:
+            page: fitz.Page オブジェクト
+
+        Returns:
+            int: 解像度（min_dpi 以上 max_dpi 以下、25 刻み）
+        """
+        pixmap = page.get_pixmap(dpi=self.probe_dpi, colorspace=fitz.csGRAY, alpha=False)
+        pixels = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width)
+
+        text_height = self.estimate_text_height(pixels)
+        if not text_height:
+            # 文字が見つからないページは最小の解像度で十分
+            return self.min_dpi
+
+        dpi = self.probe_dpi * self.target_text_height / text_height
+        # 25 刻みに切り上げ
+        dpi = int(np.ceil(dpi / 25.0) * 25)
+        return max(self.min_dpi, min(self.max_dpi, dpi))
+
+    def estimate_text_height(self, pixels):
+        """
+        グレースケール画像から主な文字の高さ（ピクセル数）を推定する
+
+        行方向と列方向の投影プロファイルでインクのある範囲の連続した長さを求める。
+        横書きでは行の高さ、縦書きでは列の幅が文字の大きさに相当し、文字の並ぶ方向の
+        プロファイルより区切りが多く現れるため、区切りの多い方の中央値を使う。
+
+        Args:
+            pixels: グレースケール画像の NumPy 配列
+
+        Returns:
+            float: 文字の高さ（推定できない場合は None）
+        """
+        ink = pixels < 128
+        if not ink.any():
+            return None
+
+        runs = max(
+            (self._run_lengths(ink.any(axis=1)), self._run_lengths(ink.any(axis=0))),
+            key=len
+        )
+        # 1ピクセルの線やノイズは除外
+        runs = runs[runs > 1]
+        if not len(runs):
+            return None
+        return float(np.median(runs))
+
+    @staticmethod
+    def _run_lengths(profile):
+        """真偽値のプロファイルで True が連続する長さの配列を返す"""
+        padded = np.concatenate(([False], profile, [False])).astype(np.int8)
+        edges = np.flatnonzero(np.diff(padded))
+        return edges[1::2] - edges[::2]
+
+    def needs_retry(self, ocr_data, dpi):
+        """
+        OCR結果の信頼度が低く、より高い解像度で処理し直すべきかを判定する
+
+        Args:
+            ocr_data: OCR結果（pytesseract.image_to_data の出力形式）
+            dpi: OCRに使った解像度
+
+        Returns:
+            bool: 再処理すべき場合は True
+        """
+        if dpi >= self.max_dpi:
+            return False
+
+        confidence = self.mean_confidence(ocr_data)
+        return confidence is not None and confidence < self.retry_confidence
+
+    @staticmethod
+    def mean_confidence(ocr_data):
+        """
+        OCR結果の単語の信頼度の平均を計算する
+
+        Returns:
+            float: 信頼度の平均（単語がない場合は None）
+        """
+        confidences = [
+            float(conf) for conf, text in zip(ocr_data['conf'], ocr_data['text'])
+            if text.strip() and float(conf) >= 0
+        ]
+        if not confidences:
+            return None
+        return float(np.mean(confidences))
@@ -0,0 +1,306 @@
+"""
+OCR結果からページごとのテキスト・単語の座標を書き出すモジュール
+"""
+import html
+import json
+import os
+import sys
+import tempfile
+import unicodedata
+import fitz  # PyMuPDF
+from .ocr_engine import OCREngine
+
+# ページのテキストの取得元
+SOURCE_OCR = 'ocr'  # 今回のOCR結果
+SOURCE_PDF = 'pdf'  # PDFにあるテキスト（元からあるテキストや以前に追加したテキストレイヤー）
+SOURCE_BLANK = 'blank'  # 空白ページ
+
+def _is_wide(char):
+    """全角の文字（日本語の文字など、単語の間に空白を入れない文字）か"""
+    return unicodedata.east_asian_width(char) in ('W', 'F')
+
+def join_words(words):
+    """
+    行の単語をつなげて1つの文字列にする
+
+    日本語の文字どうしの間には空白を入れず、それ以外の単語の間には空白を入れる。
+    """
+    text = ''
+    for word in words:
+        if text and not (_is_wide(text[-1]) and _is_wide(word[0])):
+            text += ' '
+        text += word
+    return text
+
+def ocr_lines(ocr_data, dpi):
+    """
+    OCR結果の単語を行ごとにまとめる
+
+    Args:
+        ocr_data: OCR結果（pytesseract.image_to_data の出力形式）
+        dpi: OCRに使った解像度（座標をPDFの座標系に変換するため）
+
+    Returns:
+        list: 行のリスト [{'bbox': [x0, y0, x1, y1], 'words': [{'text', 'conf', 'bbox'}, ...]}, ...]
+              座標はPDFの座標系（ポイント、左上が原点）
+    """
+    scale = 72.0 / dpi
+    lines = []
+    line_keys = {}
+
+    for i in range(len(ocr_data['text'])):
+        text = ocr_data['text'][i].strip()
+        if not text:
+            continue
+
+        bbox = [
+            round(ocr_data['left'][i] * scale, 2),
+            round(ocr_data['top'][i] * scale, 2),
+            round((ocr_data['left'][i] + ocr_data['width'][i]) * scale, 2),
+            round((ocr_data['top'][i] + ocr_data['height'][i]) * scale, 2),
+        ]
+        word = {'text': text, 'conf': round(float(ocr_data['conf'][i]), 2), 'bbox': bbox}
+
+        key = (ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+        line = line_keys.get(key)
+        if line is None:
+            line = {'bbox': list(bbox), 'words': []}
+            line_keys[key] = line
+            lines.append(line)
+        line['words'].append(word)
+        line['bbox'] = [
+            min(line['bbox'][0], bbox[0]), min(line['bbox'][1], bbox[1]),
+            max(line['bbox'][2], bbox[2]), max(line['bbox'][3], bbox[3]),
+        ]
+
+    return lines
+
+def pdf_lines(page):
+    """
+    PDFのページにあるテキストの単語を行ごとにまとめる（ocr_lines と同じ形式、信頼度は None）
+    """
+    lines = []
+    line_keys = {}
+
+    for x0, y0, x1, y1, text, block_num, line_num, _ in page.get_text('words'):
+        bbox = [round(x0, 2), round(y0, 2), round(x1, 2), round(y1, 2)]
+        line = line_keys.get((block_num, line_num))
+        if line is None:
+            line = {'bbox': list(bbox), 'words': []}
+            line_keys[(block_num, line_num)] = line
+            lines.append(line)
+        line['words'].append({'text': text, 'conf': None, 'bbox': bbox})
+        line['bbox'] = [
+            min(line['bbox'][0], x0), min(line['bbox'][1], y0),
+            max(line['bbox'][2], x1), max(line['bbox'][3], y1),
+        ]
+
+    return lines
+
+def read_pages(pdf_path, page_results=None):
+    """
+    PDFのすべてのページについて、テキストと単語の座標をまとめる
+
+    OCRを行ったページはOCR結果から、それ以外のページ（既存テキストのためスキップした
+    ページなど）はPDFにあるテキストから取得する。
+
+    Args:
+        pdf_path: PDFファイルのパス（出力したPDF）
+        page_results: ページ番号 → ページのOCR結果（ocr_page の戻り値）の辞書
+
+    Returns:
+        list: ページごとの辞書のリスト
+              （page_num, width, height, source, orientation, dpi, text, lines）
+    """
+    page_results = page_results or {}
+    pages = []
+
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            result = page_results.get(page.number)
+            record = {
+                'page_num': page.number,
+                'width': round(page.rect.width, 2),
+                'height': round(page.rect.height, 2),
+                'orientation': None,
+                'dpi': None,
+            }
+
+            if result is None:
+                record['source'] = SOURCE_PDF
+                record['lines'] = pdf_lines(page)
+            elif result['orientation'] == OCREngine.BLANK:
+                record['source'] = SOURCE_BLANK
+                record['lines'] = []
+            else:
+                record['source'] = SOURCE_OCR
+                record['orientation'] = result['orientation']
+                record['dpi'] = result['dpi']
+                record['lines'] = ocr_lines(result['ocr_data'], result['dpi'])
+
+            record['text'] = '\n'.join(
+                join_words([word['text'] for word in line['words']]) for line in record['lines']
+            )
+            pages.append(record)
+
+    return pages
+
+def _write_atomic(path, content):
+    """一時ファイルに書き込んでから置き換える"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class SidecarExporter:
+    """
+    出力したPDFと同じ名前のサイドカーファイルにページごとのテキストを書き出すクラス
+
+    形式:
+        txt: ページごとのテキスト（ページの区切りは改ページ文字 \\f）
+        json: ページごとのテキストと、行・単語の座標（ポイント）と信頼度
+        hocr: ページごとの行・単語の座標（画素）と信頼度を記録した hOCR
+    """
+    FORMATS = ('txt', 'json', 'hocr')
+    # hOCR でOCRを行っていないページ（PDFにあるテキスト・空白ページ）の座標の解像度（1画素 = 1ポイント）
+    HOCR_PDF_DPI = 72
+
+    def __init__(self, formats=('txt',), output_dir=None):
+        """
+        Args:
+            formats: 書き出す形式のリスト
+            output_dir: サイドカーファイルの出力先ディレクトリ（None の場合はPDFと同じディレクトリ）
+        """
+        unknown = [fmt for fmt in formats if fmt not in self.FORMATS]
+        if unknown:
+            raise ValueError(f"サイドカーの形式が正しくありません: {', '.join(unknown)}")
+        self.formats = list(formats)
+        self.output_dir = output_dir
+
+    def sidecar_path(self, pdf_path, fmt):
+        """サイドカーファイルのパス"""
+        base = os.path.splitext(os.path.basename(pdf_path))[0] + '.' + fmt
+        return os.path.join(self.output_dir or os.path.dirname(os.path.abspath(pdf_path)), base)
+
+    def export(self, pdf_path, pages):
+        """
+        サイドカーファイルを書き出す
+
+        Args:
+            pdf_path: 出力したPDFのパス
+            pages: read_pages で取得したページのリスト
+        """
+        for fmt in self.formats:
+            if fmt == 'txt':
+                content = self.to_text(pages)
+            elif fmt == 'json':
+                content = self.to_json(pdf_path, pages)
+            else:
+                content = self.to_hocr(pdf_path, pages)
+            _write_atomic(self.sidecar_path(pdf_path, fmt), content)
+
+    @staticmethod
+    def to_text(pages):
+        """ページごとのテキストを改ページ文字で区切ったテキスト"""
+        return ''.join(page['text'] + '\n\f' for page in pages)
+
+    @staticmethod
+    def to_json(pdf_path, pages):
+        """ページごとのテキストと単語の座標を記録したJSON"""
+        document = {'file': os.path.basename(pdf_path), 'pages': pages}
+        return json.dumps(document, ensure_ascii=False, indent=1) + '\n'
+
+    @classmethod
+    def to_hocr(cls, pdf_path, pages):
+        """
+        ページごとの行・単語の座標を記録した hOCR（XHTML）
+
+        座標はOCRに使った解像度のページ画像の画素で表し、解像度は ocr_page の scan_res に記録する。
+        OCRを行っていないページは HOCR_PDF_DPI の解像度（ポイント単位）で表す。
+        """
+        def bbox(values, scale):
+            return 'bbox ' + ' '.join(str(int(round(value * scale))) for value in values)
+
+        out = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+            '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">',
+            '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="ja" lang="ja">',
+            '<head>',
+            f'<title>{html.escape(os.path.basename(pdf_path))}</title>',
+            '<meta http-equiv="Content-Type" content="text/html;charset=utf-8" />',
+            '<meta name="ocr-system" content="pdf_ocr_converter" />',
+            '<meta name="ocr-capabilities" content="ocr_page ocr_line ocrx_word" />',
+            '</head>',
+            '<body>',
+        ]
+        for page in pages:
+            page_id = page['page_num'] + 1
+            dpi = page['dpi'] or cls.HOCR_PDF_DPI
+            # ポイント → 画素
+            scale = dpi / 72.0
+            title = (f"{bbox([0, 0, page['width'], page['height']], scale)}; ppageno {page['page_num']}; "
+                     f"scan_res {int(round(dpi))} {int(round(dpi))}")
+            out.append(f'<div class="ocr_page" id="page_{page_id}" title="{title}">')
+            for line_index, line in enumerate(page['lines'], 1):
+                out.append(f'<span class="ocr_line" id="line_{page_id}_{line_index}" '
+                           f'title="{bbox(line["bbox"], scale)}">')
+                for word_index, word in enumerate(line['words'], 1):
+                    word_title = bbox(word['bbox'], scale)
+                    if word['conf'] is not None:
+                        word_title += f"; x_wconf {int(round(max(word['conf'], 0)))}"
+                    out.append(f'<span class="ocrx_word" id="word_{page_id}_{line_index}_{word_index}" '
+                               f'title="{word_title}">{html.escape(word["text"])}</span>')
+                out.append('</span>')
+            out.append('</div>')
+        out += ['</body>', '</html>']
+        return '\n'.join(out) + '\n'
+
+class TextStreamWriter:
+    """
+    ページごとに抽出したテキストを、処理が終わった順にストリームへ書き出すクラス
+
+    形式:
+        text: ページごとのテキスト（ページの区切りは改ページ文字 \\f、サイドカーの txt と同じ）
+        ndjson: 1ページを1行のJSON（file, page_num, orientation, text）
+    """
+    FORMATS = ('text', 'ndjson')
+
+    def __init__(self, stream=None, fmt='text'):
+        """
+        Args:
+            stream: 書き出し先のテキストストリーム（None の場合は標準出力）
+            fmt: 書き出す形式（'text' または 'ndjson'）
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"テキストの出力形式が正しくありません: {fmt}")
+        self.stream = stream if stream is not None else sys.stdout
+        self.fmt = fmt
+        self.pages = 0
+
+    def write_page(self, pdf_path, page_num, text, orientation):
+        """
+        1ページ分のテキストを書き出す（下流の処理がすぐに受け取れるよう、ページごとにフラッシュする）
+
+        Args:
+            pdf_path: 入力PDFのパス
+            page_num: ページ番号（0始まり）
+            text: ページのテキスト
+            orientation: テキストの向き（PDFにあるテキストの場合は None）
+        """
+        if self.fmt == 'ndjson':
+            record = {'file': pdf_path, 'page_num': page_num, 'orientation': orientation, 'text': text}
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            self.stream.write(text + '\n\f')
+        self.stream.flush()
+        self.pages += 1
@@ -0,0 +1,219 @@
+"""
+処理の段階ごとの処理時間・データ量・メモリ使用量を記録するモジュール
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+def current_rss_mb():
+    """
+    現在の常駐メモリ（MB）を取得する
+
+    /proc が使えない環境では最大常駐メモリで代用し、どちらも取得できない場合は None を返す。
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux はキロバイト単位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def image_bytes(image):
+    """PIL.Image の画素データのバイト数（8bit の画像を想定）"""
+    return image.width * image.height * len(image.getbands())
+
+class Instrumentation:
+    """
+    処理の段階（画像化・前処理・OCR・テキストレイヤーの追加・保存など）の計測を行い、
+    イベントを出力先（シンク）に渡すクラス
+
+    シンクが指定されていない場合は計測を行わない。ワーカープロセスで記録したイベントは
+    collect で集めて結果とともに親プロセスへ返し、親プロセスで replay して出力する。
+    """
+    def __init__(self, sinks=None, **labels):
+        self.sinks = list(sinks or [])
+        # すべてのイベントに付加する情報（ファイル名など）
+        self.labels = labels
+
+    @property
+    def enabled(self):
+        """イベントの出力先があるか"""
+        return bool(self.sinks)
+
+    def bind(self, **labels):
+        """シンクを共有し、イベントに付加する情報を追加した Instrumentation を作成する"""
+        instrumentation = Instrumentation(**dict(self.labels, **labels))
+        instrumentation.sinks = self.sinks
+        return instrumentation
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        処理の段階を計測する
+
+        with 文のブロックの処理時間と終了時のメモリ使用量を記録する。
+        ブロック内で得られた情報（データ量など）は、yield される辞書に追加できる。
+
+        Args:
+            name: 段階の名前（'render', 'preprocess', 'ocr', 'text_layer', 'save' など）
+            **fields: イベントに追加する情報（ページ番号など）
+        """
+        if not self.sinks:
+            yield {}
+            return
+
+        event = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield event
+        finally:
+            event.update({
+                'stage': name,
+                'duration': time.perf_counter() - start,
+                'rss_mb': current_rss_mb(),
+            })
+            self.emit(event)
+
+    def emit(self, event):
+        """イベントに共通の情報を付加してシンクに渡す"""
+        if not self.sinks:
+            return
+        record = {'time': time.time(), 'pid': os.getpid()}
+        record.update(self.labels)
+        record.update(event)
+        self.replay([record])
+
+    def replay(self, events):
+        """ワーカープロセスなどで記録済みのイベントをシンクに渡す"""
+        for event in events:
+            for sink in self.sinks:
+                sink.write(event)
+
+    @contextmanager
+    def collect(self):
+        """
+        ブロック内で記録したイベントをシンクに渡さずにリストに集める
+
+        Yields:
+            list: 記録したイベントのリスト
+        """
+        events = []
+        sinks = self.sinks
+        self.sinks = [CallbackSink(events.append)]
+        try:
+            yield events
+        finally:
+            self.sinks = sinks
+
+    def close(self):
+        """すべてのシンクを閉じる"""
+        for sink in self.sinks:
+            sink.close()
+
+class CallbackSink:
+    """イベントごとに関数を呼び出すシンク"""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, event):
+        self.callback(event)
+
+    def close(self):
+        pass
+
+class JSONLinesSink:
+    """イベントを1行ずつJSONで追記するシンク"""
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._fh = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, event):
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+class PrometheusTextfileSink:
+    """
+    段階ごとに集計した値を Prometheus の textfile 形式で書き出すシンク
+
+    node_exporter の textfile collector で読み込むことを想定し、一時ファイルに
+    書いてから置き換える。書き出しは interval 秒ごとと close 時に行う。
+    """
+    PREFIX = 'pdf_ocr'
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        # 段階の名前 → {'count', 'sum', 'max', 'bytes'}
+        self.stages = {}
+        self.max_rss_mb = 0.0
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, event):
+        with self._lock:
+            stats = self.stages.setdefault(event['stage'], {'count': 0, 'sum': 0.0, 'max': 0.0, 'bytes': 0})
+            stats['count'] += 1
+            stats['sum'] += event['duration']
+            stats['max'] = max(stats['max'], event['duration'])
+            stats['bytes'] += event.get('bytes') or 0
+            self.max_rss_mb = max(self.max_rss_mb, event.get('rss_mb') or 0.0)
+
+            if time.time() - self._last_write >= self.interval:
+                self._write_file()
+
+    def _write_file(self):
+        """集計した値をファイルに書き出す"""
+        prefix = self.PREFIX
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds 処理の段階ごとの処理時間",
+            f"# TYPE {prefix}_stage_duration_seconds summary",
+        ]
+        for stage, stats in sorted(self.stages.items()):
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [
+            f"# HELP {prefix}_stage_duration_seconds_max 処理の段階ごとの最大の処理時間",
+            f"# TYPE {prefix}_stage_duration_seconds_max gauge",
+        ]
+        for stage, stats in sorted(self.stages.items()):
+            lines.append(f'{prefix}_stage_duration_seconds_max{{stage="{stage}"}} {stats["max"]:.6f}')
+        lines += [
+            f"# HELP {prefix}_stage_bytes_total 処理の段階ごとのデータ量",
+            f"# TYPE {prefix}_stage_bytes_total counter",
+        ]
+        for stage, stats in sorted(self.stages.items()):
+            lines.append(f'{prefix}_stage_bytes_total{{stage="{stage}"}} {stats["bytes"]}')
+        lines += [
+            f"# HELP {prefix}_resident_memory_max_bytes 記録した常駐メモリの最大値",
+            f"# TYPE {prefix}_resident_memory_max_bytes gauge",
+            f"{prefix}_resident_memory_max_bytes {int(self.max_rss_mb * 1024 * 1024)}",
+        ]
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.path)
+        self._last_write = time.time()
+
+    def close(self):
+        with self._lock:
+            self._write_file()
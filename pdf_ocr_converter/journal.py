@@ -0,0 +1,231 @@
+"""
+バッチ処理・大きなPDFの処理の進捗を記録するジャーナルを管理するモジュール
+"""
+import json
+import os
+import shutil
+
+def file_signature(path):
+    """ファイルの変更を検出するための署名（サイズ, 更新日時）を取得"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class BatchJournal:
+    """
+    バッチ処理の進捗を記録するジャーナル（JSON Lines形式）
+
+    処理が完了したファイルを入力・出力の署名とともに記録し、ページ数の多い
+    ファイルについてはページごとのOCR結果も記録する。中断後に再開する場合は、
+    記録済みで変更のないファイルを処理済みとしてスキップし、記録済みのページは
+    OCRを省略する。
+    """
+    # ページごとの進捗を記録するファイルの最小ページ数
+    PAGE_CHECKPOINT_MIN_PAGES = 20
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        # 入力ファイルの絶対パス → 完了したファイルの記録
+        self.files = {}
+        # 入力ファイルの絶対パス → {'input': 入力の署名, 'results': {ページ番号: OCR結果}}
+        self.pages = {}
+
+        if resume and os.path.exists(path):
+            self._load()
+        self._compact()
+        self._fh = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """ジャーナルを読み込む"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で中断された行は無視
+                    continue
+
+                if record['event'] == 'file':
+                    self.files[record['input']] = record
+                    self.pages.pop(record['input'], None)
+                elif record['event'] == 'page':
+                    progress = self.pages.get(record['input'])
+                    if progress is None or progress['input'] != record['input_signature']:
+                        progress = {'input': record['input_signature'], 'results': {}}
+                        self.pages[record['input']] = progress
+                    result = record['result']
+                    progress['results'][result['page_num']] = result
+
+    def _compact(self):
+        """現在有効な記録だけでジャーナルを書き直す"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in self.files.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            for input_path, progress in self.pages.items():
+                for result in progress['results'].values():
+                    f.write(json.dumps({
+                        'event': 'page',
+                        'input': input_path,
+                        'input_signature': progress['input'],
+                        'result': result,
+                    }, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.path)
+
+    def _write(self, record):
+        """記録を1行追記し、ディスクに書き出す"""
+        self._fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def is_up_to_date(self, input_path, output_path):
+        """
+        ファイルが処理済みで、その後に変更されていないかを確認する
+
+        Args:
+            input_path: 入力PDFのパス
+            output_path: 出力PDFのパス
+
+        Returns:
+            bool: 処理済みで入力・出力ともに変更がなければ True
+        """
+        record = self.files.get(os.path.abspath(input_path))
+        if record is None or record['output'] != os.path.abspath(output_path):
+            return False
+        if not os.path.exists(output_path):
+            return False
+        if file_signature(output_path) != record['output_signature']:
+            return False
+        # 上書きの場合は入力ファイル自体が出力になっている
+        if os.path.abspath(input_path) != os.path.abspath(output_path):
+            if file_signature(input_path) != record['input_signature']:
+                return False
+        return True
+
+    def get_page_results(self, input_path, input_signature):
+        """
+        記録済みのページのOCR結果を取得する
+
+        Args:
+            input_path: 入力PDFのパス
+            input_signature: 現在の入力PDFの署名
+
+        Returns:
+            dict: ページ番号 → OCR結果（入力が変更されている場合は空）
+        """
+        progress = self.pages.get(os.path.abspath(input_path))
+        if progress is None or progress['input'] != input_signature:
+            return {}
+        return dict(progress['results'])
+
+    def record_page(self, input_path, input_signature, result):
+        """ページのOCR結果を記録する"""
+        self._write({
+            'event': 'page',
+            'input': os.path.abspath(input_path),
+            'input_signature': input_signature,
+            'result': result,
+        })
+
+    def record_file(self, input_path, input_signature, output_path):
+        """ファイルの処理完了を記録する"""
+        record = {
+            'event': 'file',
+            'input': os.path.abspath(input_path),
+            'input_signature': input_signature,
+            'output': os.path.abspath(output_path),
+            'output_signature': file_signature(output_path),
+        }
+        self.files[record['input']] = record
+        self.pages.pop(record['input'], None)
+        self._write(record)
+
+    def close(self):
+        """ジャーナルを閉じる"""
+        self._fh.close()
+
+class ChunkCheckpoint:
+    """
+    大きなPDFを数ページずつ作業ファイルに追記保存する処理の進捗を記録するクラス
+
+    作業ファイルは出力先と同じディレクトリに入力PDFをコピーして作成し、
+    chunk_size ページごとにテキストレイヤーを追記保存する。保存ごとに、保存済みの
+    ページ番号と作業ファイルの署名を進捗ファイル（JSON）に記録する。
+    中断後に再開する場合は、入力PDFと作業ファイルが記録時から変更されていなければ
+    保存済みのページを処理済みとして続きから処理する。
+    """
+    def __init__(self, input_pdf, output_pdf, chunk_size):
+        directory, name = os.path.split(os.path.abspath(output_pdf))
+        self.input_pdf = input_pdf
+        self.chunk_size = chunk_size
+        self.working_path = os.path.join(directory, '.' + name + '.partial')
+        self.progress_path = self.working_path + '.json'
+        # 作業ファイルに保存済みのページ番号
+        self.pages = set()
+        # 保存済みのページのうち空白ページの数
+        self.blank = 0
+
+    def load(self):
+        """
+        前回の進捗を読み込む
+
+        Returns:
+            bool: 再開できる場合は True（進捗がないか、入力・作業ファイルが変更されている場合は False）
+        """
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+            valid = (progress['input'] == file_signature(self.input_pdf)
+                     and progress['working'] == file_signature(self.working_path))
+        except (OSError, ValueError, KeyError):
+            valid = False
+
+        if not valid:
+            return False
+
+        self.pages = set(progress['pages'])
+        self.blank = progress['blank']
+        return True
+
+    def start(self):
+        """入力PDFをコピーして作業ファイルを作成し、進捗を初期化する"""
+        shutil.copyfile(self.input_pdf, self.working_path)
+        self.pages = set()
+        self.blank = 0
+        self._write()
+
+    def record(self, page_nums, blank):
+        """
+        作業ファイルに保存したページを記録する
+
+        Args:
+            page_nums: 保存したページ番号のリスト
+            blank: そのうち空白ページの数
+        """
+        self.pages.update(page_nums)
+        self.blank += blank
+        self._write()
+
+    def _write(self):
+        """進捗ファイルを書き出す（一時ファイルに書いてから置き換える）"""
+        progress = {
+            'input': file_signature(self.input_pdf),
+            'working': file_signature(self.working_path),
+            'pages': sorted(self.pages),
+            'blank': self.blank,
+        }
+        temp_path = self.progress_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(progress, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.progress_path)
+
+    def discard(self):
+        """作業ファイルと進捗ファイルを削除する"""
+        for path in (self.working_path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
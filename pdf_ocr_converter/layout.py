@@ -0,0 +1,113 @@
+"""
+ページ画像のレイアウト（テキストのまとまり）を解析するモジュール
+"""
+import math
+import numpy as np
+from .dpi_selector import AdaptiveDPI
+
+# ブロックの区切りとみなす余白の最小幅（インチ）
+MIN_GAP_INCHES = 0.2
+# ブロックの区切りとみなす余白の最小幅（主な文字の高さに対する倍数、単語間の空白で分割しないため）
+MIN_GAP_TEXT_HEIGHTS = 2.0
+# これより多くのブロックに分かれるページはブロックに分けずに処理する
+MAX_BLOCKS = 32
+
+def find_text_blocks(image, dpi, exclude_regions=None, min_gap_inches=MIN_GAP_INCHES, max_blocks=MAX_BLOCKS):
+    """
+    XY-cut 法でページ画像をテキストのブロックに分割する
+
+    インクのある範囲を、行方向と列方向の投影で一定以上の余白がある位置で再帰的に
+    分割する。段組みの列や帳票の欄が別のブロックになる。余白の最小幅は min_gap_inches と、
+    主な文字の高さの MIN_GAP_TEXT_HEIGHTS 倍の大きい方とする。
+
+    Args:
+        image: PIL.Image オブジェクト
+        dpi: 画像の解像度
+        exclude_regions: 除外領域のリスト [(x1, y1, x2, y2), ...]（インクとして扱わない）
+        min_gap_inches: ブロックの区切りとみなす余白の最小幅（インチ）
+        max_blocks: ブロック数の上限
+
+    Returns:
+        list: ブロックの矩形のリスト [(x1, y1, x2, y2), ...]（余白を付けた画像の座標）
+              インクがない場合は空のリスト、ブロック数が上限を超えた場合は None
+    """
+    pixels = np.array(image.convert('L'))
+    if exclude_regions:
+        height, width = pixels.shape
+        for x1, y1, x2, y2 in exclude_regions:
+            left, right = sorted((int(x1), int(math.ceil(x2))))
+            top, bottom = sorted((int(y1), int(math.ceil(y2))))
+            pixels[max(top, 0):min(bottom + 1, height), max(left, 0):min(right + 1, width)] = 255
+
+    min_gap = max(2, int(dpi * min_gap_inches))
+    text_height = AdaptiveDPI().estimate_text_height(pixels)
+    if text_height:
+        min_gap = max(min_gap, int(text_height * MIN_GAP_TEXT_HEIGHTS))
+    # 余白の最小幅の 1/4 のブロックごとに最も暗い画素で縮小
+    factor = max(1, min_gap // 4)
+
+    height, width = pixels.shape[0] // factor, pixels.shape[1] // factor
+    cropped = pixels[:height * factor, :width * factor]
+    ink = np.minimum.reduce([
+        cropped[y::factor, x::factor] for y in range(factor) for x in range(factor)
+    ]) < 128
+
+    cells = []
+    _xy_cut(ink, 0, 0, max(1, min_gap // factor), cells)
+    cells = [tuple(int(value) for value in cell) for cell in cells]
+    # 1ブロック分だけのインク（スキャン時の汚れ）は除外
+    cells = [cell for cell in cells if ink[cell[1]:cell[3], cell[0]:cell[2]].sum() > 1]
+    if len(cells) > max_blocks:
+        return None
+
+    # 画像の座標に戻し、Tesseract が文字を認識しやすいよう周囲に余白を付ける
+    padding = min_gap // 2
+    return [
+        (max(x1 * factor - padding, 0), max(y1 * factor - padding, 0),
+         min(x2 * factor + padding, image.width), min(y2 * factor + padding, image.height))
+        for x1, y1, x2, y2 in cells
+    ]
+
+def _xy_cut(ink, left, top, min_gap, blocks):
+    """インクの配列を余白で再帰的に分割し、分割できなくなった矩形を blocks に追加する"""
+    rows = np.flatnonzero(ink.any(axis=1))
+    if not len(rows):
+        return
+    cols = np.flatnonzero(ink.any(axis=0))
+
+    # インクのある範囲に切り詰める
+    ink = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    left += cols[0]
+    top += rows[0]
+
+    # 行方向（上下に並ぶブロック）を優先して分割し、分割できなければ列方向で分割
+    for axis in (1, 0):
+        segments = _split_profile(ink.any(axis=axis), min_gap)
+        if len(segments) > 1:
+            for start, end in segments:
+                if axis == 1:
+                    _xy_cut(ink[start:end], left, top + start, min_gap, blocks)
+                else:
+                    _xy_cut(ink[:, start:end], left + start, top, min_gap, blocks)
+            return
+
+    blocks.append((left, top, left + ink.shape[1], top + ink.shape[0]))
+
+def _split_profile(profile, min_gap):
+    """
+    投影プロファイルを min_gap 以上の余白で区切る
+
+    Returns:
+        list: インクのある区間 [(開始, 終了), ...]
+    """
+    padded = np.concatenate(([False], profile, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[::2], edges[1::2]
+
+    segments = [[starts[0], ends[0]]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - segments[-1][1] >= min_gap:
+            segments.append([start, end])
+        else:
+            segments[-1][1] = end
+    return [tuple(segment) for segment in segments]
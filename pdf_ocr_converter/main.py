@@ -3,12 +3,26 @@
 画像PDFからOCRでテキストを抽出し検索可能なPDFを生成するツール
 """
 import argparse
+import logging
 import os
+import sys
 from .pdf_processor import PDFProcessor
 from .batch_handler import BatchProcessor
 from .region_selector import RegionSelector
 from .config import ExcludeConfig
 from .ocr_engine import OCREngine
+from .ocr_cache import OCRCache
+from .journal import BatchJournal
+from .preprocess import ImagePreprocessor
+from .dpi_selector import AdaptiveDPI
+from .instrumentation import Instrumentation, JSONLinesSink, PrometheusTextfileSink
+from .service import OCRService, serve
+from .watcher import HotFolderWatcher
+from .exports import SidecarExporter, TextStreamWriter
+from .search_index import SearchIndex
+from .pdf_optimizer import PDFOptimizer
+from .refine import ConfidenceRefiner
+from .resources import ResourceBudget, set_thread_limit
 
 def main():
     parser = argparse.ArgumentParser(description='画像PDFからOCRでテキストを抽出し検索可能なPDFを生成')
@@ -17,6 +31,8 @@ def main():
     input_group = parser.add_mutually_exclusive_group(required=True)
     input_group.add_argument('-f', '--file', help='処理する単一のPDFファイルパス')
     input_group.add_argument('-d', '--directory', help='処理するPDFファイルを含むディレクトリパス')
+    input_group.add_argument('--serve', action='store_true',
+                             help='常駐してHTTP経由でOCR処理を受け付けるサービスとして起動')
 
     # 出力先の指定（オプション）
     parser.add_argument('-o', '--output', help='出力先（ファイルまたはディレクトリ）')
@@ -36,16 +52,139 @@ def main():
                         help='除外する領域をピクセル座標で指定 (複数指定可)')
     parser.add_argument('--config', help='除外領域設定ファイルのパス')
 
+    # 対象領域の設定（指定した領域だけをタイルとして切り出してOCR）
+    parser.add_argument('--include-region', action='append', type=int, nargs=4,
+                        metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help='OCRの対象とする領域をピクセル座標で指定 (複数指定可、領域外はOCRしない)')
+    parser.add_argument('--layout-blocks', action='store_true',
+                        help='ページを余白で区切られたテキストのブロックに分割し、ブロックごとにOCR')
+    parser.add_argument('--tile-workers', type=int, default=1,
+                        help='1ページの対象領域・ブロックを並行してOCRするスレッド数（デフォルト: 1）')
+
     # テキストの向き設定
     parser.add_argument('--orientation', choices=['auto', 'horizontal', 'vertical'],
                         default='auto', help='テキストの向き（auto: 自動検出, horizontal: 横書き, vertical: 縦書き）')
+    parser.add_argument('--full-orientation-check', action='store_true',
+                        help='自動検出時に簡易判定と文書内での向きの記憶を使わず、全ページを横書き・縦書きの両方でOCRして比較')
 
     # その他のオプション
     parser.add_argument('-l', '--language', default='jpn', help='OCRの言語設定（デフォルト: jpn）')
-    parser.add_argument('-w', '--workers', type=int, default=4, help='並列処理のワーカー数（デフォルト: 4）')
+    parser.add_argument('--ocr-backend', choices=['auto', 'tesserocr', 'pytesseract'], default='auto',
+                        help='OCRバックエンド（auto: tesserocr があれば常駐エンジンを使用、デフォルト: auto）')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='並列処理のワーカー数（単一ファイルではページ単位で並列化、デフォルト: 4）')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='ページのOCRに使うメモリの上限（MB）。ページの大きさと解像度から見積もった'
+                             'メモリの合計が収まるようにワーカー数と同時に処理するページを制限')
+    parser.add_argument('--cpus', type=int,
+                        help='使用するCPU数（ワーカー数と Tesseract のスレッド数の積をこの数に収める、'
+                             'デフォルト: 使用可能なCPU数）')
     parser.add_argument('--dpi', type=int, default=300, help='画像変換時の解像度（デフォルト: 300）')
+    parser.add_argument('--no-native-images', action='store_true',
+                        help='1枚の画像だけのスキャンページも埋め込まれた画像を直接取り出さず、poppler でページを画像化')
+    parser.add_argument('--adaptive-dpi', action='store_true',
+                        help='ページごとに文字の大きさから解像度を自動選択（--dpi は除外領域のピクセル座標の基準になる）')
+    parser.add_argument('--min-dpi', type=int, default=150, help='自動選択する解像度の最小値（デフォルト: 150）')
+    parser.add_argument('--max-dpi', type=int, default=400,
+                        help='自動選択する解像度の最大値。信頼度が低いページはこの解像度で再処理（デフォルト: 400）')
+    parser.add_argument('--target-text-height', type=int, default=30,
+                        help='解像度の自動選択で目標とする文字の高さ（ピクセル、デフォルト: 30）')
+    parser.add_argument('--refine', action='store_true',
+                        help='信頼度の低い単語を含む行だけを高い解像度でOCRし直し、改善した行を置き換える')
+    parser.add_argument('--refine-confidence', type=int, default=60,
+                        help='--refine でOCRし直す単語の信頼度の閾値（デフォルト: 60）')
+    parser.add_argument('--refine-scale', type=float, default=2.0,
+                        help='--refine でOCRし直す際の、ページの解像度に対する倍率（最大 600dpi、デフォルト: 2.0）')
+    parser.add_argument('--blank-threshold', type=float, default=OCREngine.BLANK_THRESHOLD,
+                        help='インクの割合がこの値未満のページを空白ページとしてOCRを省略'
+                             f'（0 で無効、デフォルト: {OCREngine.BLANK_THRESHOLD}）')
+    parser.add_argument('--existing-text', choices=['all', 'skip', 'redo'], default='all',
+                        help='既存テキストのあるページの扱い（all: すべてOCR, skip: テキストのあるページをスキップ, '
+                             'redo: 元からテキストのあるページをスキップし以前のOCR結果は再作成、デフォルト: all）')
+    parser.add_argument('--preprocess', choices=['gray', 'binary', 'rgb'], default='gray',
+                        help='OCR前の画像の前処理（gray: グレースケール, binary: 二値化, rgb: カラーのまま、デフォルト: gray）')
+    parser.add_argument('--deskew', action='store_true', help='OCR前にページの傾きを補正')
+    parser.add_argument('--despeckle', action='store_true', help='OCR前に細かいノイズを除去')
+    parser.add_argument('--cache', metavar='PATH', help='OCR結果のキャッシュファイル（SQLite）のパス')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='OCR結果のキャッシュの上限サイズ（MB、デフォルト: 1024）')
+    parser.add_argument('--resume', action='store_true',
+                        help='ディレクトリ処理でジャーナルを使って中断した処理を再開（処理済みで変更のないファイルをスキップ）')
+    parser.add_argument('--journal', metavar='PATH',
+                        help='ディレクトリ処理の進捗を記録するジャーナルのパス'
+                             '（デフォルト: 出力ディレクトリの .pdf_ocr_journal.jsonl、--resume 指定時に使用）')
+    parser.add_argument('--recursive', action='store_true',
+                        help='ディレクトリ処理でサブディレクトリのPDFも処理し、出力先に同じディレクトリ構成で保存')
+    parser.add_argument('--watch', action='store_true',
+                        help='ディレクトリを監視し、追加・変更されたPDFを書き込み完了後に継続して処理（-d と併用）')
+    parser.add_argument('--watch-interval', type=float, default=5.0,
+                        help='監視時にディレクトリを走査する間隔（秒、デフォルト: 5）')
+    parser.add_argument('--settle-time', type=float, default=10.0,
+                        help='監視時に変更がなくなってから処理を始めるまでの秒数（デフォルト: 10）')
+    parser.add_argument('--max-batch-files', type=int, default=16,
+                        help='監視時に一度に処理するファイル数の上限（デフォルト: 16）')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='このページ数ごとに作業ファイルへ追記保存し、中断後は続きから処理（0: 最後に一度だけ保存、デフォルト: 0）')
+    parser.add_argument('--page-window', type=int,
+                        help='一度に画像化するページ数（0: 全ページを一括で画像化、'
+                             'デフォルト: 4、--chunk-size を指定した場合はそのページ数）')
+    parser.add_argument('--metrics-jsonl', metavar='PATH',
+                        help='処理の段階ごとの処理時間・データ量・メモリ使用量をJSON Lines形式で追記するファイル')
+    parser.add_argument('--metrics-textfile', metavar='PATH',
+                        help='段階ごとの集計を Prometheus の textfile 形式で書き出すファイル')
+    parser.add_argument('--sidecar', metavar='FORMATS',
+                        help='出力したPDFと同じ名前で書き出すテキストの形式（txt, json, hocr をカンマ区切りで指定）')
+    parser.add_argument('--sidecar-dir', metavar='DIR',
+                        help='サイドカーファイルの出力先ディレクトリ（デフォルト: 出力したPDFと同じディレクトリ）')
+    parser.add_argument('--index', metavar='PATH',
+                        help='出力したPDFのテキストを登録する全文検索インデックス（SQLite）のパス')
+    # テキストだけの抽出
+    parser.add_argument('--text-only', action='store_true',
+                        help='PDFを保存せず、ページごとに抽出したテキストを処理が終わった順に出力'
+                             '（-o で指定したファイル、省略時は標準出力）')
+    parser.add_argument('--text-format', choices=TextStreamWriter.FORMATS,
+                        help='--text-only の出力形式（text: 改ページ区切りのテキスト, ndjson: 1ページ1行のJSON、'
+                             'デフォルト: -f は text, -d は ndjson）')
+    # 出力するPDFのサイズの最適化
+    parser.add_argument('--optimize', action='store_true',
+                        help='出力するPDFの重複・未使用オブジェクトを削除し、ストリームを圧縮して保存')
+    parser.add_argument('--linearize', action='store_true',
+                        help='Web表示用に線形化して保存（--optimize を含む、qpdf が必要な場合あり）')
+    parser.add_argument('--image-dpi', type=int,
+                        help='この解像度を超えるスキャン画像を縮小して再圧縮（--optimize を含む）')
+    parser.add_argument('--image-format', choices=['jpeg', 'flate'], default='jpeg',
+                        help='縮小した画像の圧縮形式（jpeg: 非可逆, flate: 可逆、デフォルト: jpeg）')
+    parser.add_argument('--jpeg-quality', type=int, default=75, help='縮小した画像の JPEG の品質（デフォルト: 75）')
+    # サービスの設定
+    parser.add_argument('--host', default='127.0.0.1', help='サービスが待ち受けるホスト（デフォルト: 127.0.0.1）')
+    parser.add_argument('--port', type=int, default=8765, help='サービスが待ち受けるポート（デフォルト: 8765）')
+    parser.add_argument('--socket', metavar='PATH', help='サービスを Unix ソケットで待ち受ける場合のパス')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='サービスの処理待ちジョブ数の上限。超えた場合は 429 を返す（デフォルト: 16）')
+    parser.add_argument('--job-ttl', type=int, default=3600,
+                        help='処理が終わったジョブの結果をサービスが保持する秒数（デフォルト: 3600）')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='ページごとの処理内容を表示（-vv で向きの判定の信頼度も表示）')
 
     args = parser.parse_args()
+    if args.watch and not args.directory:
+        parser.error('--watch は -d/--directory と併用してください')
+    if args.serve and (args.sidecar or args.index):
+        parser.error('--sidecar と --index は -f/--file または -d/--directory と併用してください')
+    if args.serve and (args.memory_budget or args.cpus):
+        parser.error('--memory-budget と --cpus は -f/--file または -d/--directory と併用してください')
+    if (args.memory_budget is not None and args.memory_budget <= 0) or (args.cpus is not None and args.cpus <= 0):
+        parser.error('--memory-budget と --cpus には正の数を指定してください')
+    if args.text_only and (args.serve or args.watch or args.overwrite or args.sidecar or args.index):
+        parser.error('--text-only は -f/--file または -d/--directory と併用し、'
+                     '--watch, --overwrite, --sidecar, --index とは併用できません')
+
+    # ページごとの表示は詳細表示を指定した場合のみ
+    log_level = logging.WARNING
+    if args.verbose == 1:
+        log_level = logging.INFO
+    elif args.verbose >= 2:
+        log_level = logging.DEBUG
+    logging.basicConfig(level=log_level, format='%(message)s')
 
     # テキストの向きを設定
     orientation = args.orientation
@@ -61,8 +200,90 @@ def main():
     if args.config:
         exclude_config = ExcludeConfig(args.config)
 
+    # OCR前の画像の前処理
+    preprocessor = ImagePreprocessor(args.preprocess, deskew=args.deskew, despeckle=args.despeckle)
+
+    # ページごとの解像度の自動選択
+    adaptive_dpi = None
+    if args.adaptive_dpi:
+        adaptive_dpi = AdaptiveDPI(args.target_text_height, args.min_dpi, args.max_dpi)
+
+    # 信頼度の低い行の再処理
+    refiner = None
+    if args.refine:
+        refiner = ConfidenceRefiner(args.refine_confidence, args.refine_scale)
+
+    # ワーカー数・Tesseract のスレッド数・同時に処理するページのメモリの調整
+    resources = None
+    if args.memory_budget or args.cpus:
+        resources = ResourceBudget(args.memory_budget, args.cpus)
+        # Tesseract（OpenMP）はスレッド数の上限を読み込み時にだけ参照するため、OCRを始める前に
+        # 指定したワーカー数で計画した上限をプロセス全体に設定する（ワーカープロセスにも引き継がれる）
+        set_thread_limit(resources.plan(args.workers, args.tile_workers)[1])
+
+    # OCR結果のキャッシュ
+    cache = None
+    if args.cache:
+        cache = OCRCache(args.cache, max_size=args.cache_size * 1024 * 1024)
+        cache_stats = cache.stats()
+
+    # 処理の段階ごとの計測
+    sinks = []
+    if args.metrics_jsonl:
+        sinks.append(JSONLinesSink(args.metrics_jsonl))
+    if args.metrics_textfile:
+        sinks.append(PrometheusTextfileSink(args.metrics_textfile))
+    instrumentation = Instrumentation(sinks)
+
+    # 保存したPDFのテキストの書き出し
+    exporters = []
+    if args.sidecar:
+        try:
+            exporters.append(SidecarExporter(
+                [fmt.strip() for fmt in args.sidecar.split(',') if fmt.strip()], args.sidecar_dir
+            ))
+        except ValueError as e:
+            parser.error(str(e))
+    # 出力するPDFのサイズの最適化
+    optimizer = None
+    if args.optimize or args.linearize or args.image_dpi:
+        optimizer = PDFOptimizer(linearize=args.linearize, image_dpi=args.image_dpi,
+                                 image_format=args.image_format, jpeg_quality=args.jpeg_quality)
+
+    search_index = None
+    if args.index:
+        search_index = SearchIndex(args.index)
+        exporters.append(search_index)
+
     # 処理の実行
-    if args.file:
+    if args.text_only:
+        # テキストだけを抽出してページごとに出力（PDFは保存しない）
+        extract_text(args, exclude_config, orientation, cache, preprocessor, adaptive_dpi, instrumentation,
+                     resources)
+    elif args.serve:
+        # 常駐サービス（-w はジョブを並行して処理するワーカープロセス数）
+        service = OCRService(
+            processor_options={
+                'language': args.language,
+                'ocr_backend': args.ocr_backend,
+                'orientation_probe': not args.full_orientation_check,
+                'cache': cache,
+                'preprocessor': preprocessor,
+                'adaptive_dpi': adaptive_dpi,
+                'blank_threshold': args.blank_threshold,
+                'tile_workers': args.tile_workers,
+                'native_images': not args.no_native_images,
+                'refiner': refiner,
+                'instrumentation': instrumentation,
+                'optimizer': optimizer,
+            },
+            workers=args.workers,
+            queue_size=args.queue_size,
+            job_ttl=args.job_ttl,
+            exclude_config=exclude_config
+        )
+        serve(service, args.host, args.port, args.socket, verbose=args.verbose > 0)
+    elif args.file:
         # 単一ファイルの処理
         output = args.output if not args.overwrite else args.file
 
@@ -80,19 +301,42 @@ def main():
             for region in args.exclude_region:
                 region_selector.add_pixel_region(*region)
 
+        # 対象領域の追加
+        if args.include_region:
+            for region in args.include_region:
+                region_selector.add_include_region(*region)
+        if args.layout_blocks:
+            region_selector.enable_layout_blocks()
+
         # 設定ファイルからの設定
         if exclude_config:
             regions_config = exclude_config.get_regions_for_file(args.file)
             region_selector.add_regions_from_config(regions_config)
 
         # PDFを処理
-        processor = PDFProcessor(args.file, output, args.language)
-        processor.process(exclude_regions=region_selector, dpi=args.dpi, orientation=orientation)
+        processor = PDFProcessor(args.file, output, args.language, args.ocr_backend,
+                                 orientation_probe=not args.full_orientation_check, cache=cache,
+                                 preprocessor=preprocessor, adaptive_dpi=adaptive_dpi,
+                                 blank_threshold=args.blank_threshold, tile_workers=args.tile_workers,
+                                 instrumentation=instrumentation, exporters=exporters, optimizer=optimizer,
+                                 native_images=not args.no_native_images, refiner=refiner,
+                                 resources=resources)
+        processor.process(exclude_regions=region_selector, dpi=args.dpi, orientation=orientation,
+                          page_window=args.page_window, workers=args.workers, chunk_size=args.chunk_size,
+                          existing_text=args.existing_text)
 
         print(f"処理完了: {args.file} -> {output}")
     else:
         # ディレクトリ内のすべてのPDFを処理
         output_dir = args.output if not args.overwrite else args.directory
+
+        # 進捗を記録するジャーナル
+        # （監視時は再起動後に処理済みのファイルを処理し直さないよう常に使用）
+        journal = None
+        if args.resume or args.journal or args.watch:
+            journal_path = args.journal or os.path.join(output_dir or args.directory, '.pdf_ocr_journal.jsonl')
+            journal = BatchJournal(journal_path, resume=args.resume or args.watch)
+
         batch_processor = BatchProcessor(
             args.directory,
             output_dir,
@@ -105,9 +349,111 @@ def main():
             custom_regions=args.exclude_region,
             overwrite=args.overwrite,
             max_workers=args.workers,
-            orientation=orientation
+            orientation=orientation,
+            page_window=args.page_window,
+            ocr_backend=args.ocr_backend,
+            orientation_probe=not args.full_orientation_check,
+            existing_text=args.existing_text,
+            cache=cache,
+            journal=journal,
+            preprocessor=preprocessor,
+            dpi=args.dpi,
+            adaptive_dpi=adaptive_dpi,
+            blank_threshold=args.blank_threshold,
+            instrumentation=instrumentation,
+            recursive=args.recursive,
+            exporters=exporters,
+            include_regions=args.include_region,
+            layout_blocks=args.layout_blocks,
+            tile_workers=args.tile_workers,
+            optimizer=optimizer,
+            chunk_size=args.chunk_size,
+            native_images=not args.no_native_images,
+            refiner=refiner,
+            resources=resources
         )
-        batch_processor.process_all()
+        if args.watch:
+            HotFolderWatcher(batch_processor, args.watch_interval, args.settle_time,
+                             args.max_batch_files).run()
+        else:
+            batch_processor.process_all()
+
+        if journal:
+            journal.close()
+
+    instrumentation.close()
+
+    if search_index:
+        stats = search_index.stats()
+        print(f"検索インデックス: {stats['files']} ファイル, {stats['pages']} ページ")
+        search_index.close()
+
+    # キャッシュの統計を表示（ワーカープロセスの分を含む今回の実行分）
+    # テキストを標準出力に出力した場合は標準エラー出力に表示
+    if cache:
+        stats = cache.stats()
+        hits = stats['hits'] - cache_stats['hits']
+        misses = stats['misses'] - cache_stats['misses']
+        print(f"OCRキャッシュ: ヒット {hits}, ミス {misses} "
+              f"（{stats['entries']}件, {stats['size'] / (1024 * 1024):.1f}MB）",
+              file=sys.stderr if args.text_only and not args.output else sys.stdout)
+        cache.close()
+
+def extract_text(args, exclude_config, orientation, cache, preprocessor, adaptive_dpi, instrumentation,
+                 resources):
+    """
+    --text-only の処理（ページごとに抽出したテキストを処理が終わった順に書き出す）
+
+    単一ファイルもディレクトリも BatchProcessor.iter_text で処理し、
+    エラーは出力先と混ざらないよう標準エラー出力に表示する。
+    """
+    batch_processor = BatchProcessor(
+        args.directory or os.path.dirname(os.path.abspath(args.file)),
+        language=args.language,
+        exclude_config=exclude_config,
+        exclude_top=args.exclude_top,
+        top_percentage=args.top_percentage,
+        exclude_bottom=args.exclude_bottom,
+        bottom_percentage=args.bottom_percentage,
+        custom_regions=args.exclude_region,
+        max_workers=args.workers,
+        orientation=orientation,
+        page_window=args.page_window,
+        ocr_backend=args.ocr_backend,
+        orientation_probe=not args.full_orientation_check,
+        existing_text=args.existing_text,
+        cache=cache,
+        preprocessor=preprocessor,
+        dpi=args.dpi,
+        adaptive_dpi=adaptive_dpi,
+        blank_threshold=args.blank_threshold,
+        instrumentation=instrumentation,
+        recursive=args.recursive,
+        include_regions=args.include_region,
+        layout_blocks=args.layout_blocks,
+        tile_workers=args.tile_workers,
+        native_images=not args.no_native_images,
+        resources=resources
+    )
+    pdf_files = [args.file] if args.file else None
+
+    stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    writer = TextStreamWriter(stream, args.text_format or ('text' if args.file else 'ndjson'))
+    errors = []
+    try:
+        for pdf_path, page_num, text, detected_orientation in batch_processor.iter_text(pdf_files, errors):
+            writer.write_page(pdf_path, page_num, text, detected_orientation)
+    except BrokenPipeError:
+        # 出力先のパイプが閉じられた場合（head などで途中まで読んだ場合）は終了
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    for pdf_path, error in errors:
+        print(f"エラー: {pdf_path}: {error}", file=sys.stderr)
+    if args.output:
+        print(f"テキストを出力しました: {writer.pages} ページ -> {args.output}")
 
 if __name__ == "__main__":
     main()
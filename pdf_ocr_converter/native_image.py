@@ -0,0 +1,98 @@
+"""
+スキャンしたページに埋め込まれた画像を、ページを画像化せずに直接取り出すモジュール
+"""
+import fitz  # PyMuPDF
+from PIL import Image
+
+# 画像がページ全体を覆っているとみなす、画像の表示範囲とページの端とのずれの上限（ポイント）
+PAGE_COVER_TOLERANCE = 2.0
+# 横の解像度から求めた縦の画素数と、実際の縦の画素数との差の上限（画素）
+# テキストレイヤーは横の解像度だけでページの座標に戻すため、これを超える画像は使わない
+ASPECT_TOLERANCE = 0.5
+# 要求された解像度に対してこの割合未満の画像は、要求された解像度に拡大する
+UPSCALE_THRESHOLD = 0.9
+
+def find_page_image(page):
+    """
+    ページ全体を1枚の画像だけで表示しているスキャンページの画像を探す
+
+    回転・反転せずにページ全体に表示された画像が1枚だけあり、ほかに表示される
+    内容（透明でないテキスト・図形・注釈）がないページを対象とする。
+    このツールなどが追加した透明なテキストレイヤーはあってもよい。
+
+    Args:
+        page: fitz.Page オブジェクト
+
+    Returns:
+        tuple: (画像の xref, 画像の表示範囲の fitz.Rect)（対象外のページは None）
+    """
+    if page.rotation % 360 or page.first_annot is not None:
+        return None
+
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+    xref, smask, width, height = images[0][:4]
+    if smask or page.parent.xref_get_key(xref, 'ImageMask')[1] == 'true':
+        return None
+
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+    rect, matrix = placements[0]
+    if matrix.b or matrix.c or matrix.a <= 0 or matrix.d <= 0:
+        return None
+    if any(abs(edge - page_edge) > PAGE_COVER_TOLERANCE for edge, page_edge in zip(rect, page.rect)):
+        return None
+
+    if abs(height - rect.height * width / rect.width) > ASPECT_TOLERANCE:
+        return None
+
+    # 画像以外に表示される内容がないか（レンダリングモード 3 は透明なテキスト）
+    if page.get_drawings() or any(span['type'] != 3 for span in page.get_texttrace()):
+        return None
+
+    return xref, rect
+
+def decode_page_image(page, placement, dpi):
+    """
+    find_page_image で見つけた画像をデコードし、OCRに使う解像度の PIL.Image にする
+
+    画像の元の解像度が要求された解像度の2倍以上の場合は整数分の1に縮小し、
+    要求された解像度より低い場合は要求された解像度に拡大する。それ以外は元の解像度のまま使う。
+
+    Args:
+        page: fitz.Page オブジェクト
+        placement: find_page_image の戻り値
+        dpi: 要求された解像度
+
+    Returns:
+        PIL.Image: ページ画像（画像の左上がページの左上に対応）
+        float: 画像の解像度（デコードできない画像は (None, None)）
+    """
+    xref, rect = placement
+    pixmap = fitz.Pixmap(page.parent, xref)
+    if pixmap.colorspace is None:
+        return None, None
+    if pixmap.alpha:
+        pixmap = fitz.Pixmap(pixmap, 0)
+    if pixmap.colorspace.n not in (1, 3):
+        # CMYK などは RGB に変換
+        pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+
+    mode = 'L' if pixmap.n == 1 else 'RGB'
+    image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+    pixmap = None
+
+    native_dpi = image.width * 72.0 / rect.width
+    if native_dpi >= dpi * 2:
+        image = image.reduce(int(native_dpi // dpi))
+    elif native_dpi < dpi * UPSCALE_THRESHOLD:
+        scale = dpi / native_dpi
+        image = image.resize((int(round(image.width * scale)), int(round(image.height * scale))),
+                             Image.BICUBIC)
+
+    # 縮小・拡大後の画素数から、ページの座標に対応する解像度を求める
+    image_dpi = round(image.width * 72.0 / rect.width, 2)
+    image.info['dpi'] = (image_dpi, image_dpi)
+    return image, image_dpi
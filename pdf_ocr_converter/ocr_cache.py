@@ -0,0 +1,233 @@
+"""
+OCR結果のキャッシュを管理するモジュール
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+class OCRCache:
+    """
+    OCR結果をSQLiteデータベースに保存するキャッシュ
+
+    キーは画像化したページの画素のハッシュと、言語・PSM・解像度・除外領域から作成する。
+    合計サイズが上限を超えた場合は、最後に参照された日時の古いものから削除する。
+    合計サイズは stats テーブルに保持し、保存のたびに全件を集計しない。
+    ヒット数・ミス数と参照日時はメモリ上にためておき、FLUSH_INTERVAL 回の参照ごと
+    （または保存・flush・stats の呼び出し時）にまとめてデータベースに書き込むため、
+    参照だけではデータベースへの書き込みは発生しない。ヒット数とミス数は複数のプロセスで共有される。
+    """
+    # ヒット数・ミス数と参照日時をデータベースに書き込むまでにためる参照の回数
+    FLUSH_INTERVAL = 64
+
+    def __init__(self, path, max_size=1024 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # (プロセスID, スレッドID) → 接続
+        self._conns = {}
+        # まだデータベースに書き込んでいないヒット数・ミス数と参照日時（キー → 日時）
+        self._pending_hits = 0
+        self._pending_misses = 0
+        self._pending_access = {}
+        self._pending_lock = threading.Lock()
+
+    def __getstate__(self):
+        # 接続とロックはプロセス間で共有できないため、ワーカープロセスでは作り直す
+        state = self.__dict__.copy()
+        state['_conns'] = {}
+        state['_pending_hits'] = state['_pending_misses'] = 0
+        state['_pending_access'] = {}
+        del state['_pending_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pending_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"OCRCache({self.path!r}, max_size={self.max_size})"
+
+    def _connect(self):
+        """データベースに接続する（プロセス・スレッドごとに1つの接続を使用）"""
+        owner = (os.getpid(), threading.get_ident())
+        conn = self._conns.get(owner)
+        if conn is not None:
+            return conn
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+        # 合計サイズの行がない（以前のバージョンで作成した）データベースは一度だけ集計する
+        conn.execute("INSERT OR IGNORE INTO stats SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+
+        self._conns[owner] = conn
+        return conn
+
+    @staticmethod
+    def image_digest(image):
+        """画像の画素のハッシュを計算する"""
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(image_digest, language, psm, dpi=None, exclude_regions=None, extra=None):
+        """
+        キャッシュのキーを作成する
+
+        Args:
+            image_digest: image_digest で計算した画素のハッシュ
+            language: OCRの言語
+            psm: ページセグメンテーションモード
+            dpi: 画像変換時の解像度
+            exclude_regions: 除外領域のリスト [(x1, y1, x2, y2), ...]
+            extra: その他OCR結果に影響する設定（JSONに変換できる値）
+
+        Returns:
+            str: キャッシュのキー
+        """
+        regions = [[round(float(value), 2) for value in region] for region in exclude_regions or []]
+        params = json.dumps([image_digest, language, psm, dpi, regions, extra], sort_keys=True)
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        キャッシュからOCR結果を取得する
+
+        Returns:
+            dict: OCR結果（キャッシュにない場合は None）
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+
+        with self._pending_lock:
+            if row is None:
+                self.misses += 1
+                self._pending_misses += 1
+            else:
+                self.hits += 1
+                self._pending_hits += 1
+                self._pending_access[key] = time.time()
+            pending = self._pending_hits + self._pending_misses
+
+        if pending >= self.FLUSH_INTERVAL:
+            self.flush()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, key, ocr_data):
+        """OCR結果をキャッシュに保存し、上限を超えた分を削除する"""
+        value = zlib.compress(json.dumps(ocr_data, ensure_ascii=False).encode('utf-8'))
+
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                (key, value, len(value), time.time())
+            )
+            self._add_size(conn, len(value) - (row[0] if row else 0))
+            self._write_pending(conn)
+            self._evict(conn)
+
+    def flush(self):
+        """メモリ上にためたヒット数・ミス数と参照日時をデータベースに書き込む"""
+        with self._pending_lock:
+            if not (self._pending_hits or self._pending_misses):
+                return
+        conn = self._connect()
+        with self._transaction(conn):
+            self._write_pending(conn)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        """書き込みのトランザクション（ほかのプロセスの書き込みとは順番に実行される）"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _write_pending(self, conn):
+        """ためておいたヒット数・ミス数と参照日時を書き込む（トランザクション内で呼び出す）"""
+        with self._pending_lock:
+            hits, misses, access = self._pending_hits, self._pending_misses, self._pending_access
+            self._pending_hits = self._pending_misses = 0
+            self._pending_access = {}
+
+        if hits or misses:
+            conn.executemany('UPDATE stats SET value = value + ? WHERE name = ?',
+                             [(hits, 'hits'), (misses, 'misses')])
+        if access:
+            conn.executemany('UPDATE entries SET last_access = ? WHERE key = ?',
+                             [(accessed, key) for key, accessed in access.items()])
+
+    @staticmethod
+    def _add_size(conn, delta):
+        """合計サイズを更新する"""
+        if delta:
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'size'", (delta,))
+
+    def _evict(self, conn):
+        """合計サイズが上限以下になるまで、最後に参照された日時の古いものから削除する"""
+        total = conn.execute("SELECT value FROM stats WHERE name = 'size'").fetchone()[0]
+        excess = total - self.max_size
+        if excess <= 0:
+            return
+
+        keys = []
+        removed = 0
+        for key, size in conn.execute('SELECT key, size FROM entries ORDER BY last_access'):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        conn.executemany('DELETE FROM entries WHERE key = ?', keys)
+        self._add_size(conn, -removed)
+
+    def stats(self):
+        """
+        キャッシュの統計情報を取得する
+
+        Returns:
+            dict: hits, misses（全プロセスの累計）, entries（件数）, size（合計バイト数）
+        """
+        self.flush()
+        conn = self._connect()
+        stats = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+        stats['entries'] = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return stats
+
+    def close(self):
+        """ためておいた統計を書き込み、このプロセスで開いたデータベースへの接続を閉じる"""
+        self.flush()
+        pid = os.getpid()
+        for owner in [owner for owner in self._conns if owner[0] == pid]:
+            conn = self._conns.pop(owner)
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # 別のスレッドで開いた接続は閉じられない
+                pass
@@ -1,9 +1,216 @@
 """
 OCR処理を行うモジュール
 """
+import logging
+import queue
+import threading
+from contextlib import contextmanager
 import pytesseract
-from PIL import Image, ImageDraw
+from PIL import Image
 import numpy as np
+from .preprocess import ImagePreprocessor
+from .instrumentation import Instrumentation, image_bytes
+
+logger = logging.getLogger(__name__)
+
+# tesserocr は読み込み時に Tesseract（OpenMP）のライブラリを読み込み、OpenMP はスレッド数の
+# 上限（OMP_THREAD_LIMIT）をその時にだけ参照するため、上限を設定した後で読み込めるよう
+# 最初に使う時に読み込む
+tesserocr = None
+
+def _load_tesserocr():
+    """
+    tesserocr を読み込む
+
+    Returns:
+        bool: 利用可能な場合は True
+    """
+    global tesserocr
+    if tesserocr is None:
+        try:
+            import tesserocr as module
+        except ImportError:
+            return False
+        tesserocr = module
+    return True
+
+# image_to_data の出力のうち数値として扱う列
+_TSV_INT_COLUMNS = (
+    'level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+    'left', 'top', 'width', 'height'
+)
+_TSV_COLUMNS = _TSV_INT_COLUMNS + ('conf', 'text')
+
+class PytesseractBackend:
+    """
+    pytesseract 経由で tesseract コマンドを呼び出すOCRバックエンド
+
+    呼び出しごとに画像を一時ファイルへ書き出し、tesseract プロセスを起動する。
+    """
+    name = 'pytesseract'
+
+    @staticmethod
+    def _config(psm, dpi):
+        """tesseract コマンドのオプション（解像度を指定した場合は --dpi も渡す）"""
+        config = f'--psm {psm}'
+        if dpi:
+            config += f' --dpi {int(dpi)}'
+        return config
+
+    def warm_up(self, language):
+        """呼び出しごとに tesseract を起動するため、事前に準備することはない"""
+
+    def image_to_data(self, image, language, psm, dpi=None):
+        """画像からテキストと位置情報を抽出する（pytesseract.image_to_data の出力形式）"""
+        return pytesseract.image_to_data(
+            image,
+            lang=language,
+            config=self._config(psm, dpi),
+            output_type=pytesseract.Output.DICT
+        )
+
+    def image_to_string(self, image, language, psm, dpi=None):
+        """画像からテキストのみを抽出する"""
+        return pytesseract.image_to_string(image, lang=language, config=self._config(psm, dpi))
+
+class TesserocrBackend:
+    """
+    tesserocr の常駐 Tesseract API を言語ごとにプールして再利用するOCRバックエンド
+
+    言語モデルの読み込みはインスタンス作成時の1回だけで、画像は一時ファイルを
+    介さずに画素バッファのまま渡す。同時に使用されている数だけインスタンスを作成し、
+    使い終わったインスタンスはプールに戻して次の呼び出しで再利用する。
+    """
+    name = 'tesserocr'
+
+    def __init__(self):
+        if not _load_tesserocr():
+            raise ImportError('tesserocr がインストールされていません（pip install tesserocr）')
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _acquire(self, language):
+        """指定言語の Tesseract API をプールから取り出す"""
+        with self._lock:
+            pool = self._pools.setdefault(language, queue.LifoQueue())
+
+        try:
+            api = pool.get_nowait()
+        except queue.Empty:
+            api = tesserocr.PyTessBaseAPI(lang=language)
+
+        try:
+            yield api
+        finally:
+            api.Clear()
+            pool.put(api)
+
+    def warm_up(self, language):
+        """指定言語の Tesseract API を1つ作成してプールに入れておく（言語モデルの読み込み）"""
+        with self._acquire(language):
+            pass
+
+    def _set_image(self, api, image, psm, dpi=None):
+        """
+        画像の画素バッファを Tesseract API に設定する
+
+        解像度を指定しない場合は画像に記録された解像度を使い、どちらもなければ
+        Tesseract の推定に任せる。
+        """
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB' if image.mode in ('RGBA', 'P', 'CMYK') else 'L')
+        bytes_per_pixel = 1 if image.mode == 'L' else 3
+
+        api.SetPageSegMode(psm)
+        api.SetImageBytes(
+            image.tobytes(), image.width, image.height,
+            bytes_per_pixel, bytes_per_pixel * image.width
+        )
+        if not dpi and image.info.get('dpi'):
+            dpi = image.info['dpi'][0]
+        if dpi:
+            api.SetSourceResolution(int(dpi))
+
+    def image_to_data(self, image, language, psm, dpi=None):
+        """画像からテキストと位置情報を抽出する（pytesseract.image_to_data の出力形式）"""
+        with self._acquire(language) as api:
+            self._set_image(api, image, psm, dpi)
+            api.Recognize()
+            tsv = api.GetTSVText(0)
+
+        # TSVを pytesseract.Output.DICT と同じ形式に変換
+        ocr_data = {column: [] for column in _TSV_COLUMNS}
+        for line in tsv.splitlines():
+            values = line.split('\t', len(_TSV_COLUMNS) - 1)
+            if len(values) < len(_TSV_COLUMNS):
+                continue
+            for column, value in zip(_TSV_INT_COLUMNS, values):
+                ocr_data[column].append(int(value))
+            ocr_data['conf'].append(float(values[-2]))
+            ocr_data['text'].append(values[-1])
+        return ocr_data
+
+    def image_to_string(self, image, language, psm, dpi=None):
+        """画像からテキストのみを抽出する"""
+        with self._acquire(language) as api:
+            self._set_image(api, image, psm, dpi)
+            return api.GetUTF8Text()
+
+# プロセス内で共有するOCRバックエンド（常駐エンジンを使い回すため）
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_ocr_backend(name='auto'):
+    """
+    OCRバックエンドを取得する
+
+    Args:
+        name: バックエンド名 ('auto', 'tesserocr', 'pytesseract')
+              'auto' の場合は tesserocr が利用可能ならそれを使い、なければ pytesseract を使う
+
+    Returns:
+        OCRバックエンドのインスタンス（同じプロセス内では共有される）
+    """
+    if name == 'auto':
+        name = TesserocrBackend.name if _load_tesserocr() else PytesseractBackend.name
+
+    with _backends_lock:
+        if name not in _backends:
+            if name == TesserocrBackend.name:
+                _backends[name] = TesserocrBackend()
+            elif name == PytesseractBackend.name:
+                _backends[name] = PytesseractBackend()
+            else:
+                raise ValueError(f"不明なOCRバックエンドです: {name}")
+        return _backends[name]
+
+class OrientationMemo:
+    """
+    文書内で検出されたテキストの向きを記憶するクラス
+
+    直近のページで同じ向きが続いた場合はその向きで確定し、
+    以降のページでは向きの検出を省略する。
+    """
+    def __init__(self, lock_after=3):
+        self.lock_after = lock_after
+        self.orientation = None
+        self._last = None
+        self._streak = 0
+
+    def record(self, orientation):
+        """ページで検出された向きを記録する"""
+        if self.orientation is not None:
+            return
+
+        if orientation == self._last:
+            self._streak += 1
+        else:
+            self._last = orientation
+            self._streak = 1
+
+        if self._streak >= self.lock_after:
+            self.orientation = orientation
 
 class OCREngine:
     """
@@ -13,80 +220,228 @@ class OCREngine:
     AUTO = 'auto'
     HORIZONTAL = 'horizontal'
     VERTICAL = 'vertical'
+    # 空白ページ（OCRを行わずテキストレイヤーも追加しない）
+    BLANK = 'blank'
+
+    # テキストの向きごとのページセグメンテーションモード
+    PSM = {
+        HORIZONTAL: 3,  # 3 = 自動ページセグメンテーション（横書き）
+        VERTICAL: 5,  # 5 = 縦書きテキスト
+    }
+
+    # 向きの簡易判定に使う縮小画像の長辺のピクセル数
+    PROBE_SIZE = 800
+    # 行方向と列方向の投影プロファイルの変動係数の比がこの値を超えたら向きを確定
+    PROBE_RATIO = 1.5
+    # 空白ページとみなすインクの割合のデフォルト値
+    BLANK_THRESHOLD = 0.0001
 
-    def __init__(self, language='jpn'):
+    def __init__(self, language='jpn', backend='auto', orientation_probe=True, cache=None,
+                 preprocessor=None, blank_threshold=BLANK_THRESHOLD, instrumentation=None):
         self.language = language
+        self.backend = get_ocr_backend(backend)
+        self.orientation_probe = orientation_probe
+        self.cache = cache
+        self.preprocessor = preprocessor if preprocessor else ImagePreprocessor()
+        # インクの割合がこの値未満のページは空白ページとしてOCRを省略（0 の場合は判定しない）
+        self.blank_threshold = blank_threshold
+        # 処理の段階ごとの計測
+        self.instrumentation = instrumentation or Instrumentation()
 
-    def process_image(self, image, exclude_regions=None, orientation=AUTO):
+    def process_image(self, image, exclude_regions=None, orientation=AUTO, memo=None, dpi=None):
         """
         画像からテキストを抽出する
 
+        自動判別モードでは、文書内で確定した向き（memo）、投影プロファイルによる
+        簡易判定の順に向きを決め、どちらでも決まらない場合のみ横書き・縦書きの
+        両方でOCRを行って信頼度を比較する。
+        除外領域をマスクした後の画像が空白の場合は、OCRを行わずに空の結果を返す。
+
         Args:
             image: PIL.Image オブジェクト
             exclude_regions: 除外領域のリスト [(x1, y1, x2, y2), ...]
             orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+            memo: 文書内の向きを記憶する OrientationMemo オブジェクト
+            dpi: 画像変換時の解像度（OCRエンジンに渡し、キャッシュのキーにも使用）
 
         Returns:
             dict: OCR結果（pytesseract.image_to_data の出力形式）
-            str: 検出されたテキストの向き ('horizontal' または 'vertical')
+            str: 検出されたテキストの向き ('horizontal', 'vertical' または空白ページの場合は 'blank')
         """
-        # 画像のコピーを作成
-        img_copy = image.copy()
+        # 前処理（グレースケール化・除外領域のマスク処理など）
+        with self.instrumentation.stage('preprocess') as event:
+            prepared, angle = self.preprocessor.apply(image, exclude_regions)
+            event['bytes'] = image_bytes(prepared)
 
-        # 除外領域をマスク処理
-        if exclude_regions:
-            draw = ImageDraw.Draw(img_copy)
-            for region in exclude_regions:
-                # 指定領域を白で塗りつぶし
-                draw.rectangle(region, fill="white")
+        # 空白ページはOCRを省略
+        if self.is_blank(prepared):
+            return {column: [] for column in _TSV_COLUMNS}, self.BLANK
+
+        # キャッシュのキーに使う情報（前処理前の画素のハッシュ）
+        cache_key = None
+        if self.cache is not None:
+            cache_key = (self.cache.image_digest(image), dpi, exclude_regions,
+                         self.preprocessor.signature())
 
         # テキストの向きに基づいて処理
         if orientation == self.AUTO:
             # 自動判別モード
-            horizontal_data = self._process_with_orientation(img_copy, self.HORIZONTAL)
-            vertical_data = self._process_with_orientation(img_copy, self.VERTICAL)
-
-            # 信頼度スコアを計算して比較
-            horizontal_score = self._calculate_confidence_score(horizontal_data)
-            vertical_score = self._calculate_confidence_score(vertical_data)
+            detected = memo.orientation if memo else None
+            if detected is None and self.orientation_probe:
+                detected = self.classify_orientation(prepared)
 
-            print(f"横書き信頼度: {horizontal_score:.2f}, 縦書き信頼度: {vertical_score:.2f}")
-
-            if vertical_score > horizontal_score:
-                return vertical_data, self.VERTICAL
+            if detected is None:
+                ocr_data, detected = self._compare_orientations(prepared, cache_key, dpi)
             else:
-                return horizontal_data, self.HORIZONTAL
+                ocr_data = self._process_with_orientation(prepared, detected, cache_key, dpi)
+
+            if memo:
+                memo.record(detected)
         else:
             # 指定された向きで処理
-            ocr_data = self._process_with_orientation(img_copy, orientation)
-            return ocr_data, orientation
+            ocr_data = self._process_with_orientation(prepared, orientation, cache_key, dpi)
+            detected = orientation
+
+        # 傾き補正した場合は元の画像の座標に戻す
+        self.preprocessor.restore_coordinates(ocr_data, angle, prepared.size)
+        return ocr_data, detected
+
+    def _compare_orientations(self, image, cache_key=None, dpi=None):
+        """
+        横書き・縦書きの両方でOCRを行い、信頼度の高い方を採用する
+
+        Args:
+            image: PIL.Image オブジェクト
+            cache_key: キャッシュのキーに使う情報 (画素のハッシュ, 解像度, 除外領域, 前処理の設定)
+            dpi: 画像の解像度（None の場合は Tesseract の推定）
+
+        Returns:
+            dict: OCR結果
+            str: 検出されたテキストの向き ('horizontal' または 'vertical')
+        """
+        horizontal_data = self._process_with_orientation(image, self.HORIZONTAL, cache_key, dpi)
+        vertical_data = self._process_with_orientation(image, self.VERTICAL, cache_key, dpi)
+
+        # 信頼度スコアを計算して比較
+        horizontal_score = self._calculate_confidence_score(horizontal_data)
+        vertical_score = self._calculate_confidence_score(vertical_data)
+
+        logger.debug("横書き信頼度: %.2f, 縦書き信頼度: %.2f", horizontal_score, vertical_score)
+
+        if vertical_score > horizontal_score:
+            return vertical_data, self.VERTICAL
+        else:
+            return horizontal_data, self.HORIZONTAL
 
-    def _process_with_orientation(self, image, orientation):
+    def is_blank(self, image):
+        """
+        画像が空白（またはごく小さな汚れだけ）かを判定する
+
+        画像をブロックに分割して暗い画素を含むブロックをインクとし、上下左右に
+        隣接するインクのブロックがない孤立点はスキャン時の汚れとみなして数えない。
+        残ったインクのブロックの割合が blank_threshold 未満であれば空白とする。
+
+        Args:
+            image: PIL.Image オブジェクト（除外領域をマスクした画像）
+
+        Returns:
+            bool: 空白の場合は True
+        """
+        if not self.blank_threshold:
+            return False
+
+        # ブロック内の最も暗い画素で縮小（平均で縮小すると細い線が薄くなるため）
+        factor = max(1, max(image.size) // self.PROBE_SIZE)
+        pixels = np.asarray(image.convert('L'))
+        height, width = pixels.shape[0] // factor, pixels.shape[1] // factor
+        pixels = pixels[:height * factor, :width * factor]
+        # ブロック内の同じ位置の画素からなる間引き画像の最小値をとる
+        ink = np.minimum.reduce([
+            pixels[y::factor, x::factor] for y in range(factor) for x in range(factor)
+        ]) < 128
+
+        # 隣接するインクのブロックがあるものだけを残す
+        neighbors = np.zeros_like(ink)
+        neighbors[1:, :] |= ink[:-1, :]
+        neighbors[:-1, :] |= ink[1:, :]
+        neighbors[:, 1:] |= ink[:, :-1]
+        neighbors[:, :-1] |= ink[:, 1:]
+
+        return (ink & neighbors).mean() < self.blank_threshold
+
+    def classify_orientation(self, image):
+        """
+        縮小画像の投影プロファイルからテキストの向きを簡易判定する
+
+        横書きのページは行間の空白により行方向（縦軸）の投影が大きく変動し、
+        縦書きのページは列間の空白により列方向（横軸）の投影が大きく変動する。
+        両者の変動係数の比が閾値を超えない場合は判定できないものとする。
+
+        Args:
+            image: PIL.Image オブジェクト
+
+        Returns:
+            str: 判定されたテキストの向き（判定できない場合は None）
+        """
+        # 縮小してグレースケール化
+        factor = max(1, max(image.size) // self.PROBE_SIZE)
+        small = np.asarray(image.reduce(factor).convert('L'))
+
+        # 背景より十分に暗い画素をインクとみなす
+        ink = small < small.mean() * 0.7
+        if ink.mean() < 0.001:
+            return None
+
+        rows = ink.sum(axis=1).astype(np.float64)
+        cols = ink.sum(axis=0).astype(np.float64)
+
+        def variation(profile):
+            # インクのある範囲だけを対象に変動係数を計算
+            nonzero = np.flatnonzero(profile)
+            span = profile[nonzero[0]:nonzero[-1] + 1]
+            return span.std() / span.mean()
+
+        row_variation = variation(rows)
+        col_variation = variation(cols)
+
+        if row_variation > col_variation * self.PROBE_RATIO:
+            return self.HORIZONTAL
+        if col_variation > row_variation * self.PROBE_RATIO:
+            return self.VERTICAL
+        return None
+
+    def _process_with_orientation(self, image, orientation, cache_key=None, dpi=None):
         """
         指定された向きでOCR処理を行う
 
         Args:
             image: PIL.Image オブジェクト
             orientation: テキストの向き ('horizontal' または 'vertical')
+            cache_key: キャッシュのキーに使う情報 (画素のハッシュ, 解像度, 除外領域, 前処理の設定)
+                       None の場合はキャッシュを使用しない
+            dpi: 画像の解像度（None の場合は Tesseract の推定）
 
         Returns:
             dict: OCR結果
         """
-        # PSMの設定
-        config = ''
-        if orientation == self.HORIZONTAL:
-            config = '--psm 3'  # 3 = 自動ページセグメンテーション（横書き）
-        else:
-            config = '--psm 5'  # 5 = 縦書きテキスト
+        psm = self.PSM[orientation]
+
+        # キャッシュにあればOCRを省略
+        key = None
+        if cache_key is not None:
+            image_digest, key_dpi, exclude_regions, preprocess = cache_key
+            key = self.cache.make_key(image_digest, self.language, psm, key_dpi, exclude_regions, preprocess)
+            ocr_data = self.cache.get(key)
+            if ocr_data is not None:
+                return ocr_data
 
         # OCRでテキストと位置情報を抽出
-        ocr_data = pytesseract.image_to_data(
-            image,
-            lang=self.language,
-            config=config,
-            output_type=pytesseract.Output.DICT
-        )
+        with self.instrumentation.stage('ocr', orientation=orientation, psm=psm) as event:
+            ocr_data = self.backend.image_to_data(image, self.language, psm, dpi)
+            event['words'] = sum(1 for text in ocr_data['text'] if text.strip())
 
+        if key is not None:
+            self.cache.put(key, ocr_data)
         return ocr_data
 
     def _calculate_confidence_score(self, ocr_data):
@@ -117,45 +472,65 @@ class OCREngine:
             return avg_confidence * np.log1p(text_amount)
         return 0.0
 
-    def get_text_only(self, image, exclude_regions=None, orientation=AUTO):
+    def get_text_only(self, image, exclude_regions=None, orientation=AUTO, memo=None, dpi=None):
         """
         画像からテキストのみを抽出する（位置情報なし）
 
+        自動判別モードでは process_image と同じく、文書内で確定した向き（memo）、
+        投影プロファイルによる簡易判定の順に向きを決め、どちらでも決まらない場合のみ
+        横書き・縦書きの両方でOCRを行ってテキスト量を比較する。
+
         Args:
             image: PIL.Image オブジェクト
             exclude_regions: 除外領域のリスト [(x1, y1, x2, y2), ...]
             orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+            memo: 文書内の向きを記憶する OrientationMemo オブジェクト
+            dpi: 画像変換時の解像度（None の場合は Tesseract の推定）
 
         Returns:
             str: 抽出されたテキスト
-            str: 検出されたテキストの向き ('horizontal' または 'vertical')
+            str: 検出されたテキストの向き ('horizontal', 'vertical' または空白ページの場合は 'blank')
         """
-        # 画像のコピーを作成
-        img_copy = image.copy()
+        # 前処理（グレースケール化・除外領域のマスク処理など）
+        with self.instrumentation.stage('preprocess') as event:
+            img_copy, _ = self.preprocessor.apply(image, exclude_regions)
+            event['bytes'] = image_bytes(img_copy)
 
-        # 除外領域をマスク処理
-        if exclude_regions:
-            draw = ImageDraw.Draw(img_copy)
-            for region in exclude_regions:
-                # 指定領域を白で塗りつぶし
-                draw.rectangle(region, fill="white")
+        # 空白ページはOCRを省略
+        if self.is_blank(img_copy):
+            return "", self.BLANK
 
         # テキストの向きに基づいて処理
         if orientation == self.AUTO:
             # 自動判別モード
-            config_h = '--psm 3'  # 横書き
-            config_v = '--psm 5'  # 縦書き
+            detected = memo.orientation if memo else None
+            if detected is None and self.orientation_probe:
+                detected = self.classify_orientation(img_copy)
 
-            text_h = pytesseract.image_to_string(img_copy, lang=self.language, config=config_h)
-            text_v = pytesseract.image_to_string(img_copy, lang=self.language, config=config_v)
+            if detected is None:
+                text_h = self._string_with_orientation(img_copy, self.HORIZONTAL, dpi)
+                text_v = self._string_with_orientation(img_copy, self.VERTICAL, dpi)
 
-            # 簡易的な判定（テキスト量で比較）
-            if len(text_v.strip()) > len(text_h.strip()) * 1.2:  # 縦書きの方が20%以上多い場合
-                return text_v, self.VERTICAL
+                # 簡易的な判定（テキスト量で比較）
+                if len(text_v.strip()) > len(text_h.strip()) * 1.2:  # 縦書きの方が20%以上多い場合
+                    text, detected = text_v, self.VERTICAL
+                else:
+                    text, detected = text_h, self.HORIZONTAL
             else:
-                return text_h, self.HORIZONTAL
+                text = self._string_with_orientation(img_copy, detected, dpi)
+
+            if memo:
+                memo.record(detected)
+            return text, detected
         else:
             # 指定された向きで処理
-            config = '--psm 3' if orientation == self.HORIZONTAL else '--psm 5'
-            text = pytesseract.image_to_string(img_copy, lang=self.language, config=config)
+            text = self._string_with_orientation(img_copy, orientation, dpi)
             return text, orientation
+
+    def _string_with_orientation(self, image, orientation, dpi=None):
+        """指定された向きでテキストのみを抽出する"""
+        psm = self.PSM[orientation]
+        with self.instrumentation.stage('ocr', orientation=orientation, psm=psm) as event:
+            text = self.backend.image_to_string(image, self.language, psm, dpi)
+            event['chars'] = len(text.strip())
+        return text
@@ -0,0 +1,208 @@
+"""
+出力するPDFのサイズを小さくするモジュール
+"""
+import inspect
+import io
+import os
+import shutil
+import subprocess
+import zlib
+import fitz  # PyMuPDF
+from PIL import Image
+
+class PDFOptimizer:
+    """
+    PDFの保存時にサイズを小さくする設定と処理をまとめたクラス
+
+    重複したオブジェクトの統合と未使用オブジェクトの削除（garbage）、ストリームの
+    deflate 圧縮、オブジェクトストリームの使用に加え、指定した解像度より細かい
+    スキャン画像の縮小・再圧縮と、Web表示用の線形化を行う。
+    テキストレイヤーのフォントのサブセット化は PDFProcessor がテキストレイヤーの
+    追加時に行う。
+    """
+    # 画像の再圧縮の形式
+    JPEG = 'jpeg'  # DCTDecode（非可逆）
+    FLATE = 'flate'  # FlateDecode（可逆）
+
+    # 目標の解像度をこの割合以上超える画像だけを縮小する
+    IMAGE_DPI_TOLERANCE = 1.1
+
+    def __init__(self, garbage=3, deflate=True, linearize=False, image_dpi=None,
+                 image_format=JPEG, jpeg_quality=75):
+        """
+        Args:
+            garbage: 不要なオブジェクトの削除の程度（PyMuPDF の garbage、3 で重複オブジェクトを統合）
+            deflate: 圧縮されていないストリームを deflate で圧縮するか
+            linearize: Web表示用に線形化するか（PyMuPDF が対応していない場合は qpdf を使用）
+            image_dpi: スキャン画像の解像度の上限（None の場合は画像を再圧縮しない）
+            image_format: 縮小した画像の圧縮形式（'jpeg' または 'flate'）
+            jpeg_quality: JPEG の品質（1〜95）
+        """
+        if image_format not in (self.JPEG, self.FLATE):
+            raise ValueError(f"不明な画像の圧縮形式です: {image_format}")
+        self.garbage = garbage
+        self.deflate = deflate
+        self.linearize = linearize
+        self.image_dpi = image_dpi
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+
+    def __repr__(self):
+        return (f"PDFOptimizer(garbage={self.garbage}, deflate={self.deflate}, "
+                f"linearize={self.linearize}, image_dpi={self.image_dpi}, "
+                f"image_format={self.image_format!r}, jpeg_quality={self.jpeg_quality})")
+
+    def optimize_images(self, doc):
+        """
+        解像度が image_dpi を超える画像を縮小して再圧縮する
+
+        白黒2値の画像（CCITT・JBIG2 など）と透明度のある画像は対象外とし、
+        再圧縮してもサイズが小さくならない画像は元のままにする。
+        複数のページで共有されている画像は、最も大きく表示される箇所の解像度で判定する。
+
+        Args:
+            doc: fitz.Document オブジェクト
+
+        Returns:
+            int: 再圧縮した画像の数
+        """
+        if not self.image_dpi:
+            return 0
+
+        # xref → [ページ番号, 幅, 高さ, 表示される最大の幅, 最大の高さ（ポイント）]
+        images = {}
+        for page in doc:
+            for xref, smask, width, height, bpc, _, _, _, _, _ in page.get_images(full=True):
+                if smask or bpc == 1:
+                    continue
+                image = images.setdefault(xref, [page.number, width, height, 0, 0])
+                for rect in page.get_image_rects(xref):
+                    image[3] = max(image[3], rect.width)
+                    image[4] = max(image[4], rect.height)
+
+        replaced = 0
+        for xref, (page_num, width, height, display_width, display_height) in images.items():
+            size = self._target_size(width, height, display_width, display_height)
+            if size is None:
+                continue
+
+            if self._recompress(doc, xref, size):
+                replaced += 1
+
+        return replaced
+
+    def _target_size(self, width, height, display_width, display_height):
+        """
+        画像を縮小する場合の画素数を求める
+
+        Returns:
+            tuple: (幅, 高さ)（縮小する必要がない場合は None）
+        """
+        if display_width <= 0 or display_height <= 0:
+            return None
+
+        dpi = min(width / (display_width / 72.0), height / (display_height / 72.0))
+        if dpi <= self.image_dpi * self.IMAGE_DPI_TOLERANCE:
+            return None
+
+        scale = self.image_dpi / dpi
+        return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    def _recompress(self, doc, xref, size):
+        """
+        画像を指定した画素数に縮小して圧縮し、画像のストリームを置き換える
+
+        画像を参照しているページはそのままで、同じ xref の内容だけを書き換える。
+
+        Returns:
+            bool: 置き換えた場合は True（変換できない場合やサイズが小さくならない場合は False）
+        """
+        pixmap = fitz.Pixmap(doc, xref)
+        if pixmap.alpha or pixmap.colorspace is None:
+            return False
+        if pixmap.colorspace.n not in (1, 3):
+            # CMYK などは RGB に変換
+            pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+
+        mode = 'L' if pixmap.n == 1 else 'RGB'
+        image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+        image = image.resize(size, Image.LANCZOS)
+
+        if self.image_format == self.JPEG:
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            data = buffer.getvalue()
+        else:
+            data = zlib.compress(image.tobytes(), 9)
+        if len(data) >= len(doc.xref_stream_raw(xref)):
+            return False
+
+        doc.update_stream(xref, data, compress=False)
+        doc.xref_set_key(xref, 'Filter', '/DCTDecode' if self.image_format == self.JPEG else '/FlateDecode')
+        doc.xref_set_key(xref, 'Width', str(image.width))
+        doc.xref_set_key(xref, 'Height', str(image.height))
+        doc.xref_set_key(xref, 'BitsPerComponent', '8')
+        doc.xref_set_key(xref, 'ColorSpace', '/DeviceGray' if mode == 'L' else '/DeviceRGB')
+        for key in ('DecodeParms', 'Decode', 'Intent'):
+            doc.xref_set_key(xref, key, 'null')
+        return True
+
+    def save(self, doc, path):
+        """
+        最適化した設定でPDFを保存する
+
+        Args:
+            doc: fitz.Document オブジェクト
+            path: 保存先のパス
+        """
+        options = {
+            'garbage': self.garbage,
+            'deflate': self.deflate,
+            'deflate_images': self.deflate,
+            'deflate_fonts': self.deflate,
+            'encryption': fitz.PDF_ENCRYPT_KEEP,
+        }
+        # オブジェクトストリームは PyMuPDF 1.24 以降で使用可能
+        if 'use_objstms' in inspect.signature(doc.save).parameters:
+            options['use_objstms'] = 1
+
+        if not self.linearize:
+            doc.save(path, **options)
+            return
+
+        try:
+            doc.save(path, linear=True, **options)
+        except (RuntimeError, ValueError):
+            # PyMuPDF 1.23 以降は線形化に対応していないため qpdf で線形化
+            doc.save(path, **options)
+            self._linearize_with_qpdf(path)
+
+    def _linearize_with_qpdf(self, path):
+        """qpdf コマンドでPDFを線形化する（qpdf がない場合は警告を表示して線形化しない）"""
+        qpdf = shutil.which('qpdf')
+        if qpdf is None:
+            print("警告: 線形化には qpdf が必要です（線形化せずに保存しました）")
+            return
+
+        linear_path = path + '.linear'
+        try:
+            subprocess.run([qpdf, '--linearize', path, linear_path], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            os.replace(linear_path, path)
+        except subprocess.CalledProcessError as e:
+            # qpdf は警告がある場合に終了コード 3 で終了するが、出力は使用できる
+            if e.returncode == 3 and os.path.exists(linear_path):
+                os.replace(linear_path, path)
+            else:
+                print(f"警告: 線形化に失敗しました: {e.stderr.decode(errors='replace').strip()}")
+        finally:
+            if os.path.exists(linear_path):
+                os.remove(linear_path)
+
+def format_size(size):
+    """バイト数を読みやすい単位の文字列にする"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}GB"
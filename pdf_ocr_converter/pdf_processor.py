@@ -1,119 +1,1171 @@
 """
 PDFの処理を行うモジュール
 """
+import itertools
+import logging
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import fitz  # PyMuPDF
 from pdf2image import convert_from_path
 from PIL import Image
-from .ocr_engine import OCREngine
+from .ocr_engine import OCREngine, OrientationMemo, _TSV_COLUMNS
 from .region_selector import RegionSelector
+from .layout import find_text_blocks
+from .native_image import find_page_image, decode_page_image
+from .instrumentation import Instrumentation, image_bytes
+from .exports import read_pages
+from .pdf_optimizer import format_size
+from .journal import ChunkCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# テキストレイヤーに使用するフォント（日本語を含むため CJK フォントを使用）
+_text_layer_font = None
+
+# フォントサイズに対するベースラインから全角文字の中心までの距離の2倍
+_EM_BOX_CENTER = 0.76
+
+def _get_text_layer_font():
+    """テキストレイヤー用のフォントを取得（プロセス内で共有）"""
+    global _text_layer_font
+    if _text_layer_font is None:
+        try:
+            _text_layer_font = fitz.Font('cjk')
+        except RuntimeError:
+            # CJK フォントを含まない PyMuPDF の場合
+            _text_layer_font = fitz.Font('helv')
+    return _text_layer_font
+
+# ワーカープロセス内で再利用する PDFProcessor（(入力PDF, 処理オプション) ごと）
+# 文書内で確定したテキストの向きなど、同じ文書のページ間で共有する状態を保持する
+_worker_processors = {}
+_MAX_WORKER_PROCESSORS = 8
+
+def ocr_page_task(task):
+    """
+    ワーカープロセスで1ページ分の画像化とOCR処理を行う
+
+    Args:
+        task: 処理内容の辞書
+              （input_pdf, options, page_num, exclude_regions, dpi, orientation, instrument, text_only）
+              options は PDFProcessor のコンストラクタに渡すキーワード引数
+              instrument が True の場合は処理の段階ごとの計測を行う
+              text_only が True の場合は位置情報なしでテキストだけを抽出する
+
+    Returns:
+        dict: ページのOCR結果（page_num, ocr_data, orientation, dpi）
+              text_only の場合は ocr_data の代わりに text を格納する
+              計測を行った場合は、記録したイベントのリストを events に格納する
+    """
+    key = (task['input_pdf'], repr(sorted(task['options'].items())))
+    processor = _worker_processors.get(key)
+    if processor is None:
+        if len(_worker_processors) >= _MAX_WORKER_PROCESSORS:
+            _worker_processors.clear()
+        processor = PDFProcessor(task['input_pdf'], **task['options'])
+        _worker_processors[key] = processor
+
+    ocr_page = processor.ocr_page_text if task.get('text_only') else processor.ocr_page
+    try:
+        if not task.get('instrument'):
+            return ocr_page(task['page_num'], task['exclude_regions'], task['dpi'], task['orientation'])
+
+        # 記録したイベントは親プロセスでシンクに渡す
+        with processor.instrumentation.collect() as events:
+            result = ocr_page(task['page_num'], task['exclude_regions'], task['dpi'], task['orientation'])
+        result['events'] = events
+        return result
+    finally:
+        # ワーカープロセスは終了時に close されないため、ページごとにキャッシュの統計を書き込む
+        if processor.cache is not None:
+            processor.cache.flush()
+
+class ProcessingCancelled(Exception):
+    """処理が中止された場合に送出される例外"""
 
 class PDFProcessor:
     """
     PDFの処理を行うクラス
     """
-    def __init__(self, input_pdf, output_pdf=None, language='jpn'):
+    # 既存テキストのあるページの扱い
+    EXISTING_TEXT_ALL = 'all'  # すべてのページをOCR（以前に追加したテキストレイヤーは置き換え）
+    EXISTING_TEXT_SKIP = 'skip'  # テキストのあるページ（以前に追加したレイヤーを含む）はスキップ
+    EXISTING_TEXT_REDO = 'redo'  # 元からテキストのあるページはスキップし、以前に追加したレイヤーは置き換え
+
+    # このツールが追加したテキストレイヤーのコンテンツストリームを記録するページ辞書のキー
+    TEXT_LAYER_KEY = 'PDFOCRConverterTextLayer'
+
+    # 一度に画像化するページ数のデフォルト値（300dpi のページ画像が数十MBになるため少数に抑える）
+    DEFAULT_PAGE_WINDOW = 4
+
+    def __init__(self, input_pdf, output_pdf=None, language='jpn', ocr_backend='auto',
+                 orientation_probe=True, cache=None, preprocessor=None, adaptive_dpi=None,
+                 blank_threshold=OCREngine.BLANK_THRESHOLD, tile_workers=1, instrumentation=None,
+                 exporters=None, optimizer=None, native_images=True, refiner=None, resources=None):
         self.input_pdf = input_pdf
         self.output_pdf = output_pdf if output_pdf else input_pdf
         self.language = language
-        self.ocr_engine = OCREngine(language)
+        self.ocr_backend = ocr_backend
+        self.orientation_probe = orientation_probe
+        self.cache = cache
+        self.preprocessor = preprocessor
+        # ページごとに解像度を選択する AdaptiveDPI オブジェクト（None の場合は固定の解像度）
+        self.adaptive_dpi = adaptive_dpi
+        self.blank_threshold = blank_threshold
+        # ページをタイルに切り出して処理する場合に、1ページのタイルを並行して処理するスレッド数
+        self.tile_workers = tile_workers
+        # 1枚の画像だけのスキャンページは、ページを画像化せずに埋め込まれた画像を直接取り出すか
+        self.native_images = native_images
+        # 信頼度の低い行だけを高い解像度で処理し直す ConfidenceRefiner オブジェクト（None の場合は処理し直さない）
+        self.refiner = refiner
+        # 処理の段階ごとの計測（イベントには入力ファイルのパスを付加）
+        self.instrumentation = (instrumentation or Instrumentation()).bind(file=input_pdf)
+        # 保存したPDFのページごとのテキストを書き出す出力処理
+        # （SidecarExporter, SearchIndex など export(pdf_path, pages) を持つオブジェクトのリスト）
+        self.exporters = list(exporters or [])
+        # 保存時にPDFのサイズを小さくする PDFOptimizer オブジェクト（None の場合は通常の保存）
+        self.optimizer = optimizer
+        # ワーカー数と Tesseract のスレッド数を CPU数・メモリの上限に合わせる
+        # ResourceBudget オブジェクト（None の場合は指定されたワーカー数で処理）
+        self.resources = resources
+        # 直前の apply_results で保存したPDFのサイズ（入力のバイト数, 出力のバイト数）
+        self.sizes = None
+        self.ocr_engine = OCREngine(language, ocr_backend, orientation_probe, cache, preprocessor,
+                                    blank_threshold, self.instrumentation)
+        # 文書内で検出されたテキストの向き
+        self.orientation_memo = OrientationMemo() if orientation_probe else None
 
-    def process(self, exclude_regions=None, dpi=300, orientation=OCREngine.AUTO):
+    @property
+    def options(self):
+        """ワーカープロセスで同じ設定の PDFProcessor を作成するためのキーワード引数"""
+        return {
+            'language': self.language,
+            'ocr_backend': self.ocr_backend,
+            'orientation_probe': self.orientation_probe,
+            'cache': self.cache,
+            'preprocessor': self.preprocessor,
+            'adaptive_dpi': self.adaptive_dpi,
+            'blank_threshold': self.blank_threshold,
+            'tile_workers': self.tile_workers,
+            'native_images': self.native_images,
+            'refiner': self.refiner,
+        }
+
+    def process(self, exclude_regions=None, dpi=300, orientation=OCREngine.AUTO,
+                page_window=None, workers=1, existing_text=EXISTING_TEXT_ALL, cancel_event=None,
+                chunk_size=None):
         """
         PDFを処理し、検索可能なテキストレイヤーを追加する
 
+        chunk_size を指定した場合は、chunk_size ページごとに作業ファイルへ追記保存し、
+        中断した場合は次回の実行で保存済みのページの続きから処理する。
+
+        Args:
+            exclude_regions: RegionSelector オブジェクト
+            dpi: 画像変換時の解像度（解像度を自動選択する場合は、除外領域のピクセル座標の基準となる解像度）
+            orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+            page_window: 一度に画像化するページ数（None の場合は DEFAULT_PAGE_WINDOW、
+                         0 の場合は全ページを一括で画像化）
+            workers: ページ単位でOCRを並列実行するプロセス数（1 の場合は逐次処理）
+            existing_text: 既存テキストのあるページの扱い ('all', 'skip', 'redo')
+            cancel_event: 処理を中止するための threading.Event（ページごとに確認し、
+                          セットされていれば出力を保存せずに ProcessingCancelled を送出）
+            chunk_size: 作業ファイルに追記保存するページ数の単位（None の場合は最後に一度だけ保存）
+                        page_window が None の場合は chunk_size ページずつ画像化する
+
+        Returns:
+            dict: 処理結果の集計（pages: 総ページ数, ocr: OCRしたページ数, skipped: スキップしたページ数,
+                  blank: 空白のためテキストレイヤーを追加しなかったページ数）
+        """
+        with self.instrumentation.stage('file') as event:
+            # OCRするページを選択
+            page_nums, page_count = self.select_pages(existing_text)
+            skipped = page_count - len(page_nums)
+
+            # 作業ファイルに保存済みのページは処理しない
+            checkpoint = None
+            if chunk_size:
+                checkpoint = ChunkCheckpoint(self.input_pdf, self.output_pdf, chunk_size)
+                if checkpoint.load():
+                    print(f"前回の処理を再開します（保存済み: {len(checkpoint.pages)} ページ）")
+                    page_nums = [page_num for page_num in page_nums if page_num not in checkpoint.pages]
+                else:
+                    checkpoint.start()
+                if page_window is None:
+                    page_window = chunk_size
+            if page_window is None:
+                page_window = self.DEFAULT_PAGE_WINDOW
+
+            # OCR結果をページ順に受け取り、テキストレイヤーを追加して保存
+            if workers and workers > 1 and len(page_nums) > 1:
+                results = self._iter_results_parallel(
+                    page_nums, exclude_regions, dpi, orientation, workers, cancel_event
+                )
+            else:
+                results = self._iter_results_serial(
+                    page_nums, exclude_regions, dpi, orientation, page_window, cancel_event
+                )
+
+            blank = self.apply_results(results, checkpoint)
+            event.update({'pages': len(page_nums), 'blank': blank})
+
+        if skipped:
+            print(f"既存のテキストがあるため {skipped} ページをスキップしました")
+        if blank:
+            print(f"空白のため {blank} ページのOCRを省略しました")
+        if self.optimizer and self.sizes:
+            input_size, output_size = self.sizes
+            print(f"ファイルサイズ: {format_size(input_size)} -> {format_size(output_size)}"
+                  f"（{(output_size - input_size) / max(input_size, 1):+.1%}）")
+
+        return {'pages': page_count, 'ocr': len(page_nums) - blank, 'skipped': skipped, 'blank': blank}
+
+    def iter_text(self, exclude_regions=None, dpi=300, orientation=OCREngine.AUTO,
+                  page_window=1, workers=1, existing_text=EXISTING_TEXT_ALL, cancel_event=None):
+        """
+        PDFを保存せずに、ページごとのテキストだけを抽出する
+
+        OCREngine.get_text_only で位置情報なしのテキストを抽出し、ページの処理が
+        終わるたびにページ順に返す。テキストレイヤーの追加と保存は行わない。
+        OCRしないページ（existing_text でスキップしたページ）はPDFにあるテキストを返す。
+        解像度を自動選択する場合も、信頼度による再処理は行わない。
+
         Args:
             exclude_regions: RegionSelector オブジェクト
             dpi: 画像変換時の解像度
             orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+            page_window: 一度に画像化するページ数（最初のページの結果を早く返すため、デフォルトは 1）
+            workers: ページ単位でOCRを並列実行するプロセス数（1 の場合は逐次処理）
+            existing_text: 既存テキストのあるページの扱い ('all', 'skip', 'redo')
+            cancel_event: 処理を中止するための threading.Event
+
+        Yields:
+            tuple: (ページ番号（0始まり）, テキスト, テキストの向き)
+                   向きは 'horizontal', 'vertical', 空白ページは 'blank'、
+                   PDFにあるテキストを返したページは None
+        """
+        page_nums, page_count = self.select_pages(existing_text)
+        if workers and workers > 1 and len(page_nums) > 1:
+            results = self._iter_results_parallel(
+                page_nums, exclude_regions, dpi, orientation, workers, cancel_event, text_only=True
+            )
+        else:
+            results = self._iter_results_serial(
+                page_nums, exclude_regions, dpi, orientation, page_window, cancel_event, text_only=True
+            )
+
+        ocr_pages = set(page_nums)
+        try:
+            with fitz.open(self.input_pdf) as doc:
+                for page_num in range(page_count):
+                    if page_num in ocr_pages:
+                        result = next(results)
+                        yield result['page_num'], result['text'], result['orientation']
+                    else:
+                        yield page_num, doc[page_num].get_text().rstrip(), None
+        finally:
+            results.close()
+
+    def select_pages(self, existing_text=EXISTING_TEXT_ALL):
+        """
+        既存のテキストを確認し、OCRするページを選択する
+
+        ページの画像化の前に PyMuPDF でテキストの有無と、このツールが
+        追加したテキストレイヤーの記録を確認する。
+
+        Args:
+            existing_text: 既存テキストのあるページの扱い ('all', 'skip', 'redo')
+
+        Returns:
+            list: OCRするページ番号（0始まり）のリスト
+            int: PDFの総ページ数
+        """
+        with fitz.open(self.input_pdf) as doc:
+            page_count = doc.page_count
+            if existing_text == self.EXISTING_TEXT_ALL:
+                return list(range(page_count)), page_count
+
+            page_nums = []
+            for page in doc:
+                if self._get_text_layer_xrefs(doc, page):
+                    # 以前にこのツールで追加したテキストレイヤーがあるページ
+                    if existing_text == self.EXISTING_TEXT_REDO:
+                        page_nums.append(page.number)
+                elif not page.get_text('text').strip():
+                    # テキストのない画像のみのページ
+                    page_nums.append(page.number)
+
+        return page_nums, page_count
+
+    def apply_results(self, results, checkpoint=None):
+        """
+        ページごとのOCR結果からテキストレイヤーを追加し、PDFを保存する
+
+        以前にこのツールで追加したテキストレイヤーがあるページは、
+        重ねずに新しいテキストレイヤーで置き換える。
+        保存は同じディレクトリの一時ファイルに行ってから出力先に置き換えるため、
+        途中で中断されても書きかけのPDFが出力先に残ることはない。
+        出力処理（exporters）が指定されている場合は、保存後にページごとのテキストを渡す。
+        optimizer が指定されている場合は、上書きの場合も追記保存せずにファイル全体を
+        最適化して書き直す。
+
+        Args:
+            results: ページのOCR結果（ocr_page の戻り値）をページ順に並べたイテラブル
+            checkpoint: ChunkCheckpoint オブジェクト（指定した場合は数ページずつ作業ファイルに保存）
+
+        Returns:
+            int: 空白のためテキストレイヤーを追加しなかったページ数
         """
-        # PDFを画像に変換
-        pages = convert_from_path(self.input_pdf, dpi=dpi)
+        if checkpoint is not None:
+            return self._apply_results_chunked(results, checkpoint)
 
-        # 元のPDFを開く
-        doc = fitz.open(self.input_pdf)
+        in_place = self.input_pdf == self.output_pdf
+        # 最適化する場合は不要なオブジェクトを削除するためファイル全体を書き直す
+        incremental = in_place and not self.optimizer
+        input_size = os.path.getsize(self.input_pdf)
+        self.sizes = None
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.' + os.path.basename(self.output_pdf) + '.',
+            suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(self.output_pdf))
+        )
+        os.close(fd)
 
-        # 各ページを処理
-        for page_num, page_image in enumerate(pages):
-            # 現在のページを取得
+        try:
+            if incremental:
+                # 上書きの場合は元のファイルのコピーに追記保存する
+                shutil.copyfile(self.input_pdf, temp_path)
+                doc = fitz.open(temp_path)
+            else:
+                doc = fitz.open(self.input_pdf)
+
+            # 出力処理に渡すOCR結果（ページ番号 → OCR結果）
+            page_results = {} if self.exporters else None
+            try:
+                changed, blank = self._add_text_layers(doc, results, page_results)
+
+                # テキストレイヤーのフォントを使用している文字だけに絞り込む
+                if changed:
+                    self._subset_fonts(doc)
+
+                # 解像度の高すぎる画像を縮小
+                if self.optimizer and (changed or not in_place):
+                    with self.instrumentation.stage('optimize_images') as event:
+                        event['images'] = self.optimizer.optimize_images(doc)
+
+                # PDFを保存（上書きで変更がなければ保存しない）
+                with self.instrumentation.stage('save') as event:
+                    if in_place and not changed:
+                        pass
+                    elif self.optimizer:
+                        # 最適化して保存
+                        self.optimizer.save(doc, temp_path)
+                    elif in_place:
+                        # 上書き保存
+                        doc.save(temp_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+                    else:
+                        # 新規保存（サブセット化したフォントなどの圧縮されていないストリームを圧縮）
+                        doc.save(temp_path, deflate=True)
+                    event['bytes'] = os.path.getsize(temp_path)
+            finally:
+                doc.close()
+
+            if in_place and not changed:
+                os.remove(temp_path)
+            else:
+                shutil.copymode(self.input_pdf, temp_path)
+                os.replace(temp_path, self.output_pdf)
+                self.sizes = (input_size, os.path.getsize(self.output_pdf))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._export(page_results)
+        return blank
+
+    def _apply_results_chunked(self, results, checkpoint):
+        """
+        ページごとのOCR結果を数ページずつ作業ファイルに追記保存し、最後に出力先へ保存する
+
+        作業ファイルは保存ごとに開き直し、追加したテキストレイヤーをメモリから解放する。
+        開き直すとテキストレイヤーのフォントが新たに埋め込まれるため、保存の前に毎回
+        フォントをサブセット化する。上書きで最適化しない場合は作業ファイルをそのまま
+        出力とし、それ以外の場合は作業ファイルを出力先の一時ファイルに保存し直す。
+
+        Args:
+            results: ページのOCR結果をページ順に並べたイテラブル
+            checkpoint: ChunkCheckpoint オブジェクト（作業ファイルは作成済み）
+
+        Returns:
+            int: 今回の処理で空白のためテキストレイヤーを追加しなかったページ数
+        """
+        in_place = self.input_pdf == self.output_pdf
+        input_size = os.path.getsize(self.input_pdf)
+        self.sizes = None
+        page_results = {} if self.exporters else None
+        results = iter(results)
+        blank = 0
+
+        doc = fitz.open(checkpoint.working_path)
+        try:
+            while True:
+                chunk = list(itertools.islice(results, checkpoint.chunk_size))
+                if not chunk:
+                    break
+
+                changed, chunk_blank = self._add_text_layers(doc, chunk, page_results)
+                blank += chunk_blank
+                if changed:
+                    self._subset_fonts(doc)
+                    with self.instrumentation.stage('save', pages=len(chunk)) as event:
+                        doc.save(checkpoint.working_path, incremental=True,
+                                 encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+                        event['bytes'] = os.path.getsize(checkpoint.working_path)
+                checkpoint.record([result['page_num'] for result in chunk], chunk_blank)
+                logger.info("%d ページを作業ファイルに保存しました", len(checkpoint.pages))
+
+                # 保存した内容をメモリから解放
+                doc.close()
+                doc = fitz.open(checkpoint.working_path)
+
+            if in_place and not self.optimizer:
+                doc.close()
+                shutil.copymode(self.input_pdf, checkpoint.working_path)
+                os.replace(checkpoint.working_path, self.output_pdf)
+            else:
+                fd, temp_path = tempfile.mkstemp(
+                    prefix='.' + os.path.basename(self.output_pdf) + '.',
+                    suffix='.tmp',
+                    dir=os.path.dirname(os.path.abspath(self.output_pdf))
+                )
+                os.close(fd)
+                try:
+                    if self.optimizer:
+                        with self.instrumentation.stage('optimize_images') as event:
+                            event['images'] = self.optimizer.optimize_images(doc)
+                    with self.instrumentation.stage('save') as event:
+                        if self.optimizer:
+                            self.optimizer.save(doc, temp_path)
+                        else:
+                            # 追記保存で置き換えられたオブジェクトを除いて保存
+                            doc.save(temp_path, garbage=1, deflate=True)
+                        event['bytes'] = os.path.getsize(temp_path)
+                    doc.close()
+                    shutil.copymode(self.input_pdf, temp_path)
+                    os.replace(temp_path, self.output_pdf)
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+        finally:
+            if not doc.is_closed:
+                doc.close()
+
+        checkpoint.discard()
+        self.sizes = (input_size, os.path.getsize(self.output_pdf))
+        self._export(page_results)
+        return blank
+
+    def _export(self, page_results):
+        """
+        保存したPDFのページごとのテキストを出力処理に渡す
+
+        PDFは保存済みのため、出力処理に失敗した場合は警告を表示して処理を続ける。
+
+        Args:
+            page_results: ページ番号 → 今回のOCR結果の辞書
+        """
+        if not self.exporters:
+            return
+
+        try:
+            with self.instrumentation.stage('export'):
+                pages = read_pages(self.output_pdf, page_results)
+                for exporter in self.exporters:
+                    exporter.export(self.output_pdf, pages)
+        except Exception as e:
+            print(f"警告: {self.output_pdf} のテキストの書き出しに失敗しました: {e}")
+
+    def _subset_fonts(self, doc):
+        """埋め込みフォントを使用している文字だけのサブセットにする"""
+        try:
+            with self.instrumentation.stage('subset_fonts'):
+                doc.subset_fonts()
+        except Exception as e:
+            # 古い PyMuPDF では fontTools が必要
+            print(f"警告: フォントのサブセット化に失敗しました: {e}")
+
+    def _add_text_layers(self, doc, results, page_results=None):
+        """
+        ページごとのOCR結果からテキストレイヤーを追加する
+
+        Args:
+            doc: fitz.Document オブジェクト
+            results: ページのOCR結果をページ順に並べたイテラブル
+            page_results: OCR結果をページ番号ごとに記録する辞書（記録しない場合は None）
+
+        Returns:
+            bool: テキストレイヤーを追加・削除したページがあれば True
+            int: 空白のためテキストレイヤーを追加しなかったページ数
+        """
+        changed = False
+        blank = 0
+
+        for result in results:
+            page_num = result['page_num']
+            detected_orientation = result['orientation']
             page = doc[page_num]
+            if page_results is not None:
+                page_results[page_num] = result
+
+            # 以前に追加したテキストレイヤーを削除
+            if self._remove_text_layer(doc, page):
+                changed = True
+
+            # 空白ページにはテキストレイヤーを追加しない
+            if detected_orientation == OCREngine.BLANK:
+                blank += 1
+                logger.info("ページ %d: 空白ページ", page_num + 1)
+                continue
+
+            # テキストレイヤーを追加し、追加したコンテンツストリームを記録
+            with self.instrumentation.stage('text_layer', page_num=page_num) as event:
+                contents = set(page.get_contents())
+                self._add_text_layer(page, result['ocr_data'], result['dpi'], detected_orientation)
+                layer_xrefs = [xref for xref in page.get_contents() if xref not in contents]
+                doc.xref_set_key(page.xref, self.TEXT_LAYER_KEY, self._xref_array(layer_xrefs))
+                event['bytes'] = sum(len(doc.xref_stream_raw(xref)) for xref in layer_xrefs)
+            changed = True
+
+            # 検出された向きを表示
+            logger.info("ページ %d: %s テキスト検出", page_num + 1,
+                        '縦書き' if detected_orientation == OCREngine.VERTICAL else '横書き')
+
+        return changed, blank
+
+    def _get_text_layer_xrefs(self, doc, page):
+        """このツールが追加したテキストレイヤーのコンテンツストリームの xref を取得"""
+        value_type, value = doc.xref_get_key(page.xref, self.TEXT_LAYER_KEY)
+        if value_type != 'array':
+            return []
+        return [int(xref) for xref in re.findall(r'(\d+)\s+0\s+R', value)]
+
+    def _remove_text_layer(self, doc, page):
+        """このツールが以前に追加したテキストレイヤーをページから削除（削除した場合は True を返す）"""
+        layer_xrefs = self._get_text_layer_xrefs(doc, page)
+        if not layer_xrefs:
+            return False
+
+        contents = [xref for xref in page.get_contents() if xref not in layer_xrefs]
+        doc.xref_set_key(page.xref, 'Contents', self._xref_array(contents))
+        doc.xref_set_key(page.xref, self.TEXT_LAYER_KEY, 'null')
+        return True
+
+    def _xref_array(self, xrefs):
+        """xref のリストをPDFの参照の配列として表した文字列"""
+        return '[' + ' '.join(f'{xref} 0 R' for xref in xrefs) + ']'
+
+    def ocr_page(self, page_num, exclude_regions=None, dpi=300, orientation=OCREngine.AUTO):
+        """
+        1ページだけを画像化してOCR処理を行う
+
+        Args:
+            page_num: ページ番号（0始まり）
+            exclude_regions: RegionSelector オブジェクト
+            dpi: 画像変換時の解像度
+            orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+
+        Returns:
+            dict: ページのOCR結果（page_num, ocr_data, orientation, dpi）
+        """
+        page_dpi = self._select_page_dpis([page_num], dpi)[page_num]
+        page_image, page_dpi = self._render_page(page_num, page_dpi)
+        return self._ocr_image(page_num, page_image, exclude_regions, page_dpi, orientation, dpi)
+
+    def ocr_page_text(self, page_num, exclude_regions=None, dpi=300, orientation=OCREngine.AUTO):
+        """
+        1ページだけを画像化して、位置情報なしでテキストだけを抽出する
+
+        Args:
+            page_num: ページ番号（0始まり）
+            exclude_regions: RegionSelector オブジェクト
+            dpi: 画像変換時の解像度
+            orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+
+        Returns:
+            dict: ページの抽出結果（page_num, text, orientation, dpi）
+        """
+        page_dpi = self._select_page_dpis([page_num], dpi)[page_num]
+        page_image, page_dpi = self._render_page(page_num, page_dpi)
+        return self._text_image(page_num, page_image, exclude_regions, page_dpi, orientation, dpi)
+
+    def _render_page(self, page_num, dpi):
+        """
+        1ページだけを画像化する
+
+        Returns:
+            PIL.Image: ページ画像
+            float: 画像の解像度（埋め込まれた画像を取り出した場合は dpi と異なることがある）
+        """
+        _, page_image, page_dpi = self._render_pages([page_num], dpi)[0]
+        return page_image, page_dpi
+
+    def _render_pages(self, page_nums, dpi):
+        """
+        ページを画像化する
+
+        native_images が有効な場合、1枚の画像だけのスキャンページは埋め込まれた画像を
+        PyMuPDF で直接デコードし、それ以外のページだけを pdf2image（poppler）で画像化する。
+
+        Args:
+            page_nums: 画像化するページ番号（0始まり、昇順）のリスト
+            dpi: 画像変換時の解像度
+
+        Returns:
+            list: (ページ番号（0始まり）, PIL.Image オブジェクト, 解像度) のリスト（ページ順）
+        """
+        rendered = {}
+        if self.native_images:
+            with fitz.open(self.input_pdf) as doc:
+                for page_num in page_nums:
+                    page = doc[page_num]
+                    placement = find_page_image(page)
+                    if placement is None:
+                        continue
+                    with self.instrumentation.stage('render', page_num=page_num, pages=1, dpi=dpi,
+                                                    source='native') as event:
+                        page_image, page_dpi = decode_page_image(page, placement, dpi)
+                        if page_image is not None:
+                            event.update({'dpi': page_dpi, 'bytes': image_bytes(page_image)})
+                    if page_image is not None:
+                        rendered[page_num] = (page_image, page_dpi)
+
+        # 残りのページは連続する範囲ごとにまとめて画像化する
+        remaining = [page_num for page_num in page_nums if page_num not in rendered]
+        runs = []
+        for page_num in remaining:
+            if runs and page_num == runs[-1][-1] + 1:
+                runs[-1].append(page_num)
+            else:
+                runs.append([page_num])
+
+        for run in runs:
+            with self.instrumentation.stage('render', page_num=run[0], pages=len(run), dpi=dpi) as event:
+                # pdf2image のページ番号は1始まり
+                images = convert_from_path(
+                    self.input_pdf, dpi=dpi, first_page=run[0] + 1, last_page=run[-1] + 1
+                )
+                event['bytes'] = sum(image_bytes(image) for image in images)
+            for page_num, page_image in zip(run, images):
+                rendered[page_num] = (page_image, dpi)
+
+        return [(page_num,) + rendered.pop(page_num) for page_num in page_nums]
+
+    def _select_page_dpis(self, page_nums, dpi):
+        """
+        ページごとの画像変換の解像度を選択する
+
+        Args:
+            page_nums: ページ番号（0始まり）のリスト
+            dpi: 解像度を自動選択しない場合の解像度
+
+        Returns:
+            dict: ページ番号 → 解像度
+        """
+        if not self.adaptive_dpi:
+            return {page_num: dpi for page_num in page_nums}
+
+        # 低解像度で画像化して文字の大きさを推定
+        with fitz.open(self.input_pdf) as doc:
+            return {page_num: self.adaptive_dpi.select_dpi(doc[page_num]) for page_num in page_nums}
+
+    def _ocr_image(self, page_num, page_image, exclude_regions, dpi, orientation, base_dpi=None):
+        """
+        ページ画像をOCR処理し、処理後に画像を解放する
+
+        解像度を自動選択している場合、OCR結果の信頼度が低ければ
+        最大の解像度で画像化し直してOCRを行い、信頼度の高い方を採用する。
+
+        Args:
+            page_num: ページ番号（0始まり）
+            page_image: PIL.Image オブジェクト
+            exclude_regions: RegionSelector オブジェクト
+            dpi: 画像変換時の解像度
+            orientation: テキストの向き ('auto', 'horizontal', 'vertical')
+            base_dpi: 除外領域のピクセル座標の基準となる解像度（None の場合は dpi と同じ）
+
+        Returns:
+            dict: ページのOCR結果（page_num, ocr_data, orientation, dpi）
+        """
+        base_dpi = base_dpi or dpi
+        with self.instrumentation.stage('page', page_num=page_num, dpi=dpi) as event:
+            result = self._ocr_image_with_retry(
+                page_num, page_image, exclude_regions, dpi, orientation, base_dpi
+            )
+            event.update({'orientation': result['orientation'], 'dpi': result['dpi']})
+        return result
+
+    def _ocr_image_with_retry(self, page_num, page_image, exclude_regions, dpi, orientation, base_dpi):
+        """
+        ページ画像をOCR処理し、信頼度が低ければ高い解像度で処理し直す
+
+        refiner がある場合は、まず信頼度の低い行だけを処理し直し、
+        それでも信頼度が低いページだけをページ全体で処理し直す。
+        """
+        ocr_data, detected_orientation = self._ocr_page_image(
+            page_image, exclude_regions, dpi, orientation, base_dpi
+        )
+        page_size = page_image.size
+
+        # 処理済みのページ画像を解放
+        page_image.close()
+
+        # 信頼度の低い行だけを高い解像度で処理し直す
+        if self.refiner and detected_orientation != OCREngine.BLANK:
+            ocr_data = self._refine_lines(page_num, ocr_data, page_size, exclude_regions, dpi,
+                                          detected_orientation, base_dpi)
+
+        # 信頼度が低い場合は高い解像度で処理し直す
+        if self.adaptive_dpi and self.adaptive_dpi.needs_retry(ocr_data, dpi):
+            retry_image, retry_dpi = self._render_page(page_num, self.adaptive_dpi.max_dpi)
+            retry_data, retry_orientation = self._ocr_page_image(
+                retry_image, exclude_regions, retry_dpi, orientation, base_dpi
+            )
+            retry_image.close()
+
+            if (self.adaptive_dpi.mean_confidence(retry_data) or 0) > (self.adaptive_dpi.mean_confidence(ocr_data) or 0):
+                ocr_data, detected_orientation, dpi = retry_data, retry_orientation, retry_dpi
+
+        return {
+            'page_num': page_num,
+            'ocr_data': ocr_data,
+            'orientation': detected_orientation,
+            'dpi': dpi,
+        }
+
+    def _refine_lines(self, page_num, ocr_data, page_size, exclude_regions, dpi, orientation, base_dpi):
+        """
+        refiner で信頼度の低い行を処理し直す
+
+        Returns:
+            dict: 改善した行を置き換えたOCR結果
+        """
+        page_regions = None
+        if exclude_regions:
+            page_regions = exclude_regions.get_exclude_regions_for_page(
+                page_size[0], page_size[1], dpi / base_dpi
+            )
+
+        with fitz.open(self.input_pdf) as doc:
+            ocr_data, weak, replaced = self.refiner.refine(
+                doc[page_num], ocr_data, dpi, orientation, self.ocr_engine, page_regions
+            )
+        if weak:
+            logger.info("ページ %d: 信頼度の低い %d 行を処理し直し、%d 行を置き換えました",
+                        page_num + 1, weak, replaced)
+        return ocr_data
+
+    def _ocr_page_image(self, page_image, exclude_regions, dpi, orientation, base_dpi):
+        """
+        ページ画像の除外領域を計算してOCR処理を行う
+
+        対象領域の指定（またはレイアウトのブロックへの分割）がある場合は、
+        ページを対象領域ごとのタイルに切り出して処理する。
+
+        Returns:
+            dict: OCR結果
+            str: 検出されたテキストの向き
+        """
+        # 除外領域を計算
+        page_regions = None
+        if exclude_regions:
+            page_regions = exclude_regions.get_exclude_regions_for_page(
+                page_image.width, page_image.height, dpi / base_dpi
+            )
 
-            # 除外領域を計算
+        tiles = self._select_tiles(page_image, exclude_regions, page_regions, dpi, base_dpi)
+        if tiles is not None:
+            return self._ocr_tiles(page_image, tiles, page_regions, dpi, orientation)
+
+        # OCRでテキストと位置情報を抽出（向きも検出）
+        return self.ocr_engine.process_image(
+            page_image, page_regions, orientation, self.orientation_memo, dpi
+        )
+
+    def _select_tiles(self, page_image, exclude_regions, page_regions, dpi, base_dpi):
+        """
+        ページから切り出してOCR処理するタイルを選択する
+
+        Returns:
+            list: タイルの矩形のリスト [(x1, y1, x2, y2), ...]
+                  タイルに分けずにページ全体を処理する場合は None
+        """
+        if not exclude_regions or not exclude_regions.tiled:
+            return None
+
+        if exclude_regions.include_regions:
+            return exclude_regions.get_include_regions_for_page(
+                page_image.width, page_image.height, dpi / base_dpi
+            )
+
+        with self.instrumentation.stage('layout', dpi=dpi) as event:
+            tiles = find_text_blocks(page_image, dpi, page_regions)
+            event['blocks'] = len(tiles) if tiles is not None else None
+        return tiles
+
+    def _ocr_tiles(self, page_image, tiles, page_regions, dpi, orientation):
+        """
+        ページから切り出したタイルごとにOCR処理を行い、結果をページの座標にまとめる
+
+        向きを自動判別する場合は、面積の大きいタイルから順に処理して最初に検出された
+        向きを残りのタイルにも使う（テキストレイヤーはページごとに1つの向きで追加するため）。
+        残りのタイルは tile_workers のスレッドで並行して処理する。
+
+        Returns:
+            dict: OCR結果（座標はページ画像の座標、ブロック番号はタイルごとに振り直す）
+            str: 検出されたテキストの向き（すべてのタイルが空白の場合は 'blank'）
+        """
+        tiles = sorted(tiles, key=lambda tile: (tile[2] - tile[0]) * (tile[3] - tile[1]), reverse=True)
+        tile_results = []
+
+        # 向きが決まるまでは1つずつ処理
+        remaining = list(tiles)
+        while remaining and orientation == OCREngine.AUTO:
+            ocr_data, detected = self._ocr_tile(page_image, remaining.pop(0), page_regions, dpi,
+                                                orientation, self.orientation_memo)
+            tile_results.append((ocr_data, detected))
+            if detected != OCREngine.BLANK:
+                orientation = detected
+
+        if self.tile_workers > 1 and len(remaining) > 1:
+            with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+                tile_results += executor.map(
+                    lambda tile: self._ocr_tile(page_image, tile, page_regions, dpi, orientation),
+                    remaining
+                )
+        else:
+            tile_results += [self._ocr_tile(page_image, tile, page_regions, dpi, orientation)
+                             for tile in remaining]
+
+        # タイルの結果を1つにまとめる（ブロック番号はタイルごとに重ならないようにずらす）
+        merged = {column: [] for column in _TSV_COLUMNS}
+        block_offset = 0
+        detected_orientation = OCREngine.BLANK
+        for ocr_data, detected in tile_results:
+            if detected == OCREngine.BLANK:
+                continue
+            detected_orientation = detected
+            for column in _TSV_COLUMNS:
+                values = ocr_data[column]
+                if column == 'block_num':
+                    values = [value + block_offset for value in values]
+                merged[column].extend(values)
+            block_offset = max(merged['block_num'], default=block_offset)
+
+        return merged, detected_orientation
+
+    def _ocr_tile(self, page_image, tile, page_regions, dpi, orientation, memo=None):
+        """
+        ページ画像からタイルを切り出してOCR処理を行う
+
+        Returns:
+            dict: OCR結果（座標はページ画像の座標）
+            str: 検出されたテキストの向き
+        """
+        tile_image, tile_regions, left, top = self._crop_tile(page_image, tile, page_regions)
+        ocr_data, detected = self.ocr_engine.process_image(tile_image, tile_regions or None,
+                                                           orientation, memo, dpi)
+        tile_image.close()
+
+        ocr_data = dict(ocr_data)
+        ocr_data['left'] = [value + left for value in ocr_data['left']]
+        ocr_data['top'] = [value + top for value in ocr_data['top']]
+        return ocr_data, detected
+
+    def _crop_tile(self, page_image, tile, page_regions):
+        """
+        ページ画像からタイルを切り出し、タイルに重なる除外領域をタイルの座標に変換する
+
+        Returns:
+            PIL.Image: タイルの画像
+            list: タイルの座標の除外領域のリスト
+            int: タイルの左端のx座標
+            int: タイルの上端のy座標
+        """
+        left, top, right, bottom = (int(round(value)) for value in tile)
+        tile_image = page_image.crop((left, top, right, bottom))
+
+        tile_regions = [
+            (x1 - left, y1 - top, x2 - left, y2 - top)
+            for x1, y1, x2, y2 in page_regions or []
+            if x1 < right and x2 > left and y1 < bottom and y2 > top
+        ]
+        return tile_image, tile_regions, left, top
+
+    def _text_image(self, page_num, page_image, exclude_regions, dpi, orientation, base_dpi=None):
+        """
+        ページ画像から位置情報なしでテキストだけを抽出し、処理後に画像を解放する
+
+        対象領域の指定（またはレイアウトのブロックへの分割）がある場合は、
+        タイルごとに抽出したテキストをタイルの順に改行でつなげる。
+
+        Returns:
+            dict: ページの抽出結果（page_num, text, orientation, dpi）
+        """
+        base_dpi = base_dpi or dpi
+        with self.instrumentation.stage('page', page_num=page_num, dpi=dpi) as event:
             page_regions = None
             if exclude_regions:
                 page_regions = exclude_regions.get_exclude_regions_for_page(
-                    page_image.width, page_image.height
+                    page_image.width, page_image.height, dpi / base_dpi
                 )
 
-            # OCRでテキストと位置情報を抽出（向きも検出）
-            ocr_data, detected_orientation = self.ocr_engine.process_image(
-                page_image, page_regions, orientation
-            )
+            tiles = self._select_tiles(page_image, exclude_regions, page_regions, dpi, base_dpi)
+            if tiles is None:
+                text, detected_orientation = self.ocr_engine.get_text_only(
+                    page_image, page_regions, orientation, self.orientation_memo, dpi
+                )
+            else:
+                text, detected_orientation = self._text_tiles(page_image, tiles, page_regions, dpi, orientation)
+            page_image.close()
+            event['orientation'] = detected_orientation
 
-            # テキストレイヤーを追加
-            self._add_text_layer(page, ocr_data, dpi, detected_orientation)
+        return {
+            'page_num': page_num,
+            'text': text.rstrip(),
+            'orientation': detected_orientation,
+            'dpi': dpi,
+        }
 
-            # 検出された向きを表示
-            print(f"ページ {page_num+1}: {'縦書き' if detected_orientation == OCREngine.VERTICAL else '横書き'} テキスト検出")
+    def _text_tiles(self, page_image, tiles, page_regions, dpi, orientation):
+        """
+        ページから切り出したタイルごとにテキストを抽出する
+
+        _ocr_tiles と同じく、向きを自動判別する場合は面積の大きいタイルから順に
+        処理して最初に検出された向きを残りのタイルにも使う。
+
+        Returns:
+            str: タイルのテキストをタイルの順に改行でつなげたテキスト
+            str: 検出されたテキストの向き（すべてのタイルが空白の場合は 'blank'）
+        """
+        order = sorted(range(len(tiles)),
+                       key=lambda index: (tiles[index][2] - tiles[index][0]) * (tiles[index][3] - tiles[index][1]),
+                       reverse=True)
+        tile_texts = {}
+
+        # 向きが決まるまでは1つずつ処理
+        remaining = list(order)
+        while remaining and orientation == OCREngine.AUTO:
+            index = remaining.pop(0)
+            tile_texts[index] = self._text_tile(page_image, tiles[index], page_regions, dpi, orientation,
+                                                self.orientation_memo)
+            if tile_texts[index][1] != OCREngine.BLANK:
+                orientation = tile_texts[index][1]
 
-        # PDFを保存
-        if self.input_pdf == self.output_pdf:
-            # 上書き保存
-            doc.save(self.output_pdf, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        if self.tile_workers > 1 and len(remaining) > 1:
+            with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+                tile_texts.update(zip(remaining, executor.map(
+                    lambda index: self._text_tile(page_image, tiles[index], page_regions, dpi, orientation),
+                    remaining
+                )))
         else:
-            # 新規保存
-            doc.save(self.output_pdf)
+            tile_texts.update((index, self._text_tile(page_image, tiles[index], page_regions, dpi, orientation))
+                              for index in remaining)
+
+        texts = [tile_texts[index] for index in range(len(tiles)) if tile_texts[index][1] != OCREngine.BLANK]
+        if not texts:
+            return '', OCREngine.BLANK
+        return '\n'.join(text.strip() for text, _ in texts), texts[0][1]
+
+    def _text_tile(self, page_image, tile, page_regions, dpi, orientation, memo=None):
+        """ページ画像からタイルを切り出してテキストを抽出する"""
+        tile_image, tile_regions, _, _ = self._crop_tile(page_image, tile, page_regions)
+        text, detected = self.ocr_engine.get_text_only(tile_image, tile_regions or None, orientation, memo, dpi)
+        tile_image.close()
+        return text, detected
 
-        doc.close()
+    def _check_cancelled(self, cancel_event):
+        """中止が要求されていれば ProcessingCancelled を送出する"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProcessingCancelled(f"処理が中止されました: {self.input_pdf}")
+
+    def _iter_results_serial(self, page_nums, exclude_regions, dpi, orientation, page_window,
+                             cancel_event=None, text_only=False):
+        """
+        ページを順番に画像化・OCR処理し、結果をページ順に返す
+
+        Yields:
+            dict: ページのOCR結果（text_only の場合は _text_image の抽出結果）
+        """
+        ocr_image = self._text_image if text_only else self._ocr_image
+        # ページ画像を順次生成しながら処理（ウィンドウ単位で画像化）
+        for page_num, page_image, page_dpi in self._iter_page_images(page_nums, dpi, page_window):
+            self._check_cancelled(cancel_event)
+            yield ocr_image(page_num, page_image, exclude_regions, page_dpi, orientation, dpi)
+
+    def _iter_results_parallel(self, page_nums, exclude_regions, dpi, orientation, workers,
+                               cancel_event=None, text_only=False):
+        """
+        ページをワーカープロセスに振り分けてOCR処理し、結果をページ順に返す
+
+        各ワーカーは担当ページだけを画像化してOCRを行い、結果は完了した順に
+        受け取る。テキストレイヤーはページ順に追加する必要があるため、
+        先に完了したページの結果は前のページが揃うまで保持しておく。
+
+        resources が指定されている場合は、最も大きいページをすべてのワーカーが同時に
+        処理してもメモリの上限に収まり、タイルのスレッドと合わせて CPU数を
+        超えない数にワーカーを減らす（Tesseract のスレッド数は main で設定する）。
+
+        Yields:
+            dict: ページのOCR結果（text_only の場合は _text_image の抽出結果）
+        """
+        tasks = [
+            {
+                'input_pdf': self.input_pdf,
+                'options': self.options,
+                'page_num': page_num,
+                'exclude_regions': exclude_regions,
+                'dpi': dpi,
+                'orientation': orientation,
+                'instrument': self.instrumentation.enabled,
+                'text_only': text_only,
+            }
+            for page_num in page_nums
+        ]
+
+        workers = min(workers, len(page_nums))
+        if self.resources:
+            memories = self.resources.page_memories(self.input_pdf, page_nums, dpi, self.adaptive_dpi)
+            planned, _ = self.resources.plan(workers, self.tile_workers, max(memories.values()))
+            if planned < workers:
+                logger.info("CPU数・メモリの上限に合わせてワーカー数を %d から %d に減らします", workers, planned)
+            workers = planned
+
+        pending = {}
+        order = iter(page_nums)
+        next_page = next(order, None)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(ocr_page_task, task) for task in tasks]
+
+            try:
+                for future in as_completed(futures):
+                    self._check_cancelled(cancel_event)
+
+                    result = future.result()
+                    # ワーカープロセスで記録したイベントを出力
+                    self.instrumentation.replay(result.pop('events', ()))
+                    pending[result['page_num']] = result
+
+                    # ページ順に揃った分だけ返す
+                    while next_page in pending:
+                        yield pending.pop(next_page)
+                        next_page = next(order, None)
+            finally:
+                # 中止・エラー・呼び出し側が途中で受け取りをやめた場合は、開始していないページを実行しない
+                for pending_future in futures:
+                    pending_future.cancel()
+
+    def _iter_page_images(self, page_nums, dpi, page_window=None):
+        """
+        ページ画像をウィンドウ単位で生成する
+
+        page_window を指定すると、その枚数分のページだけを画像化して返し、
+        呼び出し側で処理が終わってから次のウィンドウを画像化する。
+        同時にメモリ上に保持されるページ画像はウィンドウサイズ分に抑えられる。
+
+        Args:
+            page_nums: 画像化するページ番号（0始まり、昇順）のリスト
+            dpi: 画像変換時の解像度（解像度を自動選択する場合は使用しない）
+            page_window: 一度に画像化するページ数（None または 0 の場合は全ページ）
+
+        Yields:
+            tuple: (ページ番号（0始まり）, PIL.Image オブジェクト, 解像度)
+        """
+        if not page_window or page_window <= 0:
+            page_window = max(len(page_nums), 1)
+
+        page_dpis = self._select_page_dpis(page_nums, dpi)
+
+        # 解像度が同じ連続するページをウィンドウサイズ以内でまとめて画像化する
+        windows = []
+        for page_num in page_nums:
+            if (windows and page_num == windows[-1][-1] + 1 and len(windows[-1]) < page_window
+                    and page_dpis[page_num] == page_dpis[windows[-1][-1]]):
+                windows[-1].append(page_num)
+            else:
+                windows.append([page_num])
+
+        for window in windows:
+            images = self._render_pages(window, page_dpis[window[0]])
+
+            for offset in range(len(images)):
+                # 渡したページはリストから外し、処理後に解放されるようにする
+                page_num, image, image_dpi = images[offset]
+                images[offset] = None
+                yield page_num, image, image_dpi
 
     def _add_text_layer(self, page, ocr_data, dpi, orientation):
         """
         ページにテキストレイヤーを追加する
 
+        ページ内のすべての単語を TextWriter にまとめ、透明（レンダリングモード 3）の
+        テキストとして一度に書き込む。コンテンツストリームとフォントリソースは
+        向きごとに1つだけ追加される。
+
         Args:
             page: fitz.Page オブジェクト
             ocr_data: OCR結果（pytesseract.image_to_data の出力形式）
             dpi: 画像変換時の解像度
             orientation: 検出されたテキストの向き ('horizontal' または 'vertical')
         """
+        font = _get_text_layer_font()
+        writer = fitz.TextWriter(page.rect)
+
+        # DPIから座標を変換（画像のDPI → PDFの72dpi）
+        scale = 72.0 / dpi
+        words = 0
+
         # OCRデータから有効なテキストのみを抽出
         for i in range(len(ocr_data['text'])):
-            if ocr_data['text'][i].strip():
-                # 座標とサイズを取得
-                x, y, w, h = (
-                    ocr_data['left'][i],
-                    ocr_data['top'][i],
-                    ocr_data['width'][i],
-                    ocr_data['height'][i]
-                )
+            text = ocr_data['text'][i].strip()
+            if not text:
+                continue
 
-                # DPIから座標を変換（画像のDPI → PDFの72dpi）
-                scale = 72.0 / dpi
-                x, y, w, h = x*scale, y*scale, w*scale, h*scale
-
-                # テキストを透明で配置（検索可能だが表示されない）
-                if orientation == OCREngine.HORIZONTAL:
-                    # 横書きテキストの場合
-                    page.insert_text(
-                        (x, y),
-                        ocr_data['text'][i],
-                        fontsize=h,
-                        color=(0, 0, 0, 0)  # 透明
-                    )
-                else:
-                    # 縦書きテキストの場合
-                    # 縦書きテキストの場合は、テキストを90度回転させて配置
-                    # PyMuPDFでは直接縦書きテキストを配置する方法が限られているため、
-                    # 文字ごとに配置する方法を採用
-                    text = ocr_data['text'][i]
-                    char_height = h / len(text) if len(text) > 0 else h
-
-                    for j, char in enumerate(text):
-                        if char.strip():  # 空白文字はスキップ
-                            # 縦書きの場合、文字を上から下に配置
-                            char_y = y + j * char_height
-                            page.insert_text(
-                                (x, char_y),
-                                char,
-                                fontsize=w,  # 縦書きの場合は幅をフォントサイズとして使用
-                                color=(0, 0, 0, 0)  # 透明
-                            )
+            # 座標とサイズを取得
+            x, y, w, h = (
+                ocr_data['left'][i] * scale,
+                ocr_data['top'][i] * scale,
+                ocr_data['width'][i] * scale,
+                ocr_data['height'][i] * scale
+            )
+            if w <= 0 or h <= 0:
+                continue
+
+            # フォントサイズ1での文字列の長さ
+            length = font.text_length(text, fontsize=1) or len(text)
+
+            if orientation == OCREngine.HORIZONTAL:
+                # 横書きテキストの場合は、単語の幅に収まるフォントサイズで
+                # 矩形の上下中央にベースラインを置く
+                fontsize = min(h, w / length)
+                baseline = y + (h + fontsize * _EM_BOX_CENTER) / 2
+                writer.append((x, baseline), text, font=font, fontsize=fontsize)
+            else:
+                # 縦書きテキストの場合は、90度回転した座標系で横書きとして配置し、
+                # 書き込み時に回転させて上から下へ読む1つの文字列にする
+                fontsize = min(w, h / length)
+                top = y + (h - length * fontsize) / 2
+                baseline = x + w / 2 - fontsize * _EM_BOX_CENTER / 2
+                # 回転後に (baseline, top) となる位置
+                writer.append((top, -baseline), text, font=font, fontsize=fontsize)
+            words += 1
+
+        if words:
+            if orientation == OCREngine.HORIZONTAL:
+                writer.write_text(page, render_mode=3)
+            else:
+                writer.write_text(page, render_mode=3, morph=(fitz.Point(0, 0), fitz.Matrix(-90)))
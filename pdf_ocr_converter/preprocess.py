@@ -0,0 +1,150 @@
+"""
+OCR前の画像の前処理を行うモジュール
+"""
+import math
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+class ImagePreprocessor:
+    """
+    OCR前の画像の前処理を行うクラス
+
+    ページ画像をグレースケール（または二値）に1回だけ変換し、除外領域のマスク処理は
+    変換した画像に対してその場で行う。二値化は参照表による変換で行い、画素の配列は作成しない。
+    元のRGB画像の全体コピーは作成せず、OCRエンジンには1チャンネルの画像を渡す。
+    """
+    # 出力する画像の種類
+    RGB = 'rgb'  # 元のカラー画像のまま（除外領域のみマスク）
+    GRAY = 'gray'  # 8bitグレースケール
+    BINARY = 'binary'  # 大津の方法で二値化（0/255 の8bitグレースケール）
+
+    # 傾き補正で探索する角度の範囲と刻み（度）
+    DESKEW_MAX_ANGLE = 5.0
+    DESKEW_STEP = 0.25
+    # 傾きの推定に使う縮小画像の長辺のピクセル数
+    DESKEW_PROBE_SIZE = 1000
+
+    def __init__(self, mode=GRAY, deskew=False, despeckle=False):
+        if mode not in (self.RGB, self.GRAY, self.BINARY):
+            raise ValueError(f"不明な前処理モードです: {mode}")
+        self.mode = mode
+        self.deskew = deskew
+        self.despeckle = despeckle
+
+    def __repr__(self):
+        return f"ImagePreprocessor({self.signature()!r})"
+
+    def signature(self):
+        """OCR結果に影響する設定（キャッシュのキーに使用）"""
+        return {'mode': self.mode, 'deskew': self.deskew, 'despeckle': self.despeckle}
+
+    def apply(self, image, exclude_regions=None):
+        """
+        画像に前処理を行う
+
+        Args:
+            image: PIL.Image オブジェクト（変更されない）
+            exclude_regions: 除外領域のリスト [(x1, y1, x2, y2), ...]
+
+        Returns:
+            PIL.Image: 前処理後の画像
+            float: 傾き補正で回転した角度（度、反時計回り）。補正していない場合は 0.0
+        """
+        # 変換は1回だけ行う（同じモードでも新しい画像になるため元の画像は変更されない）
+        result = image.convert('RGB' if self.mode == self.RGB else 'L')
+
+        # 除外領域を白で塗りつぶし（変換した画像をその場で変更）
+        if exclude_regions:
+            draw = ImageDraw.Draw(result)
+            fill = (255, 255, 255) if result.mode == 'RGB' else 255
+            for x1, y1, x2, y2 in exclude_regions:
+                left, right = sorted((int(x1), int(math.ceil(x2))))
+                top, bottom = sorted((int(y1), int(math.ceil(y2))))
+                draw.rectangle((left, top, right, bottom), fill=fill)
+
+        if self.mode == self.BINARY:
+            result = self._binarize(result)
+
+        if self.despeckle:
+            result = result.filter(ImageFilter.MedianFilter(3))
+
+        angle = 0.0
+        if self.deskew:
+            angle = self.estimate_skew(result)
+            if angle:
+                fill = (255, 255, 255) if result.mode == 'RGB' else 255
+                # 二値画像は中間調が生じないように補間しない
+                resample = Image.NEAREST if self.mode == self.BINARY else Image.BILINEAR
+                result = result.rotate(angle, resample=resample, fillcolor=fill)
+
+        return result, angle
+
+    def _binarize(self, image):
+        """大津の方法でしきい値を求め、グレースケール画像を二値化した画像を返す"""
+        histogram = np.array(image.histogram(), dtype=np.float64)
+        levels = np.arange(256)
+
+        # しきい値ごとのクラス間分散を一度に計算
+        weight_dark = np.cumsum(histogram)
+        weight_light = weight_dark[-1] - weight_dark
+        sum_dark = np.cumsum(histogram * levels)
+        mean_dark = sum_dark / np.maximum(weight_dark, 1)
+        mean_light = (sum_dark[-1] - sum_dark) / np.maximum(weight_light, 1)
+        variance = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+        threshold = int(np.argmax(variance))
+
+        # 参照表で変換する（画素の配列は作成しない）
+        return image.point([0 if level <= threshold else 255 for level in range(256)])
+
+    def estimate_skew(self, image):
+        """
+        縮小画像を少しずつ回転させ、投影プロファイルが最も鋭くなる角度を傾きとする
+
+        Args:
+            image: PIL.Image オブジェクト
+
+        Returns:
+            float: 傾きを補正するための回転角度（度、反時計回り）
+        """
+        factor = max(1, max(image.size) // self.DESKEW_PROBE_SIZE)
+        small = image.reduce(factor).convert('L')
+        ink = Image.fromarray(((np.asarray(small) < 128) * 255).astype(np.uint8))
+
+        best_angle = 0.0
+        best_score = -1.0
+        steps = int(self.DESKEW_MAX_ANGLE / self.DESKEW_STEP)
+        for step in range(-steps, steps + 1):
+            angle = step * self.DESKEW_STEP
+            rotated = np.asarray(ink.rotate(angle, resample=Image.NEAREST), dtype=np.float64)
+            # 横書きなら行方向、縦書きなら列方向のプロファイルが鋭くなる
+            score = max(rotated.sum(axis=1).var(), rotated.sum(axis=0).var())
+            if score > best_score:
+                best_angle, best_score = angle, score
+
+        return best_angle
+
+    @staticmethod
+    def restore_coordinates(ocr_data, angle, size):
+        """
+        傾き補正した画像上のOCR結果の座標を、補正前の画像の座標に戻す
+
+        各単語の矩形の中心を回転の逆変換で移動する（矩形の大きさはそのまま）。
+
+        Args:
+            ocr_data: OCR結果（pytesseract.image_to_data の出力形式、その場で変更）
+            angle: apply で回転した角度（度、反時計回り）
+            size: 画像のサイズ (幅, 高さ)
+        """
+        if not angle:
+            return
+
+        radians = math.radians(angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        center_x, center_y = size[0] / 2, size[1] / 2
+
+        for i in range(len(ocr_data['text'])):
+            width, height = ocr_data['width'][i], ocr_data['height'][i]
+            dx = ocr_data['left'][i] + width / 2 - center_x
+            dy = ocr_data['top'][i] + height / 2 - center_y
+            ocr_data['left'][i] = int(round(center_x + dx * cos - dy * sin - width / 2))
+            ocr_data['top'][i] = int(round(center_y + dx * sin + dy * cos - height / 2))
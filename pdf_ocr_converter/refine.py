@@ -0,0 +1,192 @@
+"""
+OCR結果の信頼度の低い行だけを高い解像度でOCRし直すモジュール
+"""
+import fitz  # PyMuPDF
+from PIL import Image
+from .ocr_engine import OCREngine, _TSV_COLUMNS
+
+class ConfidenceRefiner:
+    """
+    ページのOCR結果のうち、信頼度の低い単語を含む行だけを処理し直すクラス
+
+    信頼度が min_confidence 未満の単語を含む行の矩形を、ページの解像度の scale 倍で
+    PyMuPDF により切り出して画像化し、1行用のページセグメンテーション（横書きは PSM 7）で
+    OCRし直す。行の単語の平均信頼度が上がった場合だけ、その行の単語を置き換える。
+    ページ全体を高い解像度で処理し直すより、追加の処理量を大幅に抑えられる。
+    """
+    # 1行だけの画像のページセグメンテーションモード
+    LINE_PSM = {
+        OCREngine.HORIZONTAL: 7,  # 7 = 1行のテキスト
+        OCREngine.VERTICAL: 5,  # 5 = 縦書きテキスト（縦書きの1行専用のモードはない）
+    }
+    # 行の矩形の周囲に付ける余白（行の高さ・縦書きでは行の幅に対する割合）
+    PADDING = 0.3
+
+    def __init__(self, min_confidence=60, scale=2.0, max_dpi=600, max_lines=20):
+        """
+        Args:
+            min_confidence: この信頼度未満の単語を含む行を処理し直す
+            scale: 処理し直す際の、ページの解像度に対する倍率
+            max_dpi: 処理し直す際の解像度の上限
+            max_lines: 1ページで処理し直す行数の上限（信頼度の低い行から順に処理）
+        """
+        self.min_confidence = min_confidence
+        self.scale = scale
+        self.max_dpi = max_dpi
+        self.max_lines = max_lines
+
+    def __repr__(self):
+        return (f"ConfidenceRefiner(min_confidence={self.min_confidence}, scale={self.scale}, "
+                f"max_dpi={self.max_dpi}, max_lines={self.max_lines})")
+
+    def find_weak_lines(self, ocr_data):
+        """
+        信頼度の低い単語を含む行を探す
+
+        Args:
+            ocr_data: OCR結果（pytesseract.image_to_data の出力形式）
+
+        Returns:
+            list: 行の辞書のリスト（key: (block_num, par_num, line_num), bbox: 画像の座標の矩形,
+                  confidence: 単語の平均信頼度）。平均信頼度の低い順に max_lines 行まで
+        """
+        lines = {}
+        for i in range(len(ocr_data['text'])):
+            if not ocr_data['text'][i].strip():
+                continue
+            key = (ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+            left, top = ocr_data['left'][i], ocr_data['top'][i]
+            right, bottom = left + ocr_data['width'][i], top + ocr_data['height'][i]
+
+            line = lines.setdefault(key, {'key': key, 'bbox': [left, top, right, bottom], 'confs': []})
+            line['bbox'] = [min(line['bbox'][0], left), min(line['bbox'][1], top),
+                            max(line['bbox'][2], right), max(line['bbox'][3], bottom)]
+            line['confs'].append(float(ocr_data['conf'][i]))
+
+        weak = []
+        for line in lines.values():
+            if min(line['confs']) < self.min_confidence:
+                weak.append({'key': line['key'], 'bbox': line['bbox'],
+                             'confidence': sum(line['confs']) / len(line['confs'])})
+        weak.sort(key=lambda line: line['confidence'])
+        return weak[:self.max_lines]
+
+    def refine(self, page, ocr_data, dpi, orientation, engine, exclude_regions=None):
+        """
+        信頼度の低い行を高い解像度でOCRし直し、改善した行をOCR結果に反映する
+
+        Args:
+            page: fitz.Page オブジェクト（OCRしたページ）
+            ocr_data: ページのOCR結果（ページ画像の座標）
+            dpi: ページのOCRに使った解像度
+            orientation: 検出されたテキストの向き ('horizontal' または 'vertical')
+            engine: OCREngine オブジェクト（言語・前処理・バックエンドを使用）
+            exclude_regions: ページ画像の座標の除外領域のリスト [(x1, y1, x2, y2), ...]
+
+        Returns:
+            dict: 改善した行を置き換えたOCR結果（改善した行がなければ ocr_data のまま）
+            int: 処理し直した行数
+            int: 置き換えた行数
+        """
+        if orientation not in self.LINE_PSM or page.rotation % 360:
+            return ocr_data, 0, 0
+
+        weak_lines = self.find_weak_lines(ocr_data)
+        if not weak_lines:
+            return ocr_data, 0, 0
+
+        refine_dpi = min(dpi * self.scale, self.max_dpi)
+        if refine_dpi <= dpi:
+            return ocr_data, 0, 0
+
+        replacements = {}
+        with engine.instrumentation.stage('refine', dpi=refine_dpi, lines=len(weak_lines)) as event:
+            for line in weak_lines:
+                words = self._ocr_line(page, line['bbox'], dpi, refine_dpi, orientation, engine, exclude_regions)
+                confs = [float(conf) for conf, text in zip(words['conf'], words['text']) if text.strip()]
+                if confs and sum(confs) / len(confs) > line['confidence']:
+                    replacements[line['key']] = words
+            event['replaced'] = len(replacements)
+
+        if replacements:
+            ocr_data = self._merge(ocr_data, replacements)
+        return ocr_data, len(weak_lines), len(replacements)
+
+    def _ocr_line(self, page, bbox, dpi, refine_dpi, orientation, engine, exclude_regions):
+        """
+        行の矩形を高い解像度で画像化してOCRを行う
+
+        Returns:
+            dict: OCR結果（座標はページ画像の座標に変換済み）
+        """
+        x1, y1, x2, y2 = bbox
+        padding = (y2 - y1 if orientation == OCREngine.HORIZONTAL else x2 - x1) * self.PADDING
+        to_points = 72.0 / dpi
+        clip = fitz.Rect((x1 - padding) * to_points, (y1 - padding) * to_points,
+                         (x2 + padding) * to_points, (y2 + padding) * to_points) & page.rect
+
+        zoom = refine_dpi / 72.0
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+        image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+        # 切り出した画像の座標 → ページ画像の座標
+        factor = dpi / refine_dpi
+        left, top = clip.x0 / to_points, clip.y0 / to_points
+
+        # 切り出した範囲に重なる除外領域を切り出した画像の座標に変換
+        crop_regions = [
+            ((rx1 - left) / factor, (ry1 - top) / factor, (rx2 - left) / factor, (ry2 - top) / factor)
+            for rx1, ry1, rx2, ry2 in exclude_regions or []
+            if rx1 < left + image.width * factor and rx2 > left and ry1 < top + image.height * factor and ry2 > top
+        ]
+
+        prepared, angle = engine.preprocessor.apply(image, crop_regions or None)
+        psm = self.LINE_PSM[orientation]
+        with engine.instrumentation.stage('ocr', orientation=orientation, psm=psm) as event:
+            words = engine.backend.image_to_data(prepared, engine.language, psm, refine_dpi)
+            event['words'] = sum(1 for text in words['text'] if text.strip())
+        engine.preprocessor.restore_coordinates(words, angle, prepared.size)
+
+        words = dict(words)
+        words['left'] = [int(round(left + value * factor)) for value in words['left']]
+        words['top'] = [int(round(top + value * factor)) for value in words['top']]
+        words['width'] = [int(round(value * factor)) for value in words['width']]
+        words['height'] = [int(round(value * factor)) for value in words['height']]
+        return words
+
+    @staticmethod
+    def _merge(ocr_data, replacements):
+        """
+        行の単語を置き換えたOCR結果を作成する
+
+        置き換える行の単語（level 5）を、処理し直した結果の単語で置き換える。
+        単語は元の行のブロック・段落・行番号を引き継ぐ。
+
+        Returns:
+            dict: 新しいOCR結果
+        """
+        merged = {column: [] for column in _TSV_COLUMNS}
+        inserted = set()
+        for i in range(len(ocr_data['text'])):
+            key = (ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+            if key not in replacements or ocr_data['level'][i] != 5:
+                for column in _TSV_COLUMNS:
+                    merged[column].append(ocr_data[column][i])
+                continue
+            if key in inserted:
+                continue
+
+            # 置き換える行の最初の単語の位置に、処理し直した単語をまとめて入れる
+            inserted.add(key)
+            words = replacements[key]
+            word_num = 0
+            for j in range(len(words['text'])):
+                if words['level'][j] != 5 or not words['text'][j].strip():
+                    continue
+                word_num += 1
+                for column in _TSV_COLUMNS:
+                    merged[column].append(words[column][j])
+                merged['page_num'][-1] = ocr_data['page_num'][i]
+                merged['block_num'][-1], merged['par_num'][-1], merged['line_num'][-1] = key
+                merged['word_num'][-1] = word_num
+        return merged
@@ -1,13 +1,19 @@
 """
-除外領域の設定を管理するモジュール
+除外領域・対象領域の設定を管理するモジュール
 """
 
 class RegionSelector:
     """
-    OCR処理時に除外する領域を管理するクラス
+    OCR処理時に除外する領域と、OCR処理の対象とする領域を管理するクラス
+
+    対象領域を指定した場合（またはレイアウトのブロックに分割する場合）は、ページを
+    対象領域ごとの画像（タイル）に切り出してOCRを行い、それ以外の部分は処理しない。
     """
     def __init__(self):
         self.exclude_regions = []
+        self.include_regions = []
+        # 対象領域の指定がない場合に、ページをテキストのブロックに自動で分割するか
+        self.layout_blocks = False
 
     def add_top_region(self, height_percentage=10):
         """ページ上部の特定割合を除外領域として追加"""
@@ -30,8 +36,24 @@ class RegionSelector:
             'coordinates': (x1, y1, x2, y2)
         })
 
+    def add_include_region(self, x1, y1, x2, y2):
+        """ピクセル単位で指定された領域をOCR処理の対象領域として追加"""
+        self.include_regions.append({
+            'type': 'include',
+            'coordinates': (x1, y1, x2, y2)
+        })
+
+    def enable_layout_blocks(self):
+        """ページをテキストのブロックに自動で分割してOCR処理する"""
+        self.layout_blocks = True
+
+    @property
+    def tiled(self):
+        """ページをタイルに切り出してOCR処理するか"""
+        return bool(self.include_regions) or self.layout_blocks
+
     def add_regions_from_config(self, regions_config):
-        """設定から複数の除外領域を追加"""
+        """設定から複数の除外領域・対象領域を追加"""
         for region in regions_config:
             if region['type'] == 'top':
                 self.add_top_region(region.get('height_percentage', 10))
@@ -40,9 +62,19 @@ class RegionSelector:
             elif region['type'] == 'pixel':
                 coords = region['coordinates']
                 self.add_pixel_region(coords[0], coords[1], coords[2], coords[3])
+            elif region['type'] == 'include':
+                coords = region['coordinates']
+                self.add_include_region(coords[0], coords[1], coords[2], coords[3])
+            elif region['type'] == 'layout':
+                self.enable_layout_blocks()
+
+    def get_exclude_regions_for_page(self, page_width, page_height, scale=1.0):
+        """
+        ページサイズに基づいて除外領域の座標を計算
 
-    def get_exclude_regions_for_page(self, page_width, page_height):
-        """ページサイズに基づいて除外領域の座標を計算"""
+        scale にはピクセル座標を指定したときの解像度に対する、
+        実際に画像化した解像度の比を指定する。
+        """
         regions = []
         for region in self.exclude_regions:
             if region['type'] == 'top':
@@ -53,6 +85,25 @@ class RegionSelector:
                 bottom_y = page_height - height
                 regions.append((0, bottom_y, page_width, page_height))
             elif region['type'] == 'pixel':
-                # ピクセル単位の座標はそのまま使用
-                regions.append(region['coordinates'])
+                # ピクセル単位の座標は画像化した解像度に合わせて拡大縮小
+                if scale == 1.0:
+                    regions.append(region['coordinates'])
+                else:
+                    regions.append(tuple(value * scale for value in region['coordinates']))
+        return regions
+
+    def get_include_regions_for_page(self, page_width, page_height, scale=1.0):
+        """
+        ページ内に収まるように対象領域の座標を計算
+
+        scale にはピクセル座標を指定したときの解像度に対する、
+        実際に画像化した解像度の比を指定する。ページ外の領域は含まない。
+        """
+        regions = []
+        for region in self.include_regions:
+            x1, y1, x2, y2 = (value * scale for value in region['coordinates'])
+            left, right = sorted((max(0, min(x1, page_width)), max(0, min(x2, page_width))))
+            top, bottom = sorted((max(0, min(y1, page_height)), max(0, min(y2, page_height))))
+            if right > left and bottom > top:
+                regions.append((left, top, right, bottom))
         return regions
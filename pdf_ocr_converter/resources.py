@@ -0,0 +1,156 @@
+"""
+ワーカー数・Tesseract のスレッド数・同時に処理するページのメモリを調整するモジュール
+"""
+import os
+import fitz  # PyMuPDF
+
+def available_cpus():
+    """このプロセスが使用できるCPU数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+def available_memory_mb():
+    """
+    使用できるメモリ（MB）を取得する
+
+    /proc/meminfo の MemAvailable を使い、取得できない場合は物理メモリの量で代用する。
+    どちらも取得できない場合は None を返す。
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def set_thread_limit(threads):
+    """
+    Tesseract（OpenMP）が使用するスレッド数の上限を設定する
+
+    OpenMP は上限をライブラリの読み込み時にだけ参照するため、OCRを始める前（tesserocr を
+    読み込む前）に呼び出す。設定はワーカープロセスと tesseract コマンドにも引き継がれる。
+    環境変数で既に小さい上限が指定されている場合はそれを使う。
+    """
+    current = os.environ.get('OMP_THREAD_LIMIT')
+    if current and current.isdigit() and int(current) <= threads:
+        return
+    os.environ['OMP_THREAD_LIMIT'] = str(threads)
+
+class ResourceBudget:
+    """
+    ワーカー数・Tesseract のスレッド数・同時に処理するページのメモリを調整するクラス
+
+    ワーカープロセス数 × ページ内のタイルのスレッド数 × Tesseract のスレッド数が
+    CPU数を超えないようにワーカー数とスレッド数を決める。メモリの上限を指定した場合は、
+    ページの大きさと解像度から見積もったメモリの合計が上限に収まる分だけページを投入する。
+    """
+    # ページ画像1画素あたりのメモリ使用量の見積もり（バイト）
+    # 画像化したRGBの画像、前処理後のグレースケール画像、Tesseract 内部の二値化・認識用の画像を含む
+    BYTES_PER_PIXEL = 12
+    # ワーカープロセスごとの固定のメモリ使用量の見積もり（MB、言語モデルとライブラリ）
+    WORKER_BASE_MB = 200
+
+    def __init__(self, memory_mb=None, cpus=None):
+        """
+        Args:
+            memory_mb: ページの処理に使うメモリの上限（MB、None の場合はメモリで投入を制限しない）
+            cpus: 使用するCPU数（None の場合はこのプロセスが使用できるCPU数）
+        """
+        self.memory_mb = memory_mb
+        self.cpus = cpus or available_cpus()
+
+    def __repr__(self):
+        return f"ResourceBudget(memory_mb={self.memory_mb}, cpus={self.cpus})"
+
+    def page_memory(self, width, height, dpi):
+        """
+        1ページの処理に必要なメモリ（バイト）を見積もる
+
+        Args:
+            width: ページの幅（ポイント）
+            height: ページの高さ（ポイント）
+            dpi: 画像変換時の解像度
+        """
+        pixels = (width * dpi / 72.0) * (height * dpi / 72.0)
+        return int(pixels * self.BYTES_PER_PIXEL)
+
+    def page_memories(self, pdf_path, page_nums, dpi, adaptive_dpi=None):
+        """
+        PDFのページごとの処理に必要なメモリを見積もる
+
+        Args:
+            pdf_path: PDFファイルのパス
+            page_nums: ページ番号（0始まり）のリスト
+            dpi: 画像変換時の解像度
+            adaptive_dpi: ページごとに解像度を選択する AdaptiveDPI オブジェクト（指定した場合は最大の解像度で見積もる）
+
+        Returns:
+            dict: ページ番号 → メモリ（バイト）
+        """
+        if adaptive_dpi is not None:
+            dpi = max(dpi, adaptive_dpi.max_dpi)
+        with fitz.open(pdf_path) as doc:
+            return {
+                page_num: self.page_memory(doc[page_num].rect.width, doc[page_num].rect.height, dpi)
+                for page_num in page_nums
+            }
+
+    def page_budget(self, workers):
+        """
+        ワーカープロセスの固定のメモリを除いた、ページの処理に使えるメモリ（バイト）
+
+        Returns:
+            int: メモリ（メモリの上限を指定していない場合は None）
+        """
+        if not self.memory_mb:
+            return None
+        return int((self.memory_mb - self.WORKER_BASE_MB * workers) * 1024 * 1024)
+
+    def plan(self, workers, tile_workers=1, page_memory=None):
+        """
+        ワーカープロセス数と Tesseract のスレッド数を決める
+
+        Args:
+            workers: 指定されたワーカープロセス数
+            tile_workers: 1ページのタイルを並行して処理するスレッド数
+            page_memory: 1ページの処理に必要なメモリ（バイト）。指定した場合は、
+                         すべてのワーカーがこの大きさのページを同時に処理してもメモリの上限に収まる数に制限する
+
+        Returns:
+            int: ワーカープロセス数
+            int: Tesseract のスレッド数
+        """
+        workers = max(1, min(workers, self.cpus))
+        if self.memory_mb:
+            worker_cost = self.WORKER_BASE_MB * 1024 * 1024 + (page_memory or 0)
+            workers = max(1, min(workers, int(self.memory_mb * 1024 * 1024) // worker_cost))
+
+        threads = max(1, self.cpus // (workers * max(tile_workers, 1)))
+        return workers, threads
+
+    def admit(self, memory, in_flight_memory, workers):
+        """
+        ページを投入できるか判定する
+
+        処理中のページがない場合は、見積もりが上限を超えるページも1つだけ投入する。
+
+        Args:
+            memory: 投入するページのメモリの見積もり（バイト）
+            in_flight_memory: 処理中のページのメモリの見積もりの合計（バイト）
+            workers: ワーカープロセス数
+
+        Returns:
+            bool: 投入できる場合は True
+        """
+        budget = self.page_budget(workers)
+        if budget is None or not in_flight_memory:
+            return True
+        return in_flight_memory + memory <= budget
@@ -0,0 +1,334 @@
+"""
+OCR結果の全文検索インデックス（SQLite FTS5）を管理するモジュール
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import fitz  # PyMuPDF
+from .journal import file_signature
+
+def normalize_text(text):
+    """検索用にテキストを正規化する（全角英数字を半角に、英字を小文字にする）"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+class SearchIndex:
+    """
+    PDFのページごとのテキストを全文検索するためのインデックス
+
+    ファイルのパスとページ番号をキーにSQLiteデータベースの FTS5 テーブルに保存する。
+    日本語は単語の区切りがないため trigram トークナイザーを使用し、3文字未満の
+    検索語は部分一致（LIKE）で検索する。ファイルごとに署名（サイズ, 更新日時）を記録し、
+    変更されたファイルのページだけを登録し直す。
+    """
+    # 検索結果の抜粋の前後の文字数
+    SNIPPET_CONTEXT = 20
+    # FTS5 の trigram トークナイザーで検索できる最小の文字数
+    MIN_MATCH_LENGTH = 3
+
+    def __init__(self, path):
+        self.path = path
+        # (プロセスID, スレッドID) → 接続
+        self._conns = {}
+
+    def __getstate__(self):
+        # 接続はプロセス間で共有できないため、ワーカープロセスでは開き直す
+        state = self.__dict__.copy()
+        state['_conns'] = {}
+        return state
+
+    def __repr__(self):
+        return f"SearchIndex({self.path!r})"
+
+    def _connect(self):
+        """データベースに接続する（プロセス・スレッドごとに1つの接続を使用）"""
+        owner = (os.getpid(), threading.get_ident())
+        conn = self._conns.get(owner)
+        if conn is not None:
+            return conn
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, signature TEXT, '
+            'pages INTEGER NOT NULL, updated REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'id INTEGER PRIMARY KEY, '
+            'file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE, '
+            'page_num INTEGER NOT NULL, text TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS pages_file ON pages (file_id)')
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5("
+            "text, content='pages', content_rowid='id', tokenize='trigram')"
+        )
+        # pages テーブルの変更を FTS5 のインデックスに反映
+        conn.execute(
+            'CREATE TRIGGER IF NOT EXISTS pages_insert AFTER INSERT ON pages BEGIN '
+            'INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text); END'
+        )
+        conn.execute(
+            'CREATE TRIGGER IF NOT EXISTS pages_delete AFTER DELETE ON pages BEGIN '
+            "INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+        )
+
+        self._conns[owner] = conn
+        return conn
+
+    def export(self, pdf_path, pages):
+        """
+        出力したPDFのページをインデックスに登録する（PDFProcessor の出力処理として使用）
+
+        Args:
+            pdf_path: 出力したPDFのパス
+            pages: exports.read_pages で取得したページのリスト
+        """
+        self.update(pdf_path, [(page['page_num'], page['text']) for page in pages])
+
+    def update(self, pdf_path, page_texts):
+        """
+        ファイルのページをインデックスに登録する（登録済みのページは置き換える）
+
+        Args:
+            pdf_path: PDFファイルのパス
+            page_texts: (ページ番号, テキスト) のリスト
+        """
+        path = os.path.abspath(pdf_path)
+        signature = json.dumps(file_signature(path))
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM files WHERE path = ?', (path,))
+            file_id = conn.execute(
+                'INSERT INTO files (path, signature, pages, updated) VALUES (?, ?, ?, ?)',
+                (path, signature, len(page_texts), time.time())
+            ).lastrowid
+            conn.executemany(
+                'INSERT INTO pages (file_id, page_num, text) VALUES (?, ?, ?)',
+                [(file_id, page_num, normalize_text(text)) for page_num, text in page_texts]
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def is_current(self, pdf_path):
+        """ファイルが登録済みで、登録後に変更されていないか"""
+        path = os.path.abspath(pdf_path)
+        row = self._connect().execute('SELECT signature FROM files WHERE path = ?', (path,)).fetchone()
+        try:
+            return row is not None and json.loads(row[0]) == file_signature(path)
+        except OSError:
+            return False
+
+    def index_pdf(self, pdf_path, force=False):
+        """
+        PDFにあるテキストをインデックスに登録する（OCR済みのPDFをあとから登録する場合に使用）
+
+        Args:
+            pdf_path: PDFファイルのパス
+            force: 変更されていないファイルも登録し直す場合は True
+
+        Returns:
+            bool: 登録した場合は True（変更がないためスキップした場合は False）
+        """
+        if not force and self.is_current(pdf_path):
+            return False
+
+        with fitz.open(pdf_path) as doc:
+            page_texts = [(page.number, page.get_text()) for page in doc]
+        self.update(pdf_path, page_texts)
+        return True
+
+    def remove(self, pdf_path):
+        """ファイルをインデックスから削除する"""
+        self._connect().execute('DELETE FROM files WHERE path = ?', (os.path.abspath(pdf_path),))
+
+    def prune(self):
+        """
+        存在しなくなったファイルをインデックスから削除する
+
+        Returns:
+            int: 削除したファイル数
+        """
+        conn = self._connect()
+        missing = [path for path, in conn.execute('SELECT path FROM files') if not os.path.exists(path)]
+        for path in missing:
+            self.remove(path)
+        return len(missing)
+
+    def search(self, query, limit=20, raw=False):
+        """
+        インデックスを検索する
+
+        空白で区切った検索語をすべて含むページを、関連度の高い順に返す。
+
+        Args:
+            query: 検索語
+            limit: 返すページ数の上限
+            raw: query を FTS5 の検索式としてそのまま使う場合は True
+
+        Returns:
+            list: 検索結果の辞書のリスト（path, page_num, snippet）
+                  page_num は 0 から始まるページ番号
+        """
+        conn = self._connect()
+
+        if raw:
+            match, like_terms = query, []
+        else:
+            terms = [term for term in normalize_text(query).split() if term]
+            if not terms:
+                return []
+            # trigram トークナイザーは3文字未満の語を検索できないため部分一致で絞り込む
+            match = ' '.join('"' + term.replace('"', '""') + '"'
+                             for term in terms if len(term) >= self.MIN_MATCH_LENGTH)
+            like_terms = [term for term in terms if len(term) < self.MIN_MATCH_LENGTH]
+
+        like_sql = ''.join(" AND p.text LIKE ? ESCAPE '\\'" for _ in like_terms)
+        like_params = ['%' + self._escape_like(term) + '%' for term in like_terms]
+
+        if match:
+            rows = conn.execute(
+                'SELECT f.path, p.page_num, p.text FROM pages_fts '
+                'JOIN pages p ON p.id = pages_fts.rowid JOIN files f ON f.id = p.file_id '
+                'WHERE pages_fts MATCH ?' + like_sql + ' ORDER BY bm25(pages_fts) LIMIT ?',
+                [match] + like_params + [limit]
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT f.path, p.page_num, p.text FROM pages p JOIN files f ON f.id = p.file_id '
+                'WHERE 1' + like_sql + ' ORDER BY f.path, p.page_num LIMIT ?',
+                like_params + [limit]
+            ).fetchall()
+
+        highlight = [] if raw else sorted(terms, key=len, reverse=True)
+        return [
+            {'path': path, 'page_num': page_num, 'snippet': self._snippet(text, highlight)}
+            for path, page_num, text in rows
+        ]
+
+    @staticmethod
+    def _escape_like(term):
+        """LIKE のパターンで特別な意味を持つ文字をエスケープする"""
+        return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    def _snippet(self, text, terms):
+        """最初に見つかった検索語の前後の抜粋（検索語は [ ] で囲む）"""
+        text = ' '.join(text.split())
+        positions = [(text.find(term), term) for term in terms if term in text]
+        if not positions:
+            return text[:self.SNIPPET_CONTEXT * 2]
+
+        position, term = min(positions)
+        start = max(position - self.SNIPPET_CONTEXT, 0)
+        end = position + len(term) + self.SNIPPET_CONTEXT
+        return (
+            ('…' if start > 0 else '') + text[start:position]
+            + '[' + term + ']' + text[position + len(term):end]
+            + ('…' if end < len(text) else '')
+        )
+
+    def stats(self):
+        """
+        インデックスの統計情報を取得する
+
+        Returns:
+            dict: files（ファイル数）, pages（ページ数）
+        """
+        conn = self._connect()
+        files = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        pages = conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        return {'files': files, 'pages': pages}
+
+    def close(self):
+        """このプロセスで開いたデータベースへの接続を閉じる"""
+        pid = os.getpid()
+        for owner in [owner for owner in self._conns if owner[0] == pid]:
+            conn = self._conns.pop(owner)
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # 別のスレッドで開いた接続は閉じられない
+                pass
+
+def _iter_pdf_paths(paths, recursive=False):
+    """ファイルとディレクトリのリストからPDFファイルのパスを列挙する"""
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, '**', '*.pdf') if recursive else os.path.join(path, '*.pdf')
+            yield from sorted(glob.glob(pattern, recursive=recursive))
+        else:
+            yield path
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR済みPDFの全文検索インデックスの検索と登録')
+    parser.add_argument('index', help='検索インデックスのファイル（SQLite）のパス')
+    parser.add_argument('query', nargs='*', help='検索語（空白で区切った語をすべて含むページを検索）')
+    parser.add_argument('-n', '--limit', type=int, default=20, help='表示する検索結果の上限（デフォルト: 20）')
+    parser.add_argument('--raw', action='store_true', help='検索語を FTS5 の検索式としてそのまま使用')
+    parser.add_argument('--json', action='store_true', help='検索結果を1行ずつJSONで出力')
+    parser.add_argument('--add', nargs='+', metavar='PATH',
+                        help='PDFファイル（またはディレクトリ内のPDF）のテキストをインデックスに登録')
+    parser.add_argument('-r', '--recursive', action='store_true', help='--add のディレクトリをサブディレクトリまで検索')
+    parser.add_argument('--force', action='store_true', help='変更されていないファイルも登録し直す')
+    parser.add_argument('--prune', action='store_true', help='存在しなくなったファイルをインデックスから削除')
+    parser.add_argument('--stats', action='store_true', help='登録済みのファイル数とページ数を表示')
+
+    # 検索語をオプションの後に書けるよう、位置引数とオプションを混在させて解析
+    args = parser.parse_intermixed_args()
+    if not (args.query or args.add or args.prune or args.stats):
+        parser.error('検索語、--add、--prune、--stats のいずれかを指定してください')
+
+    index = SearchIndex(args.index)
+    try:
+        if args.add:
+            added = skipped = 0
+            for pdf_path in _iter_pdf_paths(args.add, args.recursive):
+                try:
+                    if index.index_pdf(pdf_path, force=args.force):
+                        added += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    print(f"エラー: {pdf_path} を登録できませんでした: {e}")
+            print(f"登録: {added} ファイル（変更なし: {skipped} ファイル）")
+
+        if args.prune:
+            print(f"削除: {index.prune()} ファイル")
+
+        if args.query:
+            try:
+                results = index.search(' '.join(args.query), limit=args.limit, raw=args.raw)
+            except sqlite3.OperationalError as e:
+                parser.exit(2, f"エラー: 検索式が正しくありません: {e}\n")
+
+            for result in results:
+                if args.json:
+                    print(json.dumps(result, ensure_ascii=False))
+                else:
+                    print(f"{result['path']}:{result['page_num'] + 1}: {result['snippet']}")
+            if not args.json:
+                print(f"{len(results)} 件")
+
+        if args.stats:
+            stats = index.stats()
+            print(f"インデックス: {stats['files']} ファイル, {stats['pages']} ページ")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,655 @@
+"""
+常駐してHTTP経由でOCR処理を受け付けるサービス
+
+ジョブは起動時に作成したワーカープロセスで処理する。PyMuPDF はスレッドセーフでないため、
+PDFを扱う処理はすべてワーカープロセスで行い、1つのプロセスでは同時に1件だけ処理する。
+ワーカープロセスは起動時にOCRバックエンドを作成して言語モデルを読み込み、ジョブ間で
+使い回すため、CLIを毎回起動する場合と比べて小さな文書の処理の待ち時間が短くなる。
+PDFProcessor と OCREngine は入力ファイルや文書内の向きなどの状態を持つため
+ジョブごとに作成するが、作成時に重い処理は行わない。
+
+API:
+    POST   /jobs               PDFを本文として送信してジョブを登録（202、キューが満杯の場合は 429）
+    GET    /jobs/<id>          ジョブの状態を取得（?wait=秒 で完了まで待機）
+    GET    /jobs/<id>/result   処理済みのPDFを取得（未完了の場合は 409）
+    DELETE /jobs/<id>          ジョブを中止
+    GET    /health             キューと実行中のジョブの数を取得
+"""
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from .pdf_processor import PDFProcessor, ProcessingCancelled
+from .region_selector import RegionSelector
+from .ocr_engine import OCREngine, get_ocr_backend
+from .instrumentation import Instrumentation
+
+logger = logging.getLogger(__name__)
+
+class CancelFlag:
+    """
+    ジョブの中止を要求するフラグ
+
+    ワーカープロセスからも確認できるように、ジョブのディレクトリのファイルの有無で表す。
+    PDFProcessor.process の cancel_event として渡せる。
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def set(self):
+        try:
+            with open(self.path, 'a'):
+                pass
+        except OSError:
+            # ジョブのディレクトリが削除済み（処理が終わっている）
+            pass
+
+    def is_set(self):
+        return os.path.exists(self.path)
+
+def init_worker(language, backend):
+    """ワーカープロセスの起動時にOCRバックエンドを作成し、言語モデルを読み込んでおく"""
+    get_ocr_backend(backend).warm_up(language)
+
+def _ping():
+    """ワーカープロセスを起動させるための何もしないタスク"""
+    return os.getpid()
+
+def run_job_task(task):
+    """
+    ワーカープロセスで1件のジョブのPDFを処理する
+
+    Args:
+        task: 処理内容の辞書（input_pdf, output_pdf, options, process, instrument）
+              options は PDFProcessor のコンストラクタ、process は PDFProcessor.process に渡すキーワード引数
+              instrument が True の場合は処理の段階ごとの計測を行う
+
+    Returns:
+        dict: 処理結果の集計（summary）と、記録したイベントのリスト（events）
+    """
+    instrumentation = Instrumentation()
+    processor = PDFProcessor(task['input_pdf'], task['output_pdf'], instrumentation=instrumentation,
+                             **task['options'])
+    if not task.get('instrument'):
+        return {'summary': processor.process(**task['process']), 'events': []}
+
+    # 記録したイベントは親プロセスでシンクに渡す
+    with processor.instrumentation.collect() as events:
+        summary = processor.process(**task['process'])
+    return {'summary': summary, 'events': events}
+
+class Job:
+    """
+    OCR処理のジョブ
+    """
+    # ジョブの状態
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_dir, params):
+        self.id = uuid.uuid4().hex
+        self.job_dir = job_dir
+        self.input_pdf = os.path.join(job_dir, 'input.pdf')
+        self.output_pdf = os.path.join(job_dir, 'output.pdf')
+        self.params = params
+        self.status = self.QUEUED
+        self.summary = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = CancelFlag(os.path.join(job_dir, 'cancel'))
+        # 処理が終わった（完了・失敗・中止）ときにセットされる
+        self.finished_event = threading.Event()
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def to_dict(self):
+        """ジョブの状態をJSONに変換できる辞書にする"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'summary': self.summary,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+class OCRService:
+    """
+    ジョブキューとOCR処理を行うワーカープロセスを管理するクラス
+
+    ワーカープロセスと、キューからジョブを取り出してワーカープロセスに渡すスレッドは
+    サービスの起動時に作成する。ワーカープロセスはジョブ間で使い回されるため、
+    OCRバックエンドと読み込んだ言語モデルもジョブ間で使い回される。
+    キューが満杯の場合は登録を拒否し、クライアントには再試行までの目安の秒数を返す。
+    """
+    # ワーカースレッドが停止の要求を確認する間隔（秒）
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, processor_options=None, workers=2, queue_size=16, work_dir=None,
+                 job_ttl=3600, exclude_config=None):
+        """
+        Args:
+            processor_options: PDFProcessor のコンストラクタに渡すキーワード引数
+            workers: ワーカープロセス数（同時に処理するジョブ数）
+            queue_size: 処理待ちのジョブ数の上限
+            work_dir: 入出力のPDFを置くディレクトリ（None の場合は一時ディレクトリ）
+            job_ttl: 処理が終わったジョブを保持する秒数
+            exclude_config: ExcludeConfig オブジェクト（ジョブのファイル名で除外領域を選択）
+        """
+        self.processor_options = dict(processor_options or {})
+        # 計測のシンクはワーカープロセスに渡せないため、イベントは親プロセスで出力する
+        self.instrumentation = self.processor_options.pop('instrumentation', None) or Instrumentation()
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.exclude_config = exclude_config
+        # 作業ディレクトリを指定しない場合は一時ディレクトリを作成し、停止時に削除する
+        self._owns_work_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='pdf_ocr_service_')
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        self.jobs = {}
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._running = 0
+        # 最近のジョブの処理時間の移動平均（再試行までの目安の計算に使用）
+        self._average_seconds = 1.0
+        self._stopping = threading.Event()
+        self._threads = []
+        self._executor = None
+
+    def start(self):
+        """ワーカープロセスと、ジョブを渡すスレッド・古いジョブの削除を行うスレッドを開始する"""
+        self._executor = self._create_executor()
+        # ワーカープロセスを起動して言語モデルを読み込んでおく
+        for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'ocr-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._cleanup_loop, name='ocr-cleanup', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=30):
+        """
+        新しいジョブの処理をやめ、実行中のジョブを中止する
+
+        処理待ちのジョブは中止し、ワーカースレッド・プロセスの終了を待ってから作業ディレクトリを削除する。
+        実行中のジョブは次のページの処理前に中止される。
+
+        Args:
+            timeout: スレッドの終了を待つ秒数（過ぎても終了しない場合は作業ディレクトリを残す）
+        """
+        self._stopping.set()
+        with self._lock:
+            for job in self.jobs.values():
+                job.cancel_event.set()
+                if job.status == Job.QUEUED:
+                    self._finish(job, Job.CANCELLED)
+
+        # 処理待ちのジョブを取り除き、すべてのワーカーに終了の合図を送る
+        # （キューに入りきらなかった場合も、ワーカーは POLL_INTERVAL ごとに停止を確認する）
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in range(self.workers):
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break
+
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        alive = [thread.name for thread in self._threads if thread.is_alive()]
+        if self._executor is not None:
+            self._executor.shutdown(wait=not alive)
+        if alive:
+            logger.warning("ワーカースレッドが終了しないため作業ディレクトリを残します: %s (%s)",
+                           self.work_dir, ', '.join(alive))
+            return
+
+        if self._owns_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def submit(self, data, params, wait=0):
+        """
+        PDFのデータからジョブを作成してキューに登録する
+
+        Args:
+            data: PDFのバイト列
+            params: ジョブの設定（orientation, dpi, existing_text, 除外領域など）
+            wait: キューが満杯の場合に空きを待つ秒数（0 の場合は待たない）
+
+        Returns:
+            Job: 登録したジョブ（キューが満杯の場合は None）
+        """
+        job_dir = tempfile.mkdtemp(prefix='job_', dir=self.work_dir)
+        job = Job(job_dir, params)
+        with open(job.input_pdf, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            self.jobs[job.id] = job
+        try:
+            if wait > 0:
+                self.queue.put(job, timeout=wait)
+            else:
+                self.queue.put_nowait(job)
+        except queue.Full:
+            self._remove_job(job)
+            return None
+        return job
+
+    def get(self, job_id):
+        """ジョブを取得する（存在しない場合は None）"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        ジョブを中止する
+
+        処理待ちのジョブは処理せずに中止し、実行中のジョブは次のページの処理前に中止する。
+
+        Returns:
+            Job: 対象のジョブ（存在しない場合は None）
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        job.cancel_event.set()
+        with self._lock:
+            if job.status == Job.QUEUED:
+                self._finish(job, Job.CANCELLED)
+        return job
+
+    def retry_after(self):
+        """キューが満杯の場合に再試行するまでの目安の秒数"""
+        return max(1, math.ceil(self._average_seconds * self.queue.qsize() / max(self.workers, 1)))
+
+    def health(self):
+        """サービスの状態を取得する"""
+        return {
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'running': self._running,
+            'workers': self.workers,
+            'jobs': len(self.jobs),
+        }
+
+    def _worker(self):
+        """キューからジョブを取り出して処理する"""
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if job is None:
+                break
+
+            with self._lock:
+                # 処理待ちの間に中止されたジョブは処理しない
+                if job.status != Job.QUEUED:
+                    continue
+                job.status = Job.RUNNING
+                job.started = time.time()
+                self._running += 1
+
+            try:
+                job.summary = self._process(job)
+                status = Job.DONE
+            except ProcessingCancelled:
+                status = Job.CANCELLED
+            except Exception as e:
+                job.error = str(e)
+                status = Job.FAILED
+
+            with self._lock:
+                self._running -= 1
+                self._finish(job, status)
+                self._average_seconds = self._average_seconds * 0.8 + (job.finished - job.started) * 0.2
+
+    def _create_executor(self):
+        """
+        ワーカープロセスのプールを作成する
+
+        HTTPサーバーのスレッドが動いているプロセスを fork しないように、spawn で起動する。
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(self.processor_options.get('language', 'jpn'),
+                      self.processor_options.get('ocr_backend', 'auto')),
+        )
+
+    def _process(self, job):
+        """ジョブのPDFをワーカープロセスで処理する"""
+        params = job.params
+        task = {
+            'input_pdf': job.input_pdf,
+            'output_pdf': job.output_pdf,
+            'options': self.processor_options,
+            'process': {
+                'exclude_regions': self._build_region_selector(params),
+                'dpi': params.get('dpi', 300),
+                'orientation': params.get('orientation', OCREngine.AUTO),
+                'existing_text': params.get('existing_text', PDFProcessor.EXISTING_TEXT_ALL),
+                'cancel_event': job.cancel_event,
+            },
+            'instrument': self.instrumentation.enabled,
+        }
+
+        executor = self._executor
+        try:
+            result = executor.submit(run_job_task, task).result()
+        except BrokenProcessPool:
+            # ワーカープロセスが異常終了した場合は、以降のジョブのためにプールを作り直す
+            with self._lock:
+                if self._executor is executor and not self._stopping.is_set():
+                    self._executor = self._create_executor()
+            executor.shutdown(wait=False)
+            raise
+        self.instrumentation.replay(result['events'])
+        return result['summary']
+
+    def _build_region_selector(self, params):
+        """ジョブの設定から除外領域・対象領域を作成する"""
+        region_selector = RegionSelector()
+        if params.get('exclude_top'):
+            region_selector.add_top_region(params.get('top_percentage', 10))
+        if params.get('exclude_bottom'):
+            region_selector.add_bottom_region(params.get('bottom_percentage', 5))
+        for region in params.get('exclude_regions', []):
+            region_selector.add_pixel_region(*region)
+        for region in params.get('include_regions', []):
+            region_selector.add_include_region(*region)
+        if params.get('layout_blocks'):
+            region_selector.enable_layout_blocks()
+        if self.exclude_config and params.get('filename'):
+            region_selector.add_regions_from_config(
+                self.exclude_config.get_regions_for_file(params['filename'])
+            )
+        return region_selector
+
+    def _finish(self, job, status):
+        """ジョブを終了状態にする（ロックを取得した状態で呼び出す）"""
+        job.status = status
+        job.finished = time.time()
+        if status != Job.DONE:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+        job.finished_event.set()
+
+    def _remove_job(self, job):
+        """ジョブとその入出力のファイルを削除する"""
+        with self._lock:
+            self.jobs.pop(job.id, None)
+        shutil.rmtree(job.job_dir, ignore_errors=True)
+
+    def _cleanup_loop(self):
+        """処理が終わってから job_ttl 秒を過ぎたジョブを定期的に削除する"""
+        while not self._stopping.wait(min(60, self.job_ttl)):
+            now = time.time()
+            with self._lock:
+                expired = [job for job in self.jobs.values()
+                           if job.is_finished and now - job.finished > self.job_ttl]
+            for job in expired:
+                self._remove_job(job)
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """OCRサービスのHTTPリクエストを処理するハンドラ"""
+    # アップロードできるPDFの最大サイズ
+    MAX_UPLOAD_SIZE = 512 * 1024 * 1024
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix ソケットの場合はクライアントのアドレスがない
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {'error': message}, headers)
+
+    def _route(self):
+        """パスを (ジョブID, 'result' など) に分解する"""
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        return parts, parse_qs(url.query)
+
+    def do_GET(self):
+        parts, query = self._route()
+
+        if parts == ['health']:
+            self._send_json(200, self.service.health())
+            return
+
+        if len(parts) < 2 or parts[0] != 'jobs':
+            self._send_error(404, '見つかりません')
+            return
+
+        job = self.service.get(parts[1])
+        if job is None:
+            self._send_error(404, 'ジョブが見つかりません')
+            return
+
+        if len(parts) == 2:
+            # 完了まで待機するロングポーリング
+            try:
+                wait = parse_wait(query, 'wait', 300)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            if wait > 0:
+                job.finished_event.wait(wait)
+            self._send_json(200, job.to_dict())
+        elif parts[2:] == ['result']:
+            if job.status != Job.DONE:
+                self._send_error(409, f'ジョブは処理が完了していません: {job.status}')
+                return
+            with open(job.output_pdf, 'rb') as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_error(404, '見つかりません')
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts != ['jobs']:
+            self._send_error(404, '見つかりません')
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_error(400, 'リクエストの本文はPDFファイルである必要があります')
+            return
+        if length > self.MAX_UPLOAD_SIZE:
+            self._send_error(413, 'PDFファイルが大きすぎます')
+            return
+
+        data = self.rfile.read(length)
+
+        try:
+            params = parse_job_params(query)
+            wait = parse_wait(query, 'queue_wait', 60)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        if not data.startswith(b'%PDF'):
+            self._send_error(400, 'リクエストの本文はPDFファイルである必要があります')
+            return
+
+        job = self.service.submit(data, params, wait)
+        if job is None:
+            # キューが満杯の場合は再試行を促す
+            retry_after = self.service.retry_after()
+            self._send_error(429, 'ジョブのキューが満杯です', {'Retry-After': str(retry_after)})
+            return
+
+        self._send_json(202, job.to_dict(), {'Location': f'/jobs/{job.id}'})
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_error(404, '見つかりません')
+            return
+
+        job = self.service.cancel(parts[1])
+        if job is None:
+            self._send_error(404, 'ジョブが見つかりません')
+            return
+        self._send_json(200, job.to_dict())
+
+def parse_job_params(query):
+    """
+    クエリ文字列からジョブの設定を作成する
+
+    Args:
+        query: urllib.parse.parse_qs の結果
+
+    Returns:
+        dict: ジョブの設定
+    """
+    def first(name, default=None):
+        return query.get(name, [default])[0]
+
+    def flag(name):
+        return first(name, '0').lower() in ('1', 'true', 'yes')
+
+    params = {
+        'orientation': first('orientation', OCREngine.AUTO),
+        'dpi': int(first('dpi', '300')),
+        'existing_text': first('existing_text', PDFProcessor.EXISTING_TEXT_ALL),
+        'exclude_top': flag('exclude_top'),
+        'top_percentage': int(first('top_percentage', '10')),
+        'exclude_bottom': flag('exclude_bottom'),
+        'bottom_percentage': int(first('bottom_percentage', '5')),
+        'exclude_regions': [
+            [int(value) for value in region.split(',')] for region in query.get('exclude_region', [])
+        ],
+        'include_regions': [
+            [int(value) for value in region.split(',')] for region in query.get('include_region', [])
+        ],
+        'layout_blocks': flag('layout_blocks'),
+        'filename': first('filename'),
+    }
+
+    if params['orientation'] not in (OCREngine.AUTO, OCREngine.HORIZONTAL, OCREngine.VERTICAL):
+        raise ValueError(f"不明なテキストの向きです: {params['orientation']}")
+    if params['existing_text'] not in (PDFProcessor.EXISTING_TEXT_ALL, PDFProcessor.EXISTING_TEXT_SKIP,
+                                       PDFProcessor.EXISTING_TEXT_REDO):
+        raise ValueError(f"不明な既存テキストの扱いです: {params['existing_text']}")
+    if any(len(region) != 4 for region in params['exclude_regions']):
+        raise ValueError('exclude_region は x1,y1,x2,y2 の形式で指定してください')
+    if any(len(region) != 4 for region in params['include_regions']):
+        raise ValueError('include_region は x1,y1,x2,y2 の形式で指定してください')
+    return params
+
+def parse_wait(query, name, limit):
+    """
+    クエリ文字列から待機する秒数を取得する
+
+    Args:
+        query: urllib.parse.parse_qs の結果
+        name: パラメータ名
+        limit: 秒数の上限（これより大きい値はこの値にする）
+
+    Returns:
+        float: 待機する秒数（指定されていない場合は 0）
+    """
+    value = query.get(name, ['0'])[0]
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = math.nan
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError(f"{name} は0以上の秒数で指定してください: {value}")
+    return min(seconds, limit)
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix ソケットで待ち受けるHTTPサーバー"""
+    daemon_threads = True
+
+def serve(service, host='127.0.0.1', port=8765, socket_path=None, verbose=False):
+    """
+    OCRサービスを起動し、中断されるまでリクエストを処理する
+
+    Args:
+        service: OCRService オブジェクト
+        host: 待ち受けるホスト
+        port: 待ち受けるポート
+        socket_path: Unix ソケットのパス（指定した場合は host と port を使用しない）
+        verbose: リクエストごとのログを表示するか
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+        address = f"http://{host}:{server.server_address[1]}"
+
+    server.service = service
+    server.verbose = verbose
+    service.start()
+    print(f"OCRサービスを起動しました: {address}（ワーカー数: {service.workers}, "
+          f"キューの上限: {service.queue.maxsize}）")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nOCRサービスを停止します...")
+    finally:
+        service.stop()
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,154 @@
+"""
+入力ディレクトリを監視し、追加・変更されたPDFを継続的に処理するモジュール
+"""
+import os
+import threading
+import time
+from .journal import file_signature
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+class _WakeHandler(FileSystemEventHandler):
+    """ファイルシステムのイベントを受け取ったら監視ループを起こすハンドラ"""
+    def __init__(self, wake_event):
+        super().__init__()
+        self.wake_event = wake_event
+
+    def on_any_event(self, event):
+        self.wake_event.set()
+
+class HotFolderWatcher:
+    """
+    入力ディレクトリを監視し、書き込みが終わったPDFだけを BatchProcessor で処理するクラス
+
+    一定間隔でディレクトリを走査し、サイズと更新日時が settle_time 秒以上変化せず、
+    末尾に %%EOF のあるファイルを書き込みが終わったものとみなす。処理済みのファイルは
+    処理後の署名を記録し、再び変更されるまで処理しない。watchdog がインストールされて
+    いる場合は、ファイルシステムのイベントで走査を前倒しする（処理の判定は走査で行う）。
+    """
+    # 書き込みの完了を確認するために読み込むファイル末尾のバイト数
+    EOF_CHECK_SIZE = 1024
+
+    def __init__(self, batch_processor, interval=5.0, settle_time=10.0, max_batch_files=16):
+        """
+        Args:
+            batch_processor: BatchProcessor オブジェクト
+            interval: ディレクトリを走査する間隔（秒）
+            settle_time: 変更がなくなってから処理を始めるまでの秒数
+            max_batch_files: 一度に処理するファイル数の上限（残りは次の走査で処理）
+        """
+        self.batch_processor = batch_processor
+        self.interval = interval
+        self.settle_time = settle_time
+        self.max_batch_files = max_batch_files
+        # パス → 処理後（または処理に失敗した時点）の署名
+        self.processed = {}
+        # パス → (署名, 署名を最初に確認した時刻)
+        self.pending = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def scan(self, now=None):
+        """
+        ディレクトリを走査し、処理できる状態のファイルを返す
+
+        Args:
+            now: 現在時刻（省略時は time.time()）
+
+        Returns:
+            list: 処理するPDFファイルのパスのリスト（max_batch_files 件まで、古いものから）
+        """
+        now = time.time() if now is None else now
+        ready = []
+        present = set()
+
+        for pdf_path in self.batch_processor.get_pdf_files():
+            present.add(pdf_path)
+            try:
+                signature = file_signature(pdf_path)
+            except OSError:
+                # 走査中に削除・移動されたファイル
+                continue
+
+            if self.processed.get(pdf_path) == signature:
+                continue
+
+            previous = self.pending.get(pdf_path)
+            if previous is None or previous[0] != signature:
+                # 新しいファイルか、前回の走査から変更されたファイル
+                self.pending[pdf_path] = (signature, now)
+                continue
+
+            if now - previous[1] >= self.settle_time and self._is_complete(pdf_path):
+                ready.append((previous[1], pdf_path))
+
+        # 削除されたファイルの記録を破棄
+        for path in list(self.pending):
+            if path not in present:
+                del self.pending[path]
+        for path in list(self.processed):
+            if path not in present:
+                del self.processed[path]
+
+        return [pdf_path for _, pdf_path in sorted(ready)[:self.max_batch_files]]
+
+    def _is_complete(self, pdf_path):
+        """ファイルの末尾に %%EOF があるか（書き込み途中のPDFには通常ない）"""
+        try:
+            with open(pdf_path, 'rb') as f:
+                f.seek(max(os.path.getsize(pdf_path) - self.EOF_CHECK_SIZE, 0))
+                return b'%%EOF' in f.read()
+        except OSError:
+            return False
+
+    def process(self, pdf_files):
+        """ファイルを処理し、処理後の署名を記録する"""
+        self.batch_processor.process_all(pdf_files)
+
+        for pdf_path in pdf_files:
+            self.pending.pop(pdf_path, None)
+            try:
+                # 上書きの場合は処理後のファイルの署名を記録（失敗した場合は変更されるまで再処理しない）
+                self.processed[pdf_path] = file_signature(pdf_path)
+            except OSError:
+                self.processed.pop(pdf_path, None)
+
+    def run(self):
+        """停止されるまで監視と処理を繰り返す"""
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(_WakeHandler(self._wake), self.batch_processor.input_dir,
+                              recursive=self.batch_processor.recursive)
+            observer.start()
+
+        print(f"ディレクトリを監視しています: {self.batch_processor.input_dir}"
+              f"（{'ファイルシステムのイベントと' if observer else ''}{self.interval}秒ごとの走査、Ctrl+C で終了）")
+
+        try:
+            while not self._stopping.is_set():
+                pdf_files = self.scan()
+                if pdf_files:
+                    self.process(pdf_files)
+                    # 上限を超えて残っているファイルがあれば続けて処理
+                    continue
+
+                # 次の走査まで待機（ファイルシステムのイベントがあれば早めに走査）
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            print("\n監視を終了します。")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def stop(self):
+        """監視を停止する"""
+        self._stopping.set()
+        self._wake.set()
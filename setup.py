@@ -16,15 +16,21 @@ setup(
         "tqdm>=4.62.0",
         "numpy>=1.20.0",
     ],
+    extras_require={
+        "tesserocr": ["tesserocr>=2.5.0"],
+        "watch": ["watchdog>=2.1.0"],
+    },
     entry_points={
         "console_scripts": [
             "pdf-ocr=pdf_ocr_converter.main:main",
             "pdf-ocr-config=pdf_ocr_converter.config_helper:main",
+            "pdf-ocr-benchmark=pdf_ocr_converter.benchmark:main",
+            "pdf-ocr-search=pdf_ocr_converter.search_index:main",
         ],
     },
     author="PDF OCR Converter Team",
     author_email="example@example.com",
     description="画像PDFからOCRでテキストを抽出し検索可能なPDFを生成するツール",
     keywords="pdf, ocr, text extraction, vertical text",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
@@ -0,0 +1,57 @@
+"""
+ChunkCheckpoint のテスト
+"""
+import os
+from pdf_ocr_converter.journal import ChunkCheckpoint
+
+def make_input(tmp_path):
+    path = tmp_path / 'in.pdf'
+    path.write_bytes(b'%PDF input')
+    return str(path)
+
+def test_working_file_is_next_to_output(tmp_path):
+    checkpoint = ChunkCheckpoint(make_input(tmp_path), str(tmp_path / 'out' / 'result.pdf'), 10)
+    assert checkpoint.working_path == str(tmp_path / 'out' / '.result.pdf.partial')
+    assert checkpoint.progress_path == checkpoint.working_path + '.json'
+
+def test_resume_restores_saved_pages(tmp_path):
+    input_pdf = make_input(tmp_path)
+    checkpoint = ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2)
+    assert not checkpoint.load()
+    checkpoint.start()
+    checkpoint.record([0, 1], 1)
+    checkpoint.record([2, 3], 0)
+
+    resumed = ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2)
+    assert resumed.load()
+    assert resumed.pages == {0, 1, 2, 3}
+    assert resumed.blank == 1
+
+def test_changed_input_starts_over(tmp_path):
+    input_pdf = make_input(tmp_path)
+    checkpoint = ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2)
+    checkpoint.start()
+    checkpoint.record([0, 1], 0)
+
+    with open(input_pdf, 'ab') as f:
+        f.write(b' changed')
+    assert not ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2).load()
+
+def test_changed_working_file_starts_over(tmp_path):
+    input_pdf = make_input(tmp_path)
+    checkpoint = ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2)
+    checkpoint.start()
+    checkpoint.record([0, 1], 0)
+
+    # 記録の後に書き込まれた（保存途中で中断した）作業ファイルは使わない
+    with open(checkpoint.working_path, 'ab') as f:
+        f.write(b' partial save')
+    assert not ChunkCheckpoint(input_pdf, str(tmp_path / 'out.pdf'), 2).load()
+
+def test_discard_removes_files(tmp_path):
+    checkpoint = ChunkCheckpoint(make_input(tmp_path), str(tmp_path / 'out.pdf'), 2)
+    checkpoint.start()
+    checkpoint.discard()
+    assert not os.path.exists(checkpoint.working_path)
+    assert not os.path.exists(checkpoint.progress_path)
+    checkpoint.discard()
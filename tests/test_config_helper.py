@@ -0,0 +1,15 @@
+"""
+config_helper をスクリプトとして直接実行できることのテスト
+"""
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'pdf_ocr_converter', 'config_helper.py')
+
+def test_runs_as_script(tmp_path):
+    result = subprocess.run([sys.executable, SCRIPT, '--help'], cwd=str(tmp_path),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    assert '--analyze' in result.stdout
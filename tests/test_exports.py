@@ -0,0 +1,50 @@
+"""
+サイドカーファイルの書き出しのテスト
+"""
+import re
+from pdf_ocr_converter.exports import SidecarExporter, join_words, ocr_lines
+
+def make_ocr_data():
+    """2行（1行目は2単語）のOCR結果"""
+    return {
+        'block_num': [1, 1, 1], 'par_num': [1, 1, 1], 'line_num': [1, 1, 2],
+        'left': [300, 700, 300], 'top': [300, 300, 600], 'width': [300, 150, 600], 'height': [60, 60, 60],
+        'conf': [95.0, 80.0, -1.0], 'text': ['日本語', 'OCR', '二行目'],
+    }
+
+def make_page(dpi=300):
+    return {
+        'page_num': 0, 'width': 595.0, 'height': 842.0, 'source': 'ocr', 'orientation': 'horizontal',
+        'dpi': dpi, 'lines': ocr_lines(make_ocr_data(), dpi), 'text': '',
+    }
+
+def titles(content, css_class):
+    return re.findall(rf'class="{css_class}"[^>]* title="([^"]*)"', content)
+
+def test_join_words_spaces_only_between_narrow_words():
+    assert join_words(['日本語', '文字']) == '日本語文字'
+    assert join_words(['日本語', 'OCR', 'test']) == '日本語 OCR test'
+
+def test_ocr_lines_uses_points():
+    lines = ocr_lines(make_ocr_data(), 300)
+    assert len(lines) == 2
+    assert [word['text'] for word in lines[0]['words']] == ['日本語', 'OCR']
+    assert lines[0]['words'][0]['bbox'] == [72.0, 72.0, 144.0, 86.4]
+    assert lines[0]['bbox'] == [72.0, 72.0, 204.0, 86.4]
+
+def test_hocr_uses_pixels_at_ocr_resolution():
+    content = SidecarExporter.to_hocr('doc.pdf', [make_page(300)])
+    page_title, = titles(content, 'ocr_page')
+    assert page_title == 'bbox 0 0 2479 3508; ppageno 0; scan_res 300 300'
+    assert titles(content, 'ocr_line')[0] == 'bbox 300 300 850 360'
+    words = titles(content, 'ocrx_word')
+    assert words[0] == 'bbox 300 300 600 360; x_wconf 95'
+    assert words[2] == 'bbox 300 600 900 660; x_wconf 0'
+
+def test_hocr_pages_without_ocr_use_points():
+    page = dict(make_page(), source='pdf', dpi=None, lines=[
+        {'bbox': [72.0, 72.0, 144.0, 86.0], 'words': [{'text': 'x', 'conf': None, 'bbox': [72.0, 72.0, 144.0, 86.0]}]}
+    ])
+    content = SidecarExporter.to_hocr('doc.pdf', [page])
+    assert titles(content, 'ocr_page') == ['bbox 0 0 595 842; ppageno 0; scan_res 72 72']
+    assert titles(content, 'ocrx_word') == ['bbox 72 72 144 86']
@@ -0,0 +1,96 @@
+"""
+BatchJournal のテスト
+"""
+import json
+from pdf_ocr_converter.journal import BatchJournal, file_signature
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_finished_file_is_up_to_date(tmp_path):
+    input_pdf = write(tmp_path / 'in.pdf', b'%PDF input')
+    output_pdf = write(tmp_path / 'out.pdf', b'%PDF output')
+    journal = BatchJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record_file(input_pdf, file_signature(input_pdf), output_pdf)
+    journal.close()
+
+    journal = BatchJournal(str(tmp_path / 'journal.jsonl'))
+    assert journal.is_up_to_date(input_pdf, output_pdf)
+    assert not journal.is_up_to_date(input_pdf, str(tmp_path / 'other.pdf'))
+
+    # 入力が変更された場合は処理し直す
+    write(tmp_path / 'in.pdf', b'%PDF changed input')
+    assert not journal.is_up_to_date(input_pdf, output_pdf)
+    journal.close()
+
+def test_page_results_are_restored_for_same_input(tmp_path):
+    input_pdf = write(tmp_path / 'in.pdf', b'%PDF input')
+    signature = file_signature(input_pdf)
+    journal = BatchJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record_page(input_pdf, signature, {'page_num': 0, 'orientation': 'horizontal'})
+    journal.record_page(input_pdf, signature, {'page_num': 1, 'orientation': 'vertical'})
+    journal.close()
+
+    journal = BatchJournal(str(tmp_path / 'journal.jsonl'))
+    results = journal.get_page_results(input_pdf, signature)
+    assert sorted(results) == [0, 1]
+    assert results[1]['orientation'] == 'vertical'
+    assert journal.get_page_results(input_pdf, [0, 0]) == {}
+    journal.close()
+
+def test_compaction_drops_superseded_records(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    input_pdf = write(tmp_path / 'in.pdf', b'%PDF input')
+    output_pdf = write(tmp_path / 'out.pdf', b'%PDF output')
+    signature = file_signature(input_pdf)
+
+    journal = BatchJournal(path)
+    journal.record_page(input_pdf, [1, 1], {'page_num': 0})
+    journal.record_page(input_pdf, signature, {'page_num': 0})
+    journal.record_page(input_pdf, signature, {'page_num': 0, 'orientation': 'vertical'})
+    journal.close()
+
+    # 入力の署名が変わる前のページと、同じページの古い記録は残らない
+    journal = BatchJournal(path)
+    journal.close()
+    records = read_records(path)
+    assert len(records) == 1
+    assert records[0]['result'] == {'page_num': 0, 'orientation': 'vertical'}
+
+    # ファイルの完了後はページの記録も残らない
+    journal = BatchJournal(path)
+    journal.record_file(input_pdf, signature, output_pdf)
+    journal.close()
+    journal = BatchJournal(path)
+    journal.close()
+    assert [record['event'] for record in read_records(path)] == ['file']
+
+def test_truncated_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    input_pdf = write(tmp_path / 'in.pdf', b'%PDF input')
+    signature = file_signature(input_pdf)
+    journal = BatchJournal(str(path))
+    journal.record_page(input_pdf, signature, {'page_num': 0})
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"event": "page", "inp')
+
+    journal = BatchJournal(str(path))
+    assert list(journal.get_page_results(input_pdf, signature)) == [0]
+    journal.close()
+
+def test_without_resume_starts_empty(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    input_pdf = write(tmp_path / 'in.pdf', b'%PDF input')
+    journal = BatchJournal(path)
+    journal.record_page(input_pdf, file_signature(input_pdf), {'page_num': 0})
+    journal.close()
+
+    journal = BatchJournal(path, resume=False)
+    journal.close()
+    assert read_records(path) == []
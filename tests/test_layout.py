@@ -0,0 +1,48 @@
+"""
+find_text_blocks のテスト
+"""
+from PIL import Image, ImageDraw
+from pdf_ocr_converter.layout import find_text_blocks
+
+DPI = 100
+
+def draw_lines(draw, left, top, right, lines):
+    """文字の行に見立てた黒い帯を描く"""
+    for index in range(lines):
+        y = top + index * 20
+        draw.rectangle((left, y, right, y + 8), fill=0)
+
+def make_two_column_page():
+    image = Image.new('L', (800, 1000), 255)
+    draw = ImageDraw.Draw(image)
+    draw_lines(draw, 50, 100, 350, 10)
+    draw_lines(draw, 450, 100, 750, 10)
+    return image
+
+def contains(block, point):
+    x1, y1, x2, y2 = block
+    return x1 <= point[0] <= x2 and y1 <= point[1] <= y2
+
+def test_columns_become_separate_blocks():
+    blocks = find_text_blocks(make_two_column_page(), DPI)
+    assert len(blocks) == 2
+    left, right = sorted(blocks)
+    assert contains(left, (50, 100)) and contains(left, (350, 288))
+    assert contains(right, (450, 100)) and contains(right, (750, 288))
+    assert left[2] < 450 and right[0] > 350
+
+def test_blank_page_has_no_blocks():
+    assert find_text_blocks(Image.new('L', (800, 1000), 255), DPI) == []
+
+def test_excluded_regions_are_ignored():
+    blocks = find_text_blocks(make_two_column_page(), DPI, exclude_regions=[(400, 0, 800, 1000)])
+    assert len(blocks) == 1
+    assert blocks[0][2] < 450
+
+def test_too_many_blocks_returns_none():
+    assert find_text_blocks(make_two_column_page(), DPI, max_blocks=1) is None
+
+def test_isolated_speck_is_not_a_block():
+    image = make_two_column_page()
+    image.putpixel((400, 900), 0)
+    assert len(find_text_blocks(image, DPI)) == 2
@@ -0,0 +1,96 @@
+"""
+OCRCache のテスト
+"""
+import pickle
+from PIL import Image
+from pdf_ocr_converter.ocr_cache import OCRCache
+
+def make_cache(tmp_path, max_size=1024 * 1024):
+    return OCRCache(str(tmp_path / 'cache.db'), max_size=max_size)
+
+def test_make_key_depends_on_ocr_settings():
+    key = OCRCache.make_key('digest', 'jpn', 3, 300, [(0, 0, 10, 10)], {'mode': 'gray'})
+    assert key == OCRCache.make_key('digest', 'jpn', 3, 300, [[0.0, 0.0, 10.0, 10.0]], {'mode': 'gray'})
+    assert key != OCRCache.make_key('digest', 'jpn', 5, 300, [(0, 0, 10, 10)], {'mode': 'gray'})
+    assert key != OCRCache.make_key('digest', 'jpn', 3, 200, [(0, 0, 10, 10)], {'mode': 'gray'})
+    assert key != OCRCache.make_key('digest', 'jpn', 3, 300, None, {'mode': 'gray'})
+    assert key != OCRCache.make_key('digest', 'eng', 3, 300, [(0, 0, 10, 10)], {'mode': 'gray'})
+
+def test_image_digest_depends_on_pixels():
+    image = Image.new('L', (20, 10), 255)
+    other = image.copy()
+    other.putpixel((3, 3), 0)
+    assert OCRCache.image_digest(image) == OCRCache.image_digest(image.copy())
+    assert OCRCache.image_digest(image) != OCRCache.image_digest(other)
+    assert OCRCache.image_digest(image) != OCRCache.image_digest(Image.new('L', (10, 20), 255))
+
+def test_get_returns_stored_result(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('key', {'text': ['縦書き'], 'conf': [90.0]})
+    assert cache.get('key') == {'text': ['縦書き'], 'conf': [90.0]}
+    assert cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+def test_stats_are_written_in_batches(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('key', {'text': ['a']})
+    for _ in range(3):
+        cache.get('key')
+    cache.get('missing')
+
+    # 参照だけではデータベースに書き込まない
+    conn = cache._connect()
+    assert dict(conn.execute('SELECT name, value FROM stats').fetchall())['hits'] == 0
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (3, 1, 1)
+    cache.close()
+
+def test_stats_are_flushed_after_interval(tmp_path):
+    cache = make_cache(tmp_path)
+    for _ in range(OCRCache.FLUSH_INTERVAL):
+        cache.get('missing')
+    conn = cache._connect()
+    assert dict(conn.execute('SELECT name, value FROM stats').fetchall())['misses'] == OCRCache.FLUSH_INTERVAL
+    cache.close()
+
+def test_size_total_is_kept_on_replace(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('key', {'text': ['a' * 100]})
+    cache.put('key', {'text': ['b']})
+    cache.put('other', {'text': ['c']})
+    conn = cache._connect()
+    assert cache.stats()['size'] == conn.execute('SELECT SUM(size) FROM entries').fetchone()[0]
+    cache.close()
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('first', {'text': ['1']})
+    cache.put('second', {'text': ['2']})
+    entry_size = cache.stats()['size'] // 2
+
+    # 参照した first は残り、参照していない second が削除される
+    cache.get('first')
+    cache.max_size = entry_size * 2
+    cache.put('third', {'text': ['3']})
+
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
+    assert cache.stats()['size'] <= cache.max_size
+    cache.close()
+
+def test_pickled_cache_reopens_connection(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('key', {'text': ['a']})
+    cache.get('missing')
+
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get('key') == {'text': ['a']}
+    copy.close()
+
+    # 未書き込みの統計はコピーに引き継がれない
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    cache.close()
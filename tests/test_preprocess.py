@@ -0,0 +1,43 @@
+"""
+ImagePreprocessor のテスト
+"""
+import numpy as np
+from PIL import Image
+from pdf_ocr_converter.preprocess import ImagePreprocessor
+
+def make_page():
+    """白地に黒い四角を2つ描いたRGBの画像"""
+    pixels = np.full((60, 80, 3), 255, dtype=np.uint8)
+    pixels[5:15, 5:15] = 0
+    pixels[40:50, 50:70] = 60
+    return Image.fromarray(pixels)
+
+def test_masks_regions_without_changing_input():
+    page = make_page()
+    before = np.asarray(page).copy()
+    for mode in (ImagePreprocessor.RGB, ImagePreprocessor.GRAY, ImagePreprocessor.BINARY):
+        result, angle = ImagePreprocessor(mode).apply(page, [(0, 0, 20.5, 20.5)])
+        pixels = np.asarray(result)
+        assert angle == 0.0
+        assert (pixels[:22, :22] == 255).all()
+        assert (pixels[40:50, 50:70] < 128).all()
+    assert np.array_equal(np.asarray(page), before)
+
+def test_gray_mode_returns_single_channel():
+    result, _ = ImagePreprocessor(ImagePreprocessor.GRAY).apply(make_page())
+    assert result.mode == 'L'
+    assert result.getpixel((10, 10)) == 0
+    assert result.getpixel((60, 45)) == 60
+
+def test_binary_mode_uses_two_levels():
+    result, _ = ImagePreprocessor(ImagePreprocessor.BINARY).apply(make_page())
+    pixels = np.asarray(result)
+    assert set(np.unique(pixels)) == {0, 255}
+    assert (pixels[40:50, 50:70] == 0).all()
+    assert pixels[30, 30] == 255
+
+def test_regions_outside_image_are_clipped():
+    result, _ = ImagePreprocessor().apply(make_page(), [(70, 50, 200, 200), (-10, -10, -5, -5)])
+    pixels = np.asarray(result)
+    assert (pixels[50:, 70:] == 255).all()
+    assert pixels[10, 10] == 0
@@ -0,0 +1,66 @@
+"""
+ConfidenceRefiner の信頼度の低い行の検出と、処理し直した行の置き換えのテスト
+"""
+from pdf_ocr_converter.ocr_engine import _TSV_COLUMNS
+from pdf_ocr_converter.refine import ConfidenceRefiner
+
+def make_data(rows):
+    """(level, block, par, line, word, left, top, width, height, conf, text) の行からOCR結果を作る"""
+    data = {column: [] for column in _TSV_COLUMNS}
+    for level, block, par, line, word, left, top, width, height, conf, text in rows:
+        values = {
+            'level': level, 'page_num': 1, 'block_num': block, 'par_num': par, 'line_num': line,
+            'word_num': word, 'left': left, 'top': top, 'width': width, 'height': height,
+            'conf': conf, 'text': text,
+        }
+        for column in _TSV_COLUMNS:
+            data[column].append(values[column])
+    return data
+
+def make_page():
+    """2行（1行目は信頼度の低い単語を含む）のOCR結果"""
+    return make_data([
+        (4, 1, 1, 1, 0, 100, 100, 400, 40, -1, ''),
+        (5, 1, 1, 1, 1, 100, 100, 150, 40, 90.0, 'good'),
+        (5, 1, 1, 1, 2, 300, 105, 200, 40, 30.0, 'b4d'),
+        (4, 1, 1, 2, 0, 100, 200, 300, 40, -1, ''),
+        (5, 1, 1, 2, 1, 100, 200, 300, 40, 95.0, 'fine'),
+    ])
+
+def test_find_weak_lines_returns_line_bbox_and_mean_confidence():
+    weak = ConfidenceRefiner(min_confidence=60).find_weak_lines(make_page())
+    assert weak == [{'key': (1, 1, 1), 'bbox': [100, 100, 500, 145], 'confidence': 60.0}]
+
+def test_find_weak_lines_orders_by_confidence_and_limits():
+    data = make_data([
+        (5, 1, 1, 1, 1, 0, 0, 10, 10, 50.0, 'a'),
+        (5, 1, 1, 2, 1, 0, 20, 10, 10, 10.0, 'b'),
+        (5, 1, 1, 3, 1, 0, 40, 10, 10, 30.0, 'c'),
+    ])
+    weak = ConfidenceRefiner(min_confidence=60, max_lines=2).find_weak_lines(data)
+    assert [line['key'] for line in weak] == [(1, 1, 2), (1, 1, 3)]
+
+def test_merge_replaces_only_words_of_the_line():
+    replacement = make_data([
+        (4, 9, 9, 9, 0, 100, 100, 400, 40, -1, ''),
+        (5, 9, 9, 9, 1, 100, 100, 150, 40, 92.0, 'good'),
+        (5, 9, 9, 9, 2, 260, 100, 60, 40, 88.0, 'bad'),
+        (5, 9, 9, 9, 3, 330, 100, 0, 40, 95.0, ' '),
+        (5, 9, 9, 9, 4, 340, 100, 160, 40, 85.0, 'word'),
+    ])
+    merged = ConfidenceRefiner._merge(make_page(), {(1, 1, 1): replacement})
+
+    assert merged['text'] == ['', 'good', 'bad', 'word', '', 'fine']
+    assert merged['level'] == [4, 5, 5, 5, 4, 5]
+    # 置き換えた単語は元の行の番号を引き継ぎ、単語番号を振り直す
+    assert merged['block_num'][1:4] == [1, 1, 1]
+    assert merged['line_num'][1:4] == [1, 1, 1]
+    assert merged['word_num'][1:4] == [1, 2, 3]
+    assert merged['conf'][1:4] == [92.0, 88.0, 85.0]
+    assert merged['left'][2] == 260
+    # 置き換えていない行はそのまま
+    assert merged['text'][5] == 'fine' and merged['conf'][5] == 95.0
+
+def test_merge_keeps_other_lines_when_replacement_is_empty():
+    merged = ConfidenceRefiner._merge(make_page(), {(1, 1, 1): make_data([])})
+    assert merged['text'] == ['', '', 'fine']
@@ -0,0 +1,46 @@
+"""
+RegionSelector のテスト
+"""
+from pdf_ocr_converter.region_selector import RegionSelector
+
+def test_exclude_regions_follow_page_size():
+    selector = RegionSelector()
+    selector.add_top_region(10)
+    selector.add_bottom_region(5)
+    assert selector.get_exclude_regions_for_page(1000, 2000) == [(0, 0, 1000, 200), (0, 1900, 1000, 2000)]
+
+def test_pixel_regions_are_scaled_to_rendered_resolution():
+    selector = RegionSelector()
+    selector.add_pixel_region(100, 200, 300, 400)
+    assert selector.get_exclude_regions_for_page(1000, 2000) == [(100, 200, 300, 400)]
+    # 300dpi で指定した座標を 150dpi で画像化したページに使う
+    assert selector.get_exclude_regions_for_page(500, 1000, 0.5) == [(50.0, 100.0, 150.0, 200.0)]
+
+def test_regions_from_config():
+    selector = RegionSelector()
+    selector.add_regions_from_config([
+        {'type': 'top', 'height_percentage': 20},
+        {'type': 'pixel', 'coordinates': [1, 2, 3, 4]},
+    ])
+    assert selector.get_exclude_regions_for_page(100, 100) == [(0, 0, 100, 20), (1, 2, 3, 4)]
+
+def test_tiled_when_include_regions_or_layout_blocks():
+    selector = RegionSelector()
+    selector.add_top_region()
+    assert not selector.tiled
+    selector.add_include_region(0, 0, 10, 10)
+    assert selector.tiled
+
+    selector = RegionSelector()
+    selector.add_regions_from_config([{'type': 'layout'}])
+    assert selector.tiled
+    assert selector.include_regions == []
+
+def test_include_regions_are_scaled_and_clipped():
+    selector = RegionSelector()
+    selector.add_include_region(200, 100, 0, 300)
+    selector.add_include_region(900, 900, 1200, 1200)
+    selector.add_include_region(1100, 0, 1200, 100)
+    regions = selector.get_include_regions_for_page(500, 500, 0.5)
+    # 座標の順序を揃え、ページ外にはみ出した部分を切り詰め、ページ外の領域は含まない
+    assert regions == [(0, 50.0, 100.0, 150.0), (450.0, 450.0, 500, 500)]
@@ -0,0 +1,51 @@
+"""
+ResourceBudget によるワーカー数・スレッド数の計画とページの投入の判定のテスト
+"""
+import os
+from pdf_ocr_converter.resources import ResourceBudget, set_thread_limit
+
+MB = 1024 * 1024
+
+def test_plan_splits_cpus_between_workers_and_threads():
+    budget = ResourceBudget(cpus=8)
+    assert budget.plan(4) == (4, 2)
+    assert budget.plan(4, tile_workers=2) == (4, 1)
+    # CPU数より多いワーカーは起動しない
+    assert budget.plan(16) == (8, 1)
+    assert ResourceBudget(cpus=2).plan(4, tile_workers=4) == (2, 1)
+
+def test_plan_limits_workers_by_memory():
+    budget = ResourceBudget(memory_mb=1000, cpus=8)
+    # 1ワーカーあたり 200MB + 300MB
+    assert budget.plan(8, page_memory=300 * MB) == (2, 4)
+    # 1ワーカー分も収まらない場合も1ワーカーは起動する
+    assert budget.plan(8, page_memory=2000 * MB) == (1, 8)
+
+def test_page_memory_scales_with_resolution():
+    budget = ResourceBudget(cpus=1)
+    a4 = budget.page_memory(595, 842, 300)
+    assert a4 == int(595 * 300 / 72.0 * 842 * 300 / 72.0 * ResourceBudget.BYTES_PER_PIXEL)
+    assert abs(budget.page_memory(595, 842, 600) - 4 * a4) < 4
+
+def test_page_budget_excludes_worker_base_memory():
+    assert ResourceBudget(cpus=1).page_budget(4) is None
+    assert ResourceBudget(memory_mb=1000, cpus=1).page_budget(2) == 600 * MB
+
+def test_admit_within_budget():
+    budget = ResourceBudget(memory_mb=1000, cpus=4)
+    # ページの処理に使えるのは 600MB
+    assert budget.admit(300 * MB, 300 * MB, 2)
+    assert not budget.admit(301 * MB, 300 * MB, 2)
+    # 処理中のページがなければ上限を超えるページも投入する
+    assert budget.admit(5000 * MB, 0, 2)
+    # メモリの上限がなければ常に投入する
+    assert ResourceBudget(cpus=4).admit(5000 * MB, 5000 * MB, 2)
+
+def test_set_thread_limit_keeps_smaller_limit(monkeypatch):
+    monkeypatch.delenv('OMP_THREAD_LIMIT', raising=False)
+    set_thread_limit(4)
+    assert os.environ['OMP_THREAD_LIMIT'] == '4'
+    set_thread_limit(8)
+    assert os.environ['OMP_THREAD_LIMIT'] == '4'
+    set_thread_limit(2)
+    assert os.environ['OMP_THREAD_LIMIT'] == '2'
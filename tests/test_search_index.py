@@ -0,0 +1,62 @@
+"""
+SearchIndex のテスト
+"""
+import pytest
+from pdf_ocr_converter.search_index import SearchIndex, normalize_text
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'index.db'))
+    yield index
+    index.close()
+
+def make_pdf(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'%PDF dummy')
+    return str(path)
+
+def test_normalize_text():
+    assert normalize_text('ＰＤＦ　ＯＣＲ１２３') == 'pdf ocr123'
+
+def test_long_terms_use_full_text_search(tmp_path, index):
+    first = make_pdf(tmp_path, 'first.pdf')
+    second = make_pdf(tmp_path, 'second.pdf')
+    index.update(first, [(0, '請求書の支払期限について'), (1, '見積書の有効期限')])
+    index.update(second, [(0, '支払期限は月末です')])
+
+    results = index.search('支払期限')
+    assert sorted((result['path'], result['page_num']) for result in results) == [(first, 0), (second, 0)]
+    assert all('[支払期限]' in result['snippet'] for result in results)
+
+def test_short_terms_fall_back_to_partial_match(tmp_path, index):
+    path = make_pdf(tmp_path, 'doc.pdf')
+    index.update(path, [(0, '東京都の住所'), (1, '大阪府の住所'), (2, '100%の確率')])
+
+    assert [result['page_num'] for result in index.search('大阪')] == [1]
+    # 短い語と長い語の組み合わせは両方を含むページだけ
+    assert [result['page_num'] for result in index.search('東京 の住所')] == [0]
+    # LIKE の特殊文字はそのまま検索する
+    assert [result['page_num'] for result in index.search('0%')] == [2]
+    assert index.search('   ') == []
+
+def test_update_replaces_pages(tmp_path, index):
+    path = make_pdf(tmp_path, 'doc.pdf')
+    index.update(path, [(0, '古いテキスト'), (1, '二ページ目')])
+    index.update(path, [(0, '新しいテキスト')])
+
+    assert index.search('古いテキスト') == []
+    assert [result['page_num'] for result in index.search('新しいテキスト')] == [0]
+    assert index.stats() == {'files': 1, 'pages': 1}
+
+def test_is_current_and_prune(tmp_path, index):
+    path = make_pdf(tmp_path, 'doc.pdf')
+    index.update(path, [(0, 'テキスト')])
+    assert index.is_current(path)
+
+    with open(path, 'ab') as f:
+        f.write(b' changed')
+    assert not index.is_current(path)
+
+    (tmp_path / 'doc.pdf').unlink()
+    assert index.prune() == 1
+    assert index.stats() == {'files': 0, 'pages': 0}
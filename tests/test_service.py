@@ -0,0 +1,55 @@
+"""
+OCRサービスのテスト
+"""
+from urllib.parse import parse_qs
+import fitz
+import pytest
+from pdf_ocr_converter.service import CancelFlag, Job, OCRService, parse_job_params, parse_wait
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'inf', '-1'])
+def test_parse_wait_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_wait(parse_qs(f'wait={value}'), 'wait', 300)
+
+def test_parse_wait_clamps_to_limit():
+    assert parse_wait(parse_qs('wait=5'), 'wait', 300) == 5.0
+    assert parse_wait(parse_qs('wait=999'), 'wait', 300) == 300
+    assert parse_wait({}, 'wait', 300) == 0.0
+
+def test_parse_job_params():
+    params = parse_job_params(parse_qs('orientation=vertical&exclude_top=1&exclude_region=0,0,10,10'))
+    assert params['orientation'] == 'vertical'
+    assert params['exclude_top'] is True
+    assert params['exclude_regions'] == [[0, 0, 10, 10]]
+    with pytest.raises(ValueError):
+        parse_job_params(parse_qs('orientation=diagonal'))
+    with pytest.raises(ValueError):
+        parse_job_params(parse_qs('exclude_region=0,0,10'))
+
+def test_cancel_flag_is_shared_through_file(tmp_path):
+    flag = CancelFlag(str(tmp_path / 'cancel'))
+    assert not flag.is_set()
+    CancelFlag(flag.path).set()
+    assert flag.is_set()
+
+    # ジョブのディレクトリが削除済みの場合は何もしない
+    CancelFlag(str(tmp_path / 'missing' / 'cancel')).set()
+
+def test_jobs_run_in_worker_processes(tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), 'text')
+    data = doc.tobytes()
+
+    service = OCRService(workers=2, work_dir=str(tmp_path))
+    service.start()
+    try:
+        jobs = [service.submit(data, {'existing_text': 'skip'}) for _ in range(3)]
+        for job in jobs:
+            assert job.finished_event.wait(60)
+            assert job.status == Job.DONE, job.error
+            assert job.summary == {'pages': 1, 'ocr': 0, 'skipped': 1, 'blank': 0}
+            with fitz.open(job.output_pdf) as output:
+                assert 'text' in output[0].get_text()
+    finally:
+        service.stop()
+    assert not any(thread.is_alive() for thread in service._threads)
@@ -0,0 +1,67 @@
+"""
+テキストレイヤーの追加と保存のテスト
+"""
+import os
+import shutil
+import fitz
+from pdf_ocr_converter.benchmark import make_synthetic_pdf
+from pdf_ocr_converter.journal import ChunkCheckpoint
+from pdf_ocr_converter.pdf_processor import PDFProcessor
+
+# テキストレイヤーの追加で増えてよいサイズ（バイト、ページ数によらない上限）
+MAX_GROWTH = 64 * 1024
+# 埋め込んだフォントのストリームの上限（バイト、圧縮後）
+MAX_FONT_STREAM = 32 * 1024
+
+def make_results(page_count, dpi=100):
+    """全ページに同じ単語を置いたOCR結果"""
+    ocr_data = {
+        'level': [5], 'page_num': [1], 'block_num': [1], 'par_num': [1], 'line_num': [1], 'word_num': [1],
+        'left': [100], 'top': [100], 'width': [400], 'height': [40], 'conf': [95.0], 'text': ['検索できる文字'],
+    }
+    return [{'page_num': page_num, 'ocr_data': ocr_data, 'orientation': 'horizontal', 'dpi': dpi}
+            for page_num in range(page_count)]
+
+def font_streams(path):
+    """埋め込まれたフォントファイルのストリームの (xref, 保存されたバイト数) のリスト"""
+    with fitz.open(path) as doc:
+        streams = []
+        for xref in range(1, doc.xref_length()):
+            for key in ('FontFile', 'FontFile2', 'FontFile3'):
+                kind, value = doc.xref_get_key(xref, key)
+                if kind == 'xref':
+                    font_xref = int(value.split()[0])
+                    streams.append((font_xref, len(doc.xref_stream_raw(font_xref))))
+        return streams
+
+def check_output(input_pdf, output_pdf, page_count):
+    with fitz.open(output_pdf) as doc:
+        assert '検索できる文字' in doc[page_count - 1].get_text()
+    streams = font_streams(output_pdf)
+    assert streams
+    assert all(size < MAX_FONT_STREAM for _, size in streams)
+    assert os.path.getsize(output_pdf) - os.path.getsize(input_pdf) < MAX_GROWTH
+
+def test_new_file_keeps_subset_font_small(tmp_path):
+    input_pdf = str(tmp_path / 'in.pdf')
+    make_synthetic_pdf(input_pdf, 2, scan_dpi=100)
+    output_pdf = str(tmp_path / 'out.pdf')
+    PDFProcessor(input_pdf, output_pdf).apply_results(make_results(2))
+    check_output(input_pdf, output_pdf, 2)
+
+def test_in_place_save_keeps_subset_font_small(tmp_path):
+    original = str(tmp_path / 'original.pdf')
+    make_synthetic_pdf(original, 2, scan_dpi=100)
+    path = str(tmp_path / 'in_place.pdf')
+    shutil.copyfile(original, path)
+    PDFProcessor(path).apply_results(make_results(2))
+    check_output(original, path, 2)
+
+def test_chunked_save_keeps_subset_font_small(tmp_path):
+    input_pdf = str(tmp_path / 'in.pdf')
+    make_synthetic_pdf(input_pdf, 4, scan_dpi=100)
+    output_pdf = str(tmp_path / 'out.pdf')
+    checkpoint = ChunkCheckpoint(input_pdf, output_pdf, 2)
+    checkpoint.start()
+    PDFProcessor(input_pdf, output_pdf).apply_results(make_results(4), checkpoint)
+    check_output(input_pdf, output_pdf, 4)